@@ -52,13 +52,14 @@ from app.schemas import (
     FavoriteGroupUpdateRequest,
 )
 from app.core.config import settings
+from app.core.executors import storage_executor
 from app.core.security import mask_auth_code
 
 TOOL_DIR = Path(__file__).resolve().parents[1] / "tool"
 if str(TOOL_DIR) not in sys.path:
     sys.path.append(str(TOOL_DIR))
 
-from app.tool.TenCentCloudTool import TenCentCloudTool
+from app.tool.StorageTool import storage
 from app.tool.AiHubMixTool import AiHubMixTool
 
 router = APIRouter()
@@ -71,11 +72,6 @@ COMMENTS_DEFAULT_PAGE_SIZE = 10
 COMMENTS_MAX_PAGE_SIZE = 50
 MAX_COMMENT_LENGTH = 800
 
-COVER_CDN_BASE_URL = settings.COS_CDN_BASE_URL.rstrip("/")
-COS_BUCKET = settings.COS_BUCKET
-COS_REGION = settings.COS_REGION
-COS_APP_ID = settings.TENCENT_CLOUD_APP_ID
-
 MODEL_TYPE_CHOICES = {"chat", "image", "video"}
 
 ASSISTANT_MODEL_SEED = [
@@ -955,7 +951,7 @@ def build_cover_url(value: Optional[str]) -> Optional[str]:
         return None
     if is_absolute_url(trimmed):
         return trimmed
-    return f"{COVER_CDN_BASE_URL}/{trimmed.lstrip('/')}"
+    return storage.url_for(trimmed.lstrip("/"))
 
 
 def resolve_cover_storage_path(value: Optional[str]) -> Optional[str]:
@@ -1116,10 +1112,9 @@ def generate_cover_object_key(owner_code: str, filename: Optional[str]) -> str:
     return f"{sanitized_owner}/assistant/cover/{uuid4().hex}.{extension}"
 
 
-def upload_cover_to_cos(
+def upload_cover_to_storage(
     file_bytes: bytes,
     object_key: str,
-    original_filename: str,
     content_type: Optional[str],
 ) -> None:
     if not file_bytes:
@@ -1128,16 +1123,10 @@ def upload_cover_to_cos(
             detail="文件内容为空",
         )
 
-    client = TenCentCloudTool().init(COS_APP_ID).buildClient(COS_REGION)
-    payload = {
-        "name": original_filename,
-        "type": content_type or "application/octet-stream",
-        "body": file_bytes,
-    }
-    response = client.upload_file(
-        bucket=COS_BUCKET,
-        file=payload,
-        fileName=object_key,
+    response = storage.put_bytes(
+        object_key,
+        file_bytes,
+        content_type=content_type or "application/octet-stream",
     )
     if not response.get("success"):
         raise HTTPException(
@@ -2780,7 +2769,7 @@ def toggle_assistant_comment_like(
 
 
 @router.post("/definition/optimize", response_model=AssistantDefinitionOptimizeResponse)
-def optimize_assistant_definition(
+async def optimize_assistant_definition(
     payload: AssistantDefinitionOptimizeRequest,
     db: Session = Depends(get_db),
 ) -> AssistantDefinitionOptimizeResponse:
@@ -2819,7 +2808,7 @@ def optimize_assistant_definition(
 
     try:
         ai_tool = AiHubMixTool().init("int_serv").init_client(type="openai")
-        response = ai_tool.chat(
+        response = await ai_tool.achat(
             model=model_name,
             system_user_role_prompt=system_agent.system_prompt,
             user_prompt=definition,
@@ -2870,7 +2859,7 @@ async def upload_assistant_cover(
 
     contents = await file.read()
     object_key = generate_cover_object_key(owner.code, file.filename)
-    upload_cover_to_cos(contents, object_key, file.filename or object_key, file.content_type)
+    await storage_executor.run(upload_cover_to_storage, contents, object_key, file.content_type)
 
     return AssistantCoverUploadResponse(
         file_name=object_key,
@@ -1,20 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import AuthCode, GenerationRecord
+from app.database import SessionLocal, get_db
+from app.models import AuthCode, GenerationBatch, GenerationBatchItem, GenerationJob, GenerationRecord
 from app.core.credits_manager import (
     get_total_available_credits,
     get_team_credits,
-    deduct_credits,
+    reserve_credits,
+    commit_credits,
+    release_credits,
+    reservation_keeper,
     resolve_model_credit_cost,
 )
-from app.tool.TenCentCloudTool import TenCentCloudTool
+from app.tool.StorageTool import storage
 from app.tool.AiHubMixTool import AiHubMixTool, ai_models_config
 from app.core.config import settings
+from app.core.derivatives import derivative_pipeline
+from app.core.generation_summary import record_generation_summaries
+from app.core.executors import storage_executor, upstream_executor
+from app.core.idempotency import idempotency_store
+from app.core.upload_dedup import (
+    UploadTooLargeError,
+    find_stored_object,
+    hash_fileobj,
+    remember_stored_object,
+)
+from app.core.generation_batches import (
+    generation_batch_runner,
+    BATCH_STATUS_DONE,
+    BATCH_STATUS_FAILED,
+    BATCH_STATUS_QUEUED,
+)
+from app.core.generation_jobs import (
+    generation_job_queue,
+    JOB_STATUS_QUEUED,
+    JOB_STATUS_FAILED,
+)
 import os
 import uuid
 import json
-from typing import List, Optional, Literal
+from typing import AsyncIterator, Callable, List, Optional, Literal, Tuple
 from pydantic import BaseModel, Field
 
 from datetime import datetime
@@ -51,15 +76,13 @@ def build_storage_key(auth_code: str, category: str, filename: str) -> str:
 
 
 def build_cos_url_from_key(key: str) -> str:
-    base = settings.COS_CDN_BASE_URL.rstrip("/")
-    normalized = key.lstrip("/")
-    return f"{base}/{normalized}"
+    return storage.url_for(key.lstrip("/"))
 
 
 def extract_storage_key_from_location(location: str) -> str:
-    marker = "/AIImageProcessor/"
-    if marker in location:
-        return location.split(marker, 1)[1]
+    key = storage.key_for_url(location)
+    if key is not None:
+        return key
     return location.lstrip("/")
 
 
@@ -109,56 +132,202 @@ class GenerateResponse(BaseModel):
     success: bool
     message: str
     output_images: Optional[List[str]] = None
+    # 输出图的访问地址：延迟上传未完成时为本地缓存地址
+    output_urls: Optional[List[str]] = None
     credits_used: Optional[int] = None
     processing_time: Optional[int] = None
 
+
+class GenerateJobResponse(BaseModel):
+    success: bool
+    message: str
+    job_id: Optional[str] = None
+    status: Optional[str] = None
+
+
+class GenerateBatchItem(BaseModel):
+    module_name: str = DEFAULT_MODULE_NAME
+    media_type: Literal["image", "video"] = "image"
+    prompt_text: str
+    output_count: int = 1
+    image_paths: Optional[List[str]] = None
+    model_name: Optional[str] = None
+    aspect_ratio: Optional[str] = None
+    image_size: Optional[str] = None
+    legacy_mode_type: Optional[str] = Field(None, alias="mode_type")
+
+    class Config:
+        allow_population_by_field_name = True
+
+
+class GenerateBatchRequest(BaseModel):
+    auth_code: str
+    items: List[GenerateBatchItem]
+
+
+class GenerateBatchResumeRequest(BaseModel):
+    auth_code: str
+
+
+class GenerateBatchResponse(BaseModel):
+    success: bool
+    message: str
+    batch_id: Optional[str] = None
+    status: Optional[str] = None
+    total_items: Optional[int] = None
+
+
+class GenerateBatchItemStatus(BaseModel):
+    index: int
+    status: Literal["pending", "running", "done", "failed"]
+    result: Optional[GenerateResponse] = None
+    error_message: Optional[str] = None
+
+
+class GenerateBatchStatusResponse(BaseModel):
+    batch_id: str
+    status: Literal["queued", "running", "done", "partial", "failed"]
+    total_items: int
+    completed_items: int
+    failed_items: int
+    credits_used: int
+    error_message: Optional[str] = None
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    items: List[GenerateBatchItemStatus] = []
+
+
+class GenerateJobStatusResponse(BaseModel):
+    job_id: str
+    status: Literal["queued", "running", "done", "failed"]
+    media_type: str
+    result: Optional[GenerateResponse] = None
+    error_message: Optional[str] = None
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+UPLOAD_READ_CHUNK_SIZE = 1024 * 1024
+
+
+def iter_upload_chunks(fileobj, max_bytes: int, chunk_size: int = UPLOAD_READ_CHUNK_SIZE):
+    """按块读取上传文件，累计大小超过 max_bytes 时中止（分块上传随之取消）"""
+    total = 0
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadTooLargeError()
+        yield chunk
+
+
+def upload_too_large_error(file: UploadFile) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"文件 {file.filename or 'unknown'} 超过 {settings.IMAGE_UPLOAD_MAX_BYTES // (1024 * 1024)}MB 上限",
+    )
+
+
+def hash_upload_file(file: UploadFile) -> Tuple[str, int]:
+    """在存储线程池中执行：计算上传文件的 SHA-256 与大小，同时检查大小上限与空文件"""
+    try:
+        sha256, size = hash_fileobj(file.file, settings.IMAGE_UPLOAD_MAX_BYTES)
+    except UploadTooLargeError:
+        raise upload_too_large_error(file)
+    if not size:
+        raise HTTPException(status_code=400, detail=f"文件 {file.filename or 'unknown'} 内容为空")
+    return sha256, size
+
+
+def upload_stream_to_storage(file: UploadFile, object_key: str) -> dict:
+    """在存储线程池中执行：将上传文件流式写入存储后端（COS 大文件自动使用分块上传）"""
+    file.file.seek(0)
+    try:
+        response = storage.put_stream(
+            object_key,
+            iter_upload_chunks(file.file, settings.IMAGE_UPLOAD_MAX_BYTES),
+            content_type=file.content_type or "application/octet-stream",
+        )
+    except UploadTooLargeError:
+        raise upload_too_large_error(file)
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail=f"图片上传失败: {exc}") from exc
+    if not response.get("success"):
+        raise HTTPException(status_code=502, detail=response.get("data") or "图片上传失败")
+    return response
+
+
+def lookup_uploaded_key(auth_code: str, sha256: str) -> Optional[str]:
+    """在存储线程池中执行：返回该授权码已上传过的相同内容的存储 Key（每次调用使用独立会话）"""
+    db = SessionLocal()
+    try:
+        stored = find_stored_object(db, auth_code, sha256)
+        return stored.storage_key if stored is not None else None
+    finally:
+        db.close()
+
+
+def register_uploaded_key(auth_code: str, sha256: str, object_key: str, size: int, content_type: Optional[str]) -> str:
+    """在存储线程池中执行：登记新上传的对象，返回最终采用的存储 Key"""
+    db = SessionLocal()
+    try:
+        return remember_stored_object(db, auth_code, sha256, object_key, size, content_type)
+    finally:
+        db.close()
+
+
 @router.post("/upload")
 async def upload_images(files: List[UploadFile] = File(...), auth_code: str = Form(...)):
-    """上传图像文件"""
+    """
+    上传图像文件：多个文件并行流式上传到存储后端，单个文件大小受 IMAGE_UPLOAD_MAX_BYTES 限制；
+    同一授权码已上传过相同内容（SHA-256）的文件直接返回其已有的存储 Key，不再重复上传
+    """
     db = next(get_db())
     user = db.query(AuthCode).filter(AuthCode.code == auth_code).first()
     if not user:
         raise HTTPException(status_code=404, detail="授权码不存在")
 
-    cos_client = TenCentCloudTool().init(settings.TENCENT_CLOUD_APP_ID).buildClient(settings.COS_REGION)
-    uploaded_files = []
-
     for file in files:
         if not file.content_type or not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail=f"不支持的文件类型: {file.content_type}")
+        # 已知大小时提前拒绝，未知大小时在上传过程中检查
+        if file.size is not None and file.size > settings.IMAGE_UPLOAD_MAX_BYTES:
+            raise upload_too_large_error(file)
 
-        contents = await file.read()
-        if not contents:
-            raise HTTPException(status_code=400, detail=f"文件 {file.filename or 'unknown'} 内容为空")
+    semaphore = asyncio.Semaphore(max(1, settings.IMAGE_UPLOAD_CONCURRENCY))
 
+    async def upload_one(file: UploadFile) -> dict:
         original_name = file.filename or f"upload_{uuid.uuid4().hex}.png"
-        extension = os.path.splitext(original_name)[1] or ".png"
-        safe_filename = f"{uuid.uuid4().hex}{extension.lower()}"
-        object_key = build_storage_key(auth_code, "gen/upload", safe_filename)
-
-        payload = {
-            "name": original_name,
-            "type": file.content_type or "application/octet-stream",
-            "body": contents,
-        }
-
-        try:
-            response = cos_client.upload_file(
-                bucket=settings.COS_BUCKET,
-                file=payload,
-                fileName=object_key,
-            )
-        except Exception as exc:
-            raise HTTPException(status_code=502, detail=f"图片上传失败: {exc}") from exc
-
-        if not response.get("success"):
-            raise HTTPException(status_code=502, detail=response.get("data") or "图片上传失败")
-
-        uploaded_files.append({
+        async with semaphore:
+            sha256, size = await storage_executor.run(hash_upload_file, file)
+            stored_key = await storage_executor.run(lookup_uploaded_key, auth_code, sha256)
+            if stored_key is not None:
+                object_key, deduplicated = stored_key, True
+            else:
+                extension = os.path.splitext(original_name)[1] or ".png"
+                safe_filename = f"{uuid.uuid4().hex}{extension.lower()}"
+                object_key = build_storage_key(auth_code, "gen/upload", safe_filename)
+                await storage_executor.run(upload_stream_to_storage, file, object_key)
+                object_key = await storage_executor.run(
+                    register_uploaded_key, auth_code, sha256, object_key, size, file.content_type
+                )
+                derivative_pipeline.submit([object_key])
+                deduplicated = False
+        return {
             "original_name": original_name,
             "storage_key": object_key,
             "url": build_cos_url_from_key(object_key),
-        })
+            "deduplicated": deduplicated,
+        }
+
+    results = await asyncio.gather(*(upload_one(file) for file in files), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    uploaded_files = list(results)
 
     return {
         "success": True,
@@ -167,37 +336,113 @@ async def upload_images(files: List[UploadFile] = File(...), auth_code: str = Fo
     }
 
 
-@router.post("/generate", response_model=GenerateResponse)
-async def generate_images(
-    request: GenerateRequest,
-    db: Session = Depends(get_db)
-):
-    """生成图像"""
-    user = db.query(AuthCode).filter(AuthCode.code == request.auth_code).first()
-    if not user:
-        return GenerateResponse(success=False, message="授权码不存在")
+def compact_params(payload: dict) -> dict:
+    sanitized: dict = {}
+    for key, value in payload.items():
+        if value is None:
+            continue
+        if isinstance(value, str):
+            trimmed = value.strip()
+            if not trimmed:
+                continue
+            sanitized[key] = trimmed
+            continue
+        if isinstance(value, (list, dict)):
+            if not value:
+                continue
+            sanitized[key] = value
+            continue
+        sanitized[key] = value
+    return sanitized
 
+
+def resolve_generation_cost(db: Session, request: GenerateRequest) -> Tuple[str, int]:
+    """返回 (模型名称, 所需积分)"""
     target_model_name = (request.model_name or settings.DEFAULT_IMAGE_MODEL_NAME).strip()
     _, unit_cost = resolve_model_credit_cost(db, target_model_name)
-    credits_needed = unit_cost * max(1, request.output_count)
+    return target_model_name, unit_cost * max(1, request.output_count)
+
+
+def check_generation_credits(
+    db: Session,
+    user: AuthCode,
+    request: GenerateRequest,
+) -> Tuple[str, int, Optional[str]]:
+    """返回 (模型名称, 所需积分, 积分不足时的提示)"""
+    target_model_name, credits_needed = resolve_generation_cost(db, request)
 
     if credits_needed > 0:
         available_credits = get_total_available_credits(user)
         team_balance = get_team_credits(user)
         personal_balance = user.credits or 0
         if available_credits < credits_needed:
-            return GenerateResponse(
-                success=False,
-                message=(
-                    f"积分不足，需要 {credits_needed} 积分，"
-                    f"团队余额 {team_balance} · 个人余额 {personal_balance}"
-                ),
+            return target_model_name, credits_needed, (
+                f"积分不足，需要 {credits_needed} 积分，"
+                f"团队余额 {team_balance} · 个人余额 {personal_balance}"
             )
+    return target_model_name, credits_needed, None
+
+
+def execute_generation(
+    db: Session,
+    request: GenerateRequest,
+    on_result: Optional[Callable[[int, str], None]] = None,
+) -> Tuple[GenerateResponse, Optional[GenerationRecord]]:
+    """同步执行完整的生成流程（积分校验、模型调用、写入生成记录），可在工作线程中运行；
+    on_result 在每张图片上传完成后以 (序号, 存储key) 回调"""
+    user = db.query(AuthCode).filter(AuthCode.code == request.auth_code).first()
+    if not user:
+        return GenerateResponse(success=False, message="授权码不存在"), None
+
+    target_model_name, credits_needed, credits_error = check_generation_credits(db, user, request)
+    if credits_error:
+        return GenerateResponse(success=False, message=credits_error), None
 
+    # 调用模型前先预留积分，并发请求不会超扣；生成失败时退回
+    try:
+        reservation = reserve_credits(db, user, credits_needed)
+    except HTTPException as exc:
+        return GenerateResponse(success=False, message=str(exc.detail)), None
+
+    settled = False
+    try:
+        # 生成期间持续延长预留的过期时间，长时间的视频生成不会被过期清理退款
+        with reservation_keeper.hold(reservation):
+            response, record = _generate_with_reservation(db, user, request, target_model_name, credits_needed, on_result)
+        if record is not None:
+            # 生成记录、每日汇总与积分结算在同一事务中提交
+            db.add(record)
+            record_generation_summaries(db, [record])
+            settled = True
+            if not commit_credits(db, reservation):
+                # 预留已被退回且余额不足以重新扣除，生成记录随事务一起回滚
+                return GenerateResponse(success=False, message="积分不足，无法完成结算"), None
+        return response, record
+    except HTTPException as exc:
+        return GenerateResponse(success=False, message=str(exc.detail)), None
+    finally:
+        if not settled:
+            release_credits(db, reservation)
+
+
+def _generate_with_reservation(
+    db: Session,
+    user: AuthCode,
+    request: GenerateRequest,
+    target_model_name: str,
+    credits_needed: int,
+    on_result: Optional[Callable[[int, str], None]] = None,
+) -> Tuple[GenerateResponse, Optional[GenerationRecord]]:
+    """调用模型并构造生成记录（未写库），失败时返回 (失败响应, None)"""
     model_config = find_aihub_model_config(target_model_name)
     platform = (model_config or {}).get("model_platform")
     client_type = "openai" if platform == "openai" else "genai"
-    ai_tool = AiHubMixTool().init("int_serv").init_client(type=client_type)
+    ai_tool = (
+        AiHubMixTool()
+        .init("int_serv")
+        .init_client(type=client_type)
+        .for_tenant(f"team:{user.team_id}" if user.team_id else f"user:{user.code}")
+    )
 
     normalized_input_keys: List[str] = []
     if request.image_paths:
@@ -225,49 +470,33 @@ async def generate_images(
     elif not model_config:
         generation_kwargs["image_size"] = request.image_size or "1K"
 
-    def compact_params(payload: dict) -> dict:
-        sanitized: dict = {}
-        for key, value in payload.items():
-            if value is None:
-                continue
-            if isinstance(value, str):
-                trimmed = value.strip()
-                if not trimmed:
-                    continue
-                sanitized[key] = trimmed
-                continue
-            if isinstance(value, (list, dict)):
-                if not value:
-                    continue
-                sanitized[key] = value
-                continue
-            sanitized[key] = value
-        return sanitized
-
     start_time = time.time()
 
     try:
-        response = await asyncio.to_thread(
-            lambda: ai_tool.image(
-                model=target_model_name,
-                user_prompt=request.prompt_text,
-                images=input_image_urls,
-                gen_number=max(1, request.output_count),
-                **generation_kwargs,
-            )
+        response = ai_tool.image(
+            model=target_model_name,
+            user_prompt=request.prompt_text,
+            images=input_image_urls,
+            gen_number=max(1, request.output_count),
+            gen_parallelism=settings.IMAGE_GEN_PARALLELISM,
+            on_result=(
+                (lambda index, location: on_result(index, extract_storage_key_from_location(location)))
+                if on_result else None
+            ),
+            **generation_kwargs,
         )
     except Exception as exc:
-        return GenerateResponse(success=False, message=f"生成失败: {exc}")
+        return GenerateResponse(success=False, message=f"生成失败: {exc}"), None
 
     if not response.get("success"):
-        return GenerateResponse(success=False, message=response.get("data") or "生成失败")
+        return GenerateResponse(success=False, message=response.get("data") or "生成失败"), None
 
     output_locations = response.get("data") or []
     if isinstance(output_locations, str):
         output_locations = [output_locations]
 
     if not isinstance(output_locations, list) or not output_locations:
-        return GenerateResponse(success=False, message="生成失败: 未返回有效图片")
+        return GenerateResponse(success=False, message="生成失败: 未返回有效图片"), None
 
     output_storage_keys = [
         extract_storage_key_from_location(item)
@@ -276,12 +505,10 @@ async def generate_images(
     ]
 
     if not output_storage_keys:
-        return GenerateResponse(success=False, message="生成失败: 未返回有效图片")
+        return GenerateResponse(success=False, message="生成失败: 未返回有效图片"), None
 
     processing_time = int(time.time() - start_time)
-
-    if credits_needed > 0:
-        deduct_credits(db, user, credits_needed)
+    derivative_pipeline.submit(output_storage_keys)
 
     module_name = request.module_name or map_legacy_mode_to_module(request.legacy_mode_type)
     media_type = request.media_type or "image"
@@ -309,14 +536,384 @@ async def generate_images(
         processing_time=processing_time,
     )
 
-
-    db.add(record)
-    db.commit()
-
     return GenerateResponse(
         success=True,
         message="图像生成成功",
         output_images=output_storage_keys,
+        output_urls=[build_cos_url_from_key(key) for key in output_storage_keys],
         credits_used=credits_needed,
         processing_time=processing_time,
+    ), record
+
+
+def run_generation_job(db: Session, job: GenerationJob) -> Tuple[dict, Optional[int]]:
+    """任务队列处理函数：按提交时的请求参数执行生成"""
+    request = GenerateRequest(**(job.request_payload or {}))
+    response, record = execute_generation(db, request)
+    return response.dict(), (record.id if record else None)
+
+
+generation_job_queue.register_handler(run_generation_job)
+
+
+def run_batch_item(db: Session, user: AuthCode, payload: dict) -> Tuple[dict, Optional[GenerationRecord]]:
+    """批量生成的单项处理函数：积分已由批次统一预留，只调用模型并构造生成记录"""
+    request = GenerateRequest(**payload)
+    target_model_name, credits_needed = resolve_generation_cost(db, request)
+    response, record = _generate_with_reservation(db, user, request, target_model_name, credits_needed)
+    return response.dict(), record
+
+
+def resolve_batch_item_cost(db: Session, payload: dict) -> int:
+    return resolve_generation_cost(db, GenerateRequest(**payload))[1]
+
+
+generation_batch_runner.register_handlers(run_batch_item, resolve_batch_item_cost)
+
+
+def format_datetime(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+@router.post("/generate", response_model=GenerateResponse)
+async def generate_images(
+    request: GenerateRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    """生成图像；携带 Idempotency-Key 时重复提交只执行并计费一次"""
+    def run() -> dict:
+        response, _ = run_generation_in_session(request)
+        return response.dict()
+
+    result = await idempotency_store.run(
+        request.auth_code,
+        "images.generate",
+        idempotency_key,
+        request.dict(),
+        run,
+        upstream_executor,
+    )
+    return GenerateResponse(**result)
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def run_generation_in_session(
+    request: GenerateRequest,
+    on_result: Optional[Callable[[int, str], None]] = None,
+) -> Tuple[GenerateResponse, Optional[GenerationRecord]]:
+    """在执行线程中使用独立会话生成：客户端断开后生成仍在后台完成，积分结算不受响应流关闭影响"""
+    db = SessionLocal()
+    try:
+        return execute_generation(db, request, on_result)
+    finally:
+        db.close()
+
+
+async def stream_generation_events(request: GenerateRequest) -> AsyncIterator[str]:
+    """执行生成并按完成顺序推送事件：start → image/progress（每张）→ credits → done"""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    total = max(1, request.output_count)
+    start_time = time.time()
+    completed = 0
+
+    def on_result(index: int, storage_key: str) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, (index, storage_key, time.time()))
+
+    task = asyncio.ensure_future(upstream_executor.run(run_generation_in_session, request, on_result))
+    yield format_sse("start", {"output_count": total, "model_name": request.model_name})
+
+    while not (task.done() and queue.empty()):
+        getter = asyncio.ensure_future(queue.get())
+        finished, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+        if getter not in finished:
+            getter.cancel()
+            continue
+        index, storage_key, finished_at = getter.result()
+        completed += 1
+        yield format_sse("image", {
+            "index": index,
+            "storage_key": storage_key,
+            "url": build_cos_url_from_key(storage_key),
+            "elapsed_ms": int((finished_at - start_time) * 1000),
+        })
+        yield format_sse("progress", {"completed": completed, "total": total})
+
+    try:
+        response, _ = task.result()
+    except Exception as exc:
+        response = GenerateResponse(success=False, message=f"生成失败: {exc}")
+
+    if response.success:
+        # 响应流发送期间请求依赖已结束，使用独立的会话
+        db = SessionLocal()
+        try:
+            user = db.query(AuthCode).filter(AuthCode.code == request.auth_code).first()
+            credits = {
+                "credits_used": response.credits_used or 0,
+                "team_credits": get_team_credits(user) if user else 0,
+                "personal_credits": (user.credits or 0) if user else 0,
+            }
+        finally:
+            db.close()
+        yield format_sse("credits", credits)
+    yield format_sse("done" if response.success else "error", response.dict())
+
+
+@router.post("/generate/stream")
+async def generate_images_stream(request: GenerateRequest):
+    """流式生成图像（Server-Sent Events）：每张图片上传完成即推送，无需等待全部生成"""
+    return StreamingResponse(
+        stream_generation_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def create_generation_job(db: Session, request: GenerateRequest) -> GenerateJobResponse:
+    user = db.query(AuthCode).filter(AuthCode.code == request.auth_code).first()
+    if not user:
+        return GenerateJobResponse(success=False, message="授权码不存在")
+
+    _, _, credits_error = check_generation_credits(db, user, request)
+    if credits_error:
+        return GenerateJobResponse(success=False, message=credits_error)
+
+    if not generation_job_queue.has_capacity():
+        return GenerateJobResponse(success=False, message="当前生成任务较多，请稍后再试")
+
+    job = GenerationJob(
+        job_id=uuid.uuid4().hex,
+        auth_code=request.auth_code,
+        media_type=request.media_type or "image",
+        status=JOB_STATUS_QUEUED,
+        request_payload=request.dict(),
+    )
+    db.add(job)
+    db.commit()
+
+    if not generation_job_queue.enqueue(job.job_id):
+        job.status = JOB_STATUS_FAILED
+        job.error_message = "当前生成任务较多，请稍后再试"
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        return GenerateJobResponse(
+            success=False,
+            message=job.error_message,
+            job_id=job.job_id,
+            status=job.status,
+        )
+
+    return GenerateJobResponse(
+        success=True,
+        message="生成任务已提交",
+        job_id=job.job_id,
+        status=job.status,
+    )
+
+
+@router.post("/generate/jobs", response_model=GenerateJobResponse)
+async def submit_generation_job(
+    request: GenerateRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    """提交生成任务，立即返回任务ID，生成结果通过任务状态接口轮询获取；携带 Idempotency-Key 时重复提交返回同一任务"""
+    def run() -> dict:
+        db = SessionLocal()
+        try:
+            return create_generation_job(db, request).dict()
+        finally:
+            db.close()
+
+    result = await idempotency_store.run(
+        request.auth_code,
+        "images.generate_jobs",
+        idempotency_key,
+        request.dict(),
+        run,
+        upstream_executor,
+    )
+    return GenerateJobResponse(**result)
+
+
+@router.get("/jobs/{job_id}", response_model=GenerateJobStatusResponse)
+async def get_generation_job(
+    job_id: str,
+    auth_code: str,
+    db: Session = Depends(get_db)
+):
+    """查询生成任务状态：queued / running / done / failed"""
+    job = (
+        db.query(GenerationJob)
+        .filter(GenerationJob.job_id == job_id, GenerationJob.auth_code == auth_code)
+        .first()
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    return GenerateJobStatusResponse(
+        job_id=job.job_id,
+        status=job.status,
+        media_type=job.media_type,
+        result=GenerateResponse(**job.result_payload) if job.result_payload else None,
+        error_message=job.error_message,
+        created_at=format_datetime(job.created_at),
+        started_at=format_datetime(job.started_at),
+        finished_at=format_datetime(job.finished_at),
+    )
+
+
+@router.post("/generate/batches", response_model=GenerateBatchResponse)
+async def submit_generation_batch(
+    request: GenerateBatchRequest,
+    db: Session = Depends(get_db)
+):
+    """提交批量生成：整批统一预留积分，后台有界并发执行，通过批次状态接口查看每项结果"""
+    if not request.items:
+        return GenerateBatchResponse(success=False, message="批次条目不能为空")
+    if len(request.items) > settings.GENERATION_BATCH_MAX_ITEMS:
+        return GenerateBatchResponse(
+            success=False,
+            message=f"单个批次最多 {settings.GENERATION_BATCH_MAX_ITEMS} 条",
+        )
+
+    user = db.query(AuthCode).filter(AuthCode.code == request.auth_code).first()
+    if not user:
+        return GenerateBatchResponse(success=False, message="授权码不存在")
+
+    payloads = [
+        GenerateRequest(auth_code=request.auth_code, **item.dict()).dict()
+        for item in request.items
+    ]
+    credits_needed = sum(resolve_batch_item_cost(db, payload) for payload in payloads)
+    available_credits = get_total_available_credits(user)
+    if available_credits < credits_needed:
+        return GenerateBatchResponse(
+            success=False,
+            message=(
+                f"积分不足，需要 {credits_needed} 积分，"
+                f"团队余额 {get_team_credits(user)} · 个人余额 {user.credits or 0}"
+            ),
+        )
+
+    batch = GenerationBatch(
+        batch_id=uuid.uuid4().hex,
+        auth_code=request.auth_code,
+        status=BATCH_STATUS_QUEUED,
+        total_items=len(payloads),
+    )
+    batch.items = [
+        GenerationBatchItem(item_index=index, request_payload=payload)
+        for index, payload in enumerate(payloads)
+    ]
+    db.add(batch)
+    db.commit()
+
+    if not generation_batch_runner.submit(batch.batch_id):
+        batch.status = BATCH_STATUS_FAILED
+        batch.error_message = "批量生成服务未启动，请稍后续跑该批次"
+        db.commit()
+        return GenerateBatchResponse(
+            success=False,
+            message=batch.error_message,
+            batch_id=batch.batch_id,
+            status=batch.status,
+            total_items=batch.total_items,
+        )
+
+    return GenerateBatchResponse(
+        success=True,
+        message="批量生成已提交",
+        batch_id=batch.batch_id,
+        status=batch.status,
+        total_items=batch.total_items,
+    )
+
+
+def get_owned_batch(db: Session, batch_id: str, auth_code: str) -> GenerationBatch:
+    batch = (
+        db.query(GenerationBatch)
+        .filter(GenerationBatch.batch_id == batch_id, GenerationBatch.auth_code == auth_code)
+        .first()
+    )
+    if not batch:
+        raise HTTPException(status_code=404, detail="批次不存在")
+    return batch
+
+
+@router.get("/batches/{batch_id}", response_model=GenerateBatchStatusResponse)
+async def get_generation_batch(
+    batch_id: str,
+    auth_code: str,
+    db: Session = Depends(get_db)
+):
+    """查询批次状态与每项结果"""
+    batch = get_owned_batch(db, batch_id, auth_code)
+    return GenerateBatchStatusResponse(
+        batch_id=batch.batch_id,
+        status=batch.status,
+        total_items=batch.total_items,
+        completed_items=batch.completed_items,
+        failed_items=batch.failed_items,
+        credits_used=batch.credits_used,
+        error_message=batch.error_message,
+        created_at=format_datetime(batch.created_at),
+        started_at=format_datetime(batch.started_at),
+        finished_at=format_datetime(batch.finished_at),
+        items=[
+            GenerateBatchItemStatus(
+                index=item.item_index,
+                status=item.status,
+                result=GenerateResponse(**item.result_payload) if item.result_payload else None,
+                error_message=item.error_message,
+            )
+            for item in batch.items
+        ],
+    )
+
+
+@router.post("/batches/{batch_id}/resume", response_model=GenerateBatchResponse)
+async def resume_generation_batch(
+    batch_id: str,
+    request: GenerateBatchResumeRequest,
+    db: Session = Depends(get_db)
+):
+    """续跑批次中失败或未执行的条目，已成功的条目不会重复执行和计费"""
+    batch = get_owned_batch(db, batch_id, request.auth_code)
+    # 以条件更新抢占批次，并发的续跑请求只有一个成功
+    pending = generation_batch_runner.resume(db, batch)
+    if pending is None:
+        raise HTTPException(status_code=409, detail="批次正在执行中")
+    if not pending:
+        batch.status = BATCH_STATUS_DONE
+        db.commit()
+        return GenerateBatchResponse(
+            success=True,
+            message="批次已全部完成，无需续跑",
+            batch_id=batch.batch_id,
+            status=batch.status,
+            total_items=batch.total_items,
+        )
+    if not generation_batch_runner.submit(batch.batch_id):
+        # 没有执行者接手，把批次放回可续跑的结束状态，避免一直停留在 queued
+        batch.status = BATCH_STATUS_FAILED
+        batch.error_message = "批量生成服务未启动，请稍后续跑该批次"
+        batch.finished_at = datetime.utcnow()
+        db.commit()
+        return GenerateBatchResponse(
+            success=False,
+            message=batch.error_message,
+            batch_id=batch.batch_id,
+            status=batch.status,
+            total_items=batch.total_items,
+        )
+    return GenerateBatchResponse(
+        success=True,
+        message=f"已续跑 {pending} 条未完成的条目",
+        batch_id=batch.batch_id,
+        status=batch.status,
+        total_items=batch.total_items,
     )
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
+from PIL import UnidentifiedImageError
+from typing import Literal, Optional
+
+from app.core.config import settings
+from app.core.media_cache import etag_matches, media_resize_cache
+from app.tool.StorageTool import normalize_key
+
+router = APIRouter()
+
+
+def is_not_found_error(exc: Exception) -> bool:
+    if isinstance(exc, FileNotFoundError):
+        return True
+    # COS SDK 的 CosServiceError
+    get_status_code = getattr(exc, "get_status_code", None)
+    return callable(get_status_code) and get_status_code() == 404
+
+
+@router.get("/{key:path}")
+async def get_media(
+    key: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1),
+    h: Optional[int] = Query(None, ge=1),
+    fmt: Literal["webp", "jpeg", "jpg", "png"] = "webp",
+):
+    """
+    按需缩放存储中的图片：w/h 向上取整到 MEDIA_RESIZE_SIZES 中的尺寸后，等比缩放到 w x h 以内（不放大）并转换为 fmt 格式，
+    结果缓存在磁盘并带强 ETag，支持 If-None-Match 条件请求（304）
+    """
+    try:
+        w = media_resize_cache.snap_size(w)
+        h = media_resize_cache.snap_size(h)
+        key = normalize_key(key)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    try:
+        data, content_type, etag = await media_resize_cache.get(key, w, h, fmt)
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=415, detail="不是有效的图片文件")
+    except Exception as exc:
+        if is_not_found_error(exc):
+            raise HTTPException(status_code=404, detail="图片不存在")
+        raise HTTPException(status_code=502, detail=f"读取图片失败: {exc}")
+
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={settings.MEDIA_CACHE_MAX_AGE_SECONDS}",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=content_type, headers=headers)
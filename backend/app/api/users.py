@@ -3,7 +3,8 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import GenerationRecord, AuthCode
 from app.core.credits_manager import get_total_available_credits
-from typing import List, Literal
+from app.core.derivatives import find_derivatives
+from typing import Dict, List, Literal
 from pydantic import BaseModel, Field
 
 import json
@@ -23,6 +24,8 @@ class HistoryRecord(BaseModel):
     prompt_text: str
     output_count: int
     output_images: List[str]
+    # 原图Key → {"thumbnail": Key, "preview": Key}，仅包含已生成派生图的原图
+    output_derivatives: Dict[str, Dict[str, str]] = Field(default_factory=dict)
     output_videos: List[str] = Field(default_factory=list)
     credits_used: int
     processing_time: int
@@ -44,12 +47,22 @@ async def get_user_history(
     
     records = db.query(GenerationRecord).filter(
         GenerationRecord.auth_code == auth_code
-    ).order_by(GenerationRecord.created_at.desc()).limit(limit).all()
+    ).order_by(GenerationRecord.created_at.desc(), GenerationRecord.id.desc()).limit(limit).all()
     
+    output_images_by_id = {
+        record.id: json.loads(record.output_images) if record.output_images else []
+        for record in records
+    }
+    derivatives = find_derivatives(
+        db,
+        [key for keys in output_images_by_id.values() for key in keys],
+    )
+
     result = []
     for record in records:
         module_name = record.module_name or DEFAULT_MODULE_NAME
         media_type = record.media_type or DEFAULT_MEDIA_TYPE
+        output_images = output_images_by_id[record.id]
         result.append(HistoryRecord(
             id=record.id,
             module_name=module_name,
@@ -57,7 +70,8 @@ async def get_user_history(
             input_images=json.loads(record.input_images) if record.input_images else [],
             prompt_text=record.prompt_text,
             output_count=record.output_count,
-            output_images=json.loads(record.output_images) if record.output_images else [],
+            output_images=output_images,
+            output_derivatives={key: derivatives[key] for key in output_images if key in derivatives},
             output_videos=json.loads(record.output_videos) if record.output_videos else [],
             credits_used=record.credits_used,
             processing_time=record.processing_time or 0,
@@ -1,5 +1,7 @@
 import json
+import os
 from pathlib import Path
+from typing import List
 from urllib.parse import quote_plus
 
 from pydantic import Field
@@ -38,6 +40,7 @@ class Settings(BaseSettings):
     GEMINI_API_KEY: str = ""
     GEMINI_BASE_URL: str = "https://aihubmix.com/v1"
     DEFAULT_IMAGE_MODEL_NAME: str = "gemini-2.5-flash-image-preview"
+    IMAGE_GEN_PARALLELISM: int = 4  # 单次请求内多张图片的最大并发生成数
 
     # Database
     DATABASE_URL: str = Field(default_factory=load_database_url)
@@ -49,6 +52,7 @@ class Settings(BaseSettings):
 
     # File Storage
     UPLOAD_DIR: str = "./uploads"
+    UPLOAD_TEMP_DIR: str = "./uploads_tmp"  # ai-edit / process-files 的暂存上传，处理完即删除，不对外提供访问
     OUTPUT_DIR: str = "./outputs"
 
     # Media Storage
@@ -56,6 +60,83 @@ class Settings(BaseSettings):
     COS_BUCKET: str = "yh-server-1325210923"
     COS_REGION: str = "ap-guangzhou"
     TENCENT_CLOUD_APP_ID: str = "1325210923"
+    STORAGE_BACKEND: str = "cos"  # cos / local / memory
+    STORAGE_LOCAL_DIR: str = "./storage"
+    STORAGE_LOCAL_BASE_URL: str = ""  # 为空时使用 http://127.0.0.1:{PORT}/storage
+
+    # Deferred Output Upload（生成结果先写本地缓存并返回本地地址，后台上传到存储后端）
+    OUTPUT_DEFERRED_UPLOAD: bool = False
+    OUTPUT_CACHE_DIR: str = "./output_cache"
+    OUTPUT_CACHE_BASE_URL: str = ""  # 开启延迟上传时必填：浏览器可访问的 /output-cache 公网地址
+    OUTPUT_UPLOAD_RETRIES: int = 5
+    OUTPUT_UPLOAD_RETRY_BASE_SECONDS: float = 2.0  # 重试间隔按 2 的幂递增
+
+    # Image Upload
+    IMAGE_UPLOAD_MAX_BYTES: int = 20 * 1024 * 1024
+    IMAGE_UPLOAD_CONCURRENCY: int = 4  # 单次请求内并行上传的文件数
+
+    # Output Derivatives（WebP 缩略图/预览图）
+    DERIVATIVES_ENABLED: bool = True
+    DERIVATIVE_WORKERS: int = 2  # 进程池大小
+    DERIVATIVE_THUMBNAIL_EDGE: int = 256
+    DERIVATIVE_PREVIEW_EDGE: int = 1024
+    DERIVATIVE_WEBP_QUALITY: int = 80
+
+    # Storage GC（定时清理临时文件）
+    GC_ENABLED: bool = False
+    GC_INTERVAL_MINUTES: int = 60
+    GC_DELETE_BATCH_SIZE: int = 500  # 存储后端单次批量删除的对象数
+    GC_UPLOAD_TEMP_MAX_AGE_HOURS: float = 24  # UPLOAD_TEMP_DIR 中遗留的暂存上传文件（UPLOAD_DIR 不清理）
+    GC_OUTPUT_CACHE_MAX_AGE_HOURS: float = 24  # 已完成延迟上传的本地输出缓存
+    GC_STORAGE_TEMP_PREFIXES: List[str] = ["temp/"]
+    GC_STORAGE_TEMP_MAX_AGE_HOURS: float = 24
+
+    # On-the-fly Media Resize（/api/media/{key}?w=&h=&fmt=）
+    MEDIA_CACHE_DIR: str = "./media_cache"
+    MEDIA_CACHE_MAX_MB: int = 1024
+    MEDIA_RESIZE_SIZES: List[int] = [64, 128, 256, 512, 768, 1024, 1536, 2048, 4096]  # 请求的宽高向上取整到这些尺寸
+    MEDIA_RESIZE_QUALITY: int = 80
+    MEDIA_CACHE_MAX_AGE_SECONDS: int = 7 * 24 * 3600
+
+    # Reference Image Fetching
+    IMAGE_FETCH_TIMEOUT: int = 30
+    IMAGE_FETCH_MAX_WORKERS: int = 8
+    IMAGE_FETCH_MEMORY_CACHE_MB: int = 128
+    IMAGE_FETCH_DISK_CACHE_DIR: str = ""  # 为空时不启用磁盘缓存
+    IMAGE_FETCH_DISK_CACHE_MB: int = 1024
+
+    # Upstream Model Limits（可在 ai_models_config 中按模型配置 max_in_flight / rpm 覆盖）
+    MODEL_LIMIT_DEFAULT_MAX_IN_FLIGHT: int = 0  # 0 表示不限制；需要限流的模型在 model_definitions 或 ai_models_config 中配置 max_in_flight
+    MODEL_LIMIT_DEFAULT_RPM: int = 0  # 0 表示不限制；需要限速的模型在 model_definitions 或 ai_models_config 中配置 rpm
+    MODEL_LIMIT_WAIT_SECONDS: int = 120  # 排队超过该时间返回失败
+    MODEL_LIMIT_REFRESH_SECONDS: int = 60  # 重新读取 model_definitions 中 max_in_flight / rpm 的间隔
+
+    # Credits
+    CREDIT_RESERVATION_TTL_SECONDS: int = 1800  # 预留超时未结算则自动退回
+
+    # Idempotency
+    IDEMPOTENCY_TTL_SECONDS: int = 86400  # 已完成请求的结果保留时长
+    IDEMPOTENCY_WAIT_SECONDS: int = 600  # 重复请求等待首个请求完成的最长时间
+    IDEMPOTENCY_LEASE_SECONDS: int = 60  # 执行中记录的租约，执行期间自动续约
+
+    # Generation Jobs
+    GENERATION_JOB_WORKERS: int = 4
+    GENERATION_JOB_MAX_PENDING: int = 200
+    GENERATION_JOB_STALE_SECONDS: int = 300  # running 任务超过该时长没有心跳即视为中断
+
+    # Generation Batches
+    GENERATION_BATCH_MAX_ITEMS: int = 500
+    GENERATION_BATCH_RUNNERS: int = 2  # 同时执行的批次数
+    GENERATION_BATCH_CONCURRENCY: int = 4  # 单个批次内并发执行的条目数
+    GENERATION_BATCH_FLUSH_SIZE: int = 20  # 每完成多少条批量写入一次生成记录
+    GENERATION_BATCH_RESERVATION_TTL_SECONDS: int = 21600
+    GENERATION_BATCH_STALE_SECONDS: int = 300  # running 批次超过该时长没有心跳即视为中断
+
+    # Executors（阻塞调用按用途分池执行）
+    EXECUTOR_UPSTREAM_AI_WORKERS: int = 32
+    EXECUTOR_STORAGE_IO_WORKERS: int = 16
+    EXECUTOR_CPU_IMAGE_WORKERS: int = max(2, os.cpu_count() or 2)
+    EXECUTOR_IMAGE_GEN_WORKERS: int = 16
 
     # Server
     HOST: str = "0.0.0.0"
@@ -1,8 +1,25 @@
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
 from fastapi import HTTPException, status
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import AuthCode, CreatorTeam, CreditReservation, ModelDefinition
+
+RESERVATION_STATUS_RESERVED = "reserved"
+RESERVATION_STATUS_COMMITTED = "committed"
+RESERVATION_STATUS_RELEASED = "released"
 
-from app.models import AuthCode, ModelDefinition
+_TEAM_UPDATE_ATTEMPTS = 3
+_EXPIRY_SWEEP_INTERVAL_SECONDS = 60
+_last_expiry_sweep = 0.0
 
 
 def _normalize_balance(value: int | None) -> int:
@@ -22,46 +39,342 @@ def get_total_available_credits(auth_code: AuthCode) -> int:
     return _normalize_balance(auth_code.credits) + get_team_credits(auth_code)
 
 
-def deduct_credits(db: Session, auth_code: AuthCode, credits_needed: int) -> None:
-    """Deduct credits by consuming team credits first, then personal credits."""
+def _insufficient_credits_error(db: Session, auth_code: AuthCode, credits_needed: int) -> HTTPException:
+    db.expire(auth_code)
+    return HTTPException(
+        status_code=status.HTTP_402_PAYMENT_REQUIRED,
+        detail=(
+            f"积分不足，需要 {credits_needed} 积分，"
+            f"团队余额 {get_team_credits(auth_code)} · 个人余额 {_normalize_balance(auth_code.credits)}"
+        ),
+    )
+
+
+def _take_team_credits(db: Session, team_id: int, credits_needed: int) -> int:
+    """Take up to credits_needed from the team with a conditional UPDATE; returns the amount taken."""
+    for _ in range(_TEAM_UPDATE_ATTEMPTS):
+        balance = _normalize_balance(
+            db.execute(select(CreatorTeam.credits).where(CreatorTeam.id == team_id)).scalar()
+        )
+        take = min(balance, credits_needed)
+        if take <= 0:
+            return 0
+        result = db.execute(
+            update(CreatorTeam)
+            .where(CreatorTeam.id == team_id, CreatorTeam.credits >= take)
+            .values(credits=CreatorTeam.credits - take)
+        )
+        if result.rowcount == 1:
+            return take
+    return 0
+
+
+def reserve_credits(
+    db: Session,
+    auth_code: AuthCode,
+    credits_needed: int,
+    ttl_seconds: Optional[int] = None,
+) -> Optional[CreditReservation]:
+    """Reserve credits (team first, then personal) with conditional UPDATEs.
+
+    Balances are decremented immediately; the reservation is either committed
+    after a successful generation or released (refunded). Reservations left
+    behind by a crashed worker are refunded once they expire.
+    """
     if credits_needed <= 0:
-        return
+        return None
 
-    total_available = get_total_available_credits(auth_code)
-    if total_available < credits_needed:
-        team_balance = get_team_credits(auth_code)
-        raise HTTPException(
-            status_code=status.HTTP_402_PAYMENT_REQUIRED,
-            detail=(
-                f"积分不足，需要 {credits_needed} 积分，"
-                f"团队余额 {team_balance} · 个人余额 {_normalize_balance(auth_code.credits)}"
-            ),
+    _maybe_release_expired(db)
+
+    from_team = 0
+    if auth_code.team_id:
+        from_team = _take_team_credits(db, auth_code.team_id, credits_needed)
+
+    remaining = credits_needed - from_team
+    if remaining > 0:
+        result = db.execute(
+            update(AuthCode)
+            .where(AuthCode.id == auth_code.id, AuthCode.credits >= remaining)
+            .values(credits=AuthCode.credits - remaining)
         )
+        if result.rowcount != 1:
+            db.rollback()
+            raise _insufficient_credits_error(db, auth_code, credits_needed)
 
-    remaining = credits_needed
-    team = auth_code.team
+    ttl = ttl_seconds if ttl_seconds is not None else settings.CREDIT_RESERVATION_TTL_SECONDS
+    reservation = CreditReservation(
+        reservation_id=uuid.uuid4().hex,
+        auth_code_id=auth_code.id,
+        team_id=auth_code.team_id if from_team else None,
+        team_credits=from_team,
+        personal_credits=remaining,
+        status=RESERVATION_STATUS_RESERVED,
+        expires_at=datetime.utcnow() + timedelta(seconds=ttl),
+    )
+    db.add(reservation)
+    db.commit()
+    db.expire(auth_code)
+    return reservation
 
-    if team and team.credits:
-        from_team = min(_normalize_balance(team.credits), remaining)
-        team.credits -= from_team
-        remaining -= from_team
 
+def commit_credits(
+    db: Session,
+    reservation: Optional[CreditReservation],
+    credits_used: Optional[int] = None,
+) -> bool:
+    """Settle a reservation; pending changes in the session are committed with it.
+
+    When credits_used is given, the unused part of the reservation is refunded
+    (personal credits first, since they were taken last).
+
+    A reservation that already expired and was refunded is charged again with
+    conditional debits in the same transaction. When the balance no longer
+    covers it, everything pending in the session is rolled back and False is
+    returned, so the caller must not hand out the result.
+    """
+    if reservation is None:
+        db.commit()
+        return True
+    result = db.execute(
+        update(CreditReservation)
+        .where(
+            CreditReservation.id == reservation.id,
+            CreditReservation.status == RESERVATION_STATUS_RESERVED,
+        )
+        .values(status=RESERVATION_STATUS_COMMITTED, updated_at=datetime.utcnow())
+    )
+    committed = result.rowcount == 1
+    if committed:
+        if credits_used is not None:
+            _refund_unused(db, reservation.id, max(credits_used, 0))
+    elif not _recharge_released(db, reservation.id, credits_used):
+        db.rollback()
+        return False
+    db.commit()
+    return True
+
+
+def _recharge_released(db: Session, reservation_id: int, credits_used: Optional[int]) -> bool:
+    """Charge a reservation that was released (refunded) before it could be committed."""
+    result = db.execute(
+        update(CreditReservation)
+        .where(
+            CreditReservation.id == reservation_id,
+            CreditReservation.status == RESERVATION_STATUS_RELEASED,
+        )
+        .values(status=RESERVATION_STATUS_COMMITTED, updated_at=datetime.utcnow())
+    )
+    if result.rowcount != 1:
+        return False
+
+    auth_code_id, team_credits, personal_credits = db.execute(
+        select(
+            CreditReservation.auth_code_id,
+            CreditReservation.team_credits,
+            CreditReservation.personal_credits,
+        ).where(CreditReservation.id == reservation_id)
+    ).one()
+    reserved = team_credits + personal_credits
+    amount = reserved if credits_used is None else min(max(credits_used, 0), reserved)
+    team_id = db.execute(select(AuthCode.team_id).where(AuthCode.id == auth_code_id)).scalar()
+
+    from_team = _take_team_credits(db, team_id, amount) if team_id and amount else 0
+    remaining = amount - from_team
     if remaining > 0:
-        if _normalize_balance(auth_code.credits) < remaining:
-            raise HTTPException(
-                status_code=status.HTTP_402_PAYMENT_REQUIRED,
-                detail="个人积分不足"
-            )
-        auth_code.credits -= remaining
+        result = db.execute(
+            update(AuthCode)
+            .where(AuthCode.id == auth_code_id, AuthCode.credits >= remaining)
+            .values(credits=AuthCode.credits - remaining)
+        )
+        if result.rowcount != 1:
+            return False
 
-    db.add(auth_code)
-    if team:
-        db.add(team)
+    db.execute(
+        update(CreditReservation)
+        .where(CreditReservation.id == reservation_id)
+        .values(
+            team_id=team_id if from_team else None,
+            team_credits=from_team,
+            personal_credits=remaining,
+        )
+    )
+    return True
+
+
+def _refund_unused(db: Session, reservation_id: int, credits_used: int) -> None:
+    team_id, auth_code_id, team_credits, personal_credits = db.execute(
+        select(
+            CreditReservation.team_id,
+            CreditReservation.auth_code_id,
+            CreditReservation.team_credits,
+            CreditReservation.personal_credits,
+        ).where(CreditReservation.id == reservation_id)
+    ).one()
+    unused = max(team_credits + personal_credits - credits_used, 0)
+    personal_refund = min(unused, personal_credits)
+    team_refund = min(unused - personal_refund, team_credits)
+    if personal_refund:
+        db.execute(
+            update(AuthCode)
+            .where(AuthCode.id == auth_code_id)
+            .values(credits=AuthCode.credits + personal_refund)
+        )
+    if team_id and team_refund:
+        db.execute(
+            update(CreatorTeam)
+            .where(CreatorTeam.id == team_id)
+            .values(credits=CreatorTeam.credits + team_refund)
+        )
+    # Keep the amounts actually charged on the reservation
+    db.execute(
+        update(CreditReservation)
+        .where(CreditReservation.id == reservation_id)
+        .values(
+            team_credits=team_credits - team_refund,
+            personal_credits=personal_credits - personal_refund,
+        )
+    )
 
+
+def release_credits(db: Session, reservation: Optional[CreditReservation]) -> bool:
+    """Refund a reservation that has not been committed or released yet."""
+    if reservation is None:
+        return False
+    db.rollback()
+    released = _release_reservation(db, reservation.id)
     db.commit()
-    db.refresh(auth_code)
-    if team:
-        db.refresh(team)
+    return released
+
+
+def _release_reservation(db: Session, reservation_id: int) -> bool:
+    result = db.execute(
+        update(CreditReservation)
+        .where(
+            CreditReservation.id == reservation_id,
+            CreditReservation.status == RESERVATION_STATUS_RESERVED,
+        )
+        .values(status=RESERVATION_STATUS_RELEASED, updated_at=datetime.utcnow())
+    )
+    if result.rowcount != 1:
+        return False
+
+    team_id, auth_code_id, team_credits, personal_credits = db.execute(
+        select(
+            CreditReservation.team_id,
+            CreditReservation.auth_code_id,
+            CreditReservation.team_credits,
+            CreditReservation.personal_credits,
+        ).where(CreditReservation.id == reservation_id)
+    ).one()
+    if team_id and team_credits:
+        db.execute(
+            update(CreatorTeam)
+            .where(CreatorTeam.id == team_id)
+            .values(credits=CreatorTeam.credits + team_credits)
+        )
+    if personal_credits:
+        db.execute(
+            update(AuthCode)
+            .where(AuthCode.id == auth_code_id)
+            .values(credits=AuthCode.credits + personal_credits)
+        )
+    return True
+
+
+def release_expired_reservations(db: Session, limit: int = 200) -> int:
+    """Refund reservations whose owner never committed or released them."""
+    expired_ids = db.execute(
+        select(CreditReservation.id)
+        .where(
+            CreditReservation.status == RESERVATION_STATUS_RESERVED,
+            CreditReservation.expires_at < datetime.utcnow(),
+        )
+        .limit(limit)
+    ).scalars().all()
+    released = 0
+    for reservation_id in expired_ids:
+        if _release_reservation(db, reservation_id):
+            released += 1
+    db.commit()
+    return released
+
+
+class ReservationKeeper:
+    """Push expires_at forward for reservations whose work is still running.
+
+    Long generations (video polling plus upload) can outlive the TTL; without
+    renewal the expiry sweep would refund credits that are about to be used.
+    """
+
+    def __init__(self):
+        self._held: Dict[int, int] = {}  # reservation id -> ttl seconds
+        self._renewer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, reservation: Optional[CreditReservation], ttl_seconds: Optional[int] = None):
+        if reservation is None:
+            yield
+            return
+        ttl = ttl_seconds if ttl_seconds is not None else settings.CREDIT_RESERVATION_TTL_SECONDS
+        reservation_id = reservation.id
+        with self._lock:
+            self._held[reservation_id] = ttl
+            if self._renewer is None or not self._renewer.is_alive():
+                self._renewer = threading.Thread(target=self._renew_loop, name="credit-reservation-keeper", daemon=True)
+                self._renewer.start()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._held.pop(reservation_id, None)
+
+    def _renew_loop(self) -> None:
+        while True:
+            time.sleep(max(1, settings.CREDIT_RESERVATION_TTL_SECONDS / 3))
+            with self._lock:
+                held = dict(self._held)
+            if not held:
+                continue
+            db = SessionLocal()
+            try:
+                self.renew(db, held)
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+
+    @staticmethod
+    def renew(db: Session, held: Dict[int, int]) -> None:
+        now = datetime.utcnow()
+        for reservation_id, ttl in held.items():
+            db.execute(
+                update(CreditReservation)
+                .where(
+                    CreditReservation.id == reservation_id,
+                    CreditReservation.status == RESERVATION_STATUS_RESERVED,
+                )
+                .values(expires_at=now + timedelta(seconds=ttl))
+            )
+        db.commit()
+
+
+reservation_keeper = ReservationKeeper()
+
+
+def _maybe_release_expired(db: Session) -> None:
+    global _last_expiry_sweep
+    now = time.monotonic()
+    if now - _last_expiry_sweep < _EXPIRY_SWEEP_INTERVAL_SECONDS:
+        return
+    _last_expiry_sweep = now
+    release_expired_reservations(db)
+
+
+def deduct_credits(db: Session, auth_code: AuthCode, credits_needed: int) -> None:
+    """Deduct credits by consuming team credits first, then personal credits."""
+    reservation = reserve_credits(db, auth_code, credits_needed)
+    commit_credits(db, reservation)
 
 
 def resolve_model_credit_cost(
@@ -0,0 +1,211 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.executors import storage_executor
+from app.database import SessionLocal
+from app.models import MediaDerivative
+from app.tool.ImagePrepTool import render_webp_derivatives
+from app.tool.StorageTool import storage
+
+DERIVATIVE_STATUS_PENDING = "pending"
+DERIVATIVE_STATUS_READY = "ready"
+DERIVATIVE_STATUS_FAILED = "failed"
+
+DERIVATIVE_THUMBNAIL = "thumbnail"
+DERIVATIVE_PREVIEW = "preview"
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp")
+
+
+def derivative_key(source_key: str, name: str) -> str:
+    """派生图与原图位于同一目录：a/b/xxx.png → a/b/xxx.thumbnail.webp"""
+    stem, _ = os.path.splitext(source_key)
+    return f"{stem}.{name}.webp"
+
+
+def is_derivative_source(key: Optional[str]) -> bool:
+    if not key:
+        return False
+    lowered = key.lower()
+    if not lowered.endswith(IMAGE_EXTENSIONS):
+        return False
+    return not any(lowered.endswith(f".{name}.webp") for name in (DERIVATIVE_THUMBNAIL, DERIVATIVE_PREVIEW))
+
+
+class DerivativePipeline:
+    """
+    生成结果/上传图片的派生图流水线：从存储读取原图 → 进程池中生成 WebP 缩略图与预览图 →
+    上传到原图同目录 → 记录派生图 Key，历史记录接口据此返回小图地址。
+    读取与上传在 storage-io 线程池执行，渲染在进程池执行，两者通过完成回调衔接。
+    """
+
+    def __init__(self, workers: int, sizes: Dict[str, int], quality: int):
+        self.workers = max(1, workers)
+        self.sizes = sizes
+        self.quality = quality
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._pool is None:
+                # spawn 启动的子进程不继承父进程的线程与连接
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+    def submit(self, source_keys: Iterable[Optional[str]]) -> int:
+        """为原图排队生成派生图（已生成或处理中的跳过），返回排队数量"""
+        if self._pool is None:
+            return 0
+        keys = [key for key in dict.fromkeys(source_keys) if is_derivative_source(key)]
+        with self._lock:
+            keys = [key for key in keys if key not in self._inflight]
+            self._inflight.update(keys)
+        for key in keys:
+            self._dispatch(key, self._load)
+        return len(keys)
+
+    def _dispatch(self, source_key: str, func: Callable, *args) -> None:
+        """把下一步提交到 storage-io 线程池；线程池已关闭时放弃该原图"""
+        try:
+            storage_executor.submit(func, source_key, *args)
+        except RuntimeError:
+            self._done(source_key)
+
+    def _done(self, source_key: str) -> None:
+        with self._lock:
+            self._inflight.discard(source_key)
+
+    def _load(self, source_key: str) -> None:
+        """
+        第一步（storage-io）：登记并读取原图后交给进程池渲染。
+        各步之间通过回调衔接，storage-io 线程不会阻塞等待进程池。
+        """
+        try:
+            db = SessionLocal()
+            try:
+                claimed = self._claim(db, source_key)
+            finally:
+                db.close()
+            if not claimed:
+                self._done(source_key)
+                return
+            pool = self._pool
+            if pool is None:
+                raise RuntimeError("派生图进程池未启动")
+            data = storage.get(source_key)
+            future = pool.submit(render_webp_derivatives, data, self.sizes, self.quality)
+        except Exception as exc:
+            self._record(source_key, error=exc)
+            return
+        future.add_done_callback(lambda done: self._on_rendered(source_key, done))
+
+    def _on_rendered(self, source_key: str, future: Future) -> None:
+        """第二步完成（进程池回调线程）：上传或失败记录都转回 storage-io 执行"""
+        try:
+            rendered = future.result()
+        except Exception as exc:
+            self._dispatch(source_key, self._record_failure, exc)
+            return
+        self._dispatch(source_key, self._upload, rendered)
+
+    def _upload(self, source_key: str, rendered: Dict[str, tuple]) -> None:
+        """第三步（storage-io）：上传派生图并记录 Key"""
+        try:
+            names = list(rendered)
+            responses = storage.put_many(
+                [(derivative_key(source_key, name), rendered[name][0], "image/webp") for name in names]
+            )
+            for response in responses:
+                if not response.get("success"):
+                    raise RuntimeError(response.get("data") or "派生图上传失败")
+        except Exception as exc:
+            self._record(source_key, error=exc)
+            return
+        self._record(source_key, keys={name: derivative_key(source_key, name) for name in names})
+
+    def _record_failure(self, source_key: str, error: Exception) -> None:
+        self._record(source_key, error=error)
+
+    def _record(
+        self,
+        source_key: str,
+        keys: Optional[Dict[str, str]] = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        db = SessionLocal()
+        try:
+            record = db.query(MediaDerivative).filter(MediaDerivative.source_key == source_key).first()
+            if record is None:
+                return
+            if error is None:
+                record.thumbnail_key = keys.get(DERIVATIVE_THUMBNAIL)
+                record.preview_key = keys.get(DERIVATIVE_PREVIEW)
+                record.status = DERIVATIVE_STATUS_READY
+                record.error_message = None
+            else:
+                record.status = DERIVATIVE_STATUS_FAILED
+                record.error_message = str(error)[:500]
+            db.commit()
+        finally:
+            db.close()
+            self._done(source_key)
+
+    def _claim(self, db: Session, source_key: str) -> bool:
+        record = db.query(MediaDerivative).filter(MediaDerivative.source_key == source_key).first()
+        if record is None:
+            db.add(MediaDerivative(source_key=source_key, status=DERIVATIVE_STATUS_PENDING))
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+            record = db.query(MediaDerivative).filter(MediaDerivative.source_key == source_key).first()
+        return record is not None and record.status != DERIVATIVE_STATUS_READY
+
+
+def find_derivatives(db: Session, source_keys: Iterable[Optional[str]]) -> Dict[str, Dict[str, str]]:
+    """批量查询已生成的派生图：{原图Key: {"thumbnail": Key, "preview": Key}}"""
+    keys = list({key for key in source_keys if key})
+    if not keys:
+        return {}
+    rows = (
+        db.query(MediaDerivative)
+        .filter(
+            MediaDerivative.source_key.in_(keys),
+            MediaDerivative.status == DERIVATIVE_STATUS_READY,
+        )
+        .all()
+    )
+    return {
+        row.source_key: {
+            DERIVATIVE_THUMBNAIL: row.thumbnail_key,
+            DERIVATIVE_PREVIEW: row.preview_key,
+        }
+        for row in rows
+    }
+
+
+derivative_pipeline = DerivativePipeline(
+    workers=settings.DERIVATIVE_WORKERS,
+    sizes={
+        DERIVATIVE_THUMBNAIL: settings.DERIVATIVE_THUMBNAIL_EDGE,
+        DERIVATIVE_PREVIEW: settings.DERIVATIVE_PREVIEW_EDGE,
+    },
+    quality=settings.DERIVATIVE_WEBP_QUALITY,
+)
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+
+class NamedExecutor:
+    """
+    按用途划分的有界线程池，避免不同类型的阻塞调用互相抢占默认线程池：
+    - upstream-ai：上游 AI 接口调用
+    - storage-io：本地文件 / COS 读写
+    - cpu-image：图片编解码、缩放等计算
+    - image-gen：单次请求内多张图片的并发生成（由 upstream-ai 中的请求再分发，单独成池避免互相等待死锁）
+    记录排队深度、执行中数量与排队耗时，供 /health 查看。
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.queued = 0
+        self.active = 0
+        self.max_queued = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        executor = self._executor
+        if executor is not None:
+            return executor
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=self.name,
+                )
+            return self._executor
+
+    def submit(self, func: Callable[..., T], *args, **kwargs) -> "Future[T]":
+        executor = self._ensure_executor()
+        queued_at = time.monotonic()
+        with self._lock:
+            self.queued += 1
+            self.submitted += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        try:
+            return executor.submit(self._call, queued_at, func, args, kwargs)
+        except RuntimeError:
+            with self._lock:
+                self.queued -= 1
+            raise
+
+    def _call(self, queued_at: float, func: Callable[..., T], args, kwargs) -> T:
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.total_wait += time.monotonic() - queued_at
+        ok = False
+        self._local.inside = True
+        try:
+            result = func(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            self._local.inside = False
+            with self._lock:
+                self.active -= 1
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def in_worker(self) -> bool:
+        """当前线程是否为本线程池的工作线程；工作线程内不应再提交任务并阻塞等待，以免池满时互相等待死锁"""
+        return getattr(self._local, "inside", False)
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """在线程池中执行阻塞函数并等待结果"""
+        loop = asyncio.get_running_loop()
+        future = self.submit(func, *args, **kwargs)
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def call(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """同步代码中使用：提交到线程池并阻塞等待结果"""
+        return self.submit(func, *args, **kwargs).result()
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self.completed + self.failed + self.active
+            return {
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "active": self.active,
+                "max_queued": self.max_queued,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(self.total_wait * 1000 / started, 1) if started else 0.0,
+            }
+
+
+upstream_executor = NamedExecutor("upstream-ai", settings.EXECUTOR_UPSTREAM_AI_WORKERS)
+storage_executor = NamedExecutor("storage-io", settings.EXECUTOR_STORAGE_IO_WORKERS)
+cpu_image_executor = NamedExecutor("cpu-image", settings.EXECUTOR_CPU_IMAGE_WORKERS)
+image_gen_executor = NamedExecutor("image-gen", settings.EXECUTOR_IMAGE_GEN_WORKERS)
+
+_executors: Dict[str, NamedExecutor] = {
+    executor.name: executor
+    for executor in (upstream_executor, storage_executor, cpu_image_executor, image_gen_executor)
+}
+
+
+def executor_stats() -> dict:
+    return {name: executor.stats() for name, executor in _executors.items()}
+
+
+def shutdown_executors(wait: bool = False) -> None:
+    for executor in _executors.values():
+        executor.shutdown(wait=wait)
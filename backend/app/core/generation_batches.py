@@ -0,0 +1,403 @@
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.credits_manager import (
+    RESERVATION_STATUS_COMMITTED,
+    commit_credits,
+    reservation_keeper,
+    reserve_credits,
+)
+from app.core.executors import upstream_executor
+from app.core.generation_summary import record_generation_summaries
+from app.database import SessionLocal
+from app.models import (
+    AuthCode,
+    CreditReservation,
+    GenerationBatch,
+    GenerationBatchItem,
+    GenerationRecord,
+)
+from app.tool.LogTool import LogTool
+
+BATCH_STATUS_QUEUED = "queued"
+BATCH_STATUS_RUNNING = "running"
+BATCH_STATUS_DONE = "done"
+BATCH_STATUS_PARTIAL = "partial"
+BATCH_STATUS_FAILED = "failed"
+BATCH_FINISHED_STATUSES = (BATCH_STATUS_DONE, BATCH_STATUS_PARTIAL, BATCH_STATUS_FAILED)
+
+ITEM_STATUS_PENDING = "pending"
+ITEM_STATUS_RUNNING = "running"
+ITEM_STATUS_DONE = "done"
+ITEM_STATUS_FAILED = "failed"
+
+log = LogTool(path="app/core/generation_batches/")
+
+# 计费函数：返回单项所需积分
+CostResolver = Callable[[Session, dict], int]
+# 单项处理函数：返回 (结果载荷, 未写库的生成记录)，积分由批次统一预留
+ItemHandler = Callable[[Session, AuthCode, dict], Tuple[dict, Optional[GenerationRecord]]]
+
+
+class GenerationBatchRunner:
+    """
+    批量生成：整批预留一次积分，有界并发执行条目，生成记录分批写入，失败条目可续跑。
+    执行中的批次记录所属进程并定期刷新 heartbeat_at，超过 stale_seconds 没有心跳的 running 批次
+    （所在进程已退出）才会被巡检线程结算。
+    """
+
+    def __init__(
+        self,
+        max_runners: int,
+        item_concurrency: int,
+        flush_size: int,
+        reservation_ttl: int,
+        stale_seconds: int,
+    ):
+        self.max_runners = max(1, max_runners)
+        self.item_concurrency = max(1, item_concurrency)
+        self.flush_size = max(1, flush_size)
+        self.reservation_ttl = reservation_ttl
+        self.stale_seconds = max(60, stale_seconds)
+        self.heartbeat_seconds = self.stale_seconds / 5
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._item_handler: Optional[ItemHandler] = None
+        self._cost_resolver: Optional[CostResolver] = None
+        self._running: Set[str] = set()
+        self._lock = threading.Lock()
+        self._monitor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def register_handlers(self, item_handler: ItemHandler, cost_resolver: CostResolver) -> None:
+        self._item_handler = item_handler
+        self._cost_resolver = cost_resolver
+
+    def start(self) -> None:
+        """启动线程池与心跳巡检线程，并接管上次进程遗留的批次"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_runners,
+                    thread_name_prefix="generation-batch",
+                )
+            if self._monitor is None or not self._monitor.is_alive():
+                self._stop.clear()
+                self._monitor = threading.Thread(target=self._monitor_loop, name="generation-batch-monitor", daemon=True)
+                self._monitor.start()
+        self.recover_batches()
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._stop.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def submit(self, batch_id: str) -> bool:
+        with self._lock:
+            executor = self._executor
+        if executor is None:
+            return False
+        try:
+            executor.submit(self._run, batch_id)
+        except RuntimeError:
+            return False
+        return True
+
+    def recover_batches(self) -> None:
+        """结算失去心跳的批次，并重新提交 queued 批次"""
+        db = SessionLocal()
+        try:
+            self._settle_stale_batches(db)
+            queued_ids = [
+                row[0]
+                for row in db.query(GenerationBatch.batch_id)
+                .filter(GenerationBatch.status == BATCH_STATUS_QUEUED)
+                .order_by(GenerationBatch.id)
+                .all()
+            ]
+        finally:
+            db.close()
+        for batch_id in queued_ids:
+            self.submit(batch_id)
+
+    def _monitor_loop(self) -> None:
+        while not self._stop.wait(self.heartbeat_seconds):
+            db = SessionLocal()
+            try:
+                self._heartbeat(db)
+                self._settle_stale_batches(db)
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+
+    def _heartbeat(self, db: Session) -> None:
+        """刷新本进程执行中批次的心跳"""
+        with self._lock:
+            running = list(self._running)
+        if not running:
+            return
+        (
+            db.query(GenerationBatch)
+            .filter(
+                GenerationBatch.batch_id.in_(running),
+                GenerationBatch.owner_id == self.owner_id,
+                GenerationBatch.status == BATCH_STATUS_RUNNING,
+            )
+            .update({GenerationBatch.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+        )
+        db.commit()
+
+    def _stale_filter(self, stale_before: datetime):
+        return (
+            GenerationBatch.status == BATCH_STATUS_RUNNING,
+            or_(GenerationBatch.heartbeat_at.is_(None), GenerationBatch.heartbeat_at < stale_before),
+        )
+
+    def _settle_stale_batches(self, db: Session) -> int:
+        """
+        结算超过 stale_seconds 没有心跳的 running 批次（所在进程已退出）：已完成条目照常计费，
+        执行中的条目回到 pending 等待续跑。先以条件更新接管批次，多个进程不会重复结算同一批次。
+        """
+        stale_before = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        with self._lock:
+            running = set(self._running)
+        stale_ids = [
+            row[0]
+            for row in db.query(GenerationBatch.batch_id).filter(*self._stale_filter(stale_before)).all()
+            if row[0] not in running
+        ]
+        settled = 0
+        for batch_id in stale_ids:
+            taken = (
+                db.query(GenerationBatch)
+                .filter(GenerationBatch.batch_id == batch_id, *self._stale_filter(stale_before))
+                .update(
+                    {
+                        GenerationBatch.owner_id: self.owner_id,
+                        GenerationBatch.heartbeat_at: datetime.utcnow(),
+                    },
+                    synchronize_session=False,
+                )
+            )
+            db.commit()
+            if taken != 1:
+                continue
+            batch = db.query(GenerationBatch).filter(GenerationBatch.batch_id == batch_id).first()
+            self._settle_interrupted(db, batch)
+            settled += 1
+        return settled
+
+    def _settle_interrupted(self, db: Session, batch: GenerationBatch) -> None:
+        reservation_ids = {
+            item.credit_reservation_id
+            for item in batch.items
+            if item.credit_reservation_id
+        }
+        # 先结算积分：结算失败会回滚会话中未提交的修改
+        for reservation_id in reservation_ids:
+            reservation = db.query(CreditReservation).filter(CreditReservation.id == reservation_id).first()
+            if reservation is None or reservation.status == RESERVATION_STATUS_COMMITTED:
+                continue
+            used = sum(
+                item.credits_used
+                for item in batch.items
+                if item.status == ITEM_STATUS_DONE and item.credit_reservation_id == reservation_id
+            )
+            if not commit_credits(db, reservation, credits_used=used):
+                log.error(f"批次 {batch.batch_id} 积分结算失败：预留已退回且余额不足，已完成条目未扣费")
+        for item in batch.items:
+            if item.status == ITEM_STATUS_RUNNING:
+                item.status = ITEM_STATUS_PENDING
+        batch.status = BATCH_STATUS_PARTIAL
+        batch.error_message = "批次执行中断，可续跑未完成的条目"
+        batch.finished_at = datetime.utcnow()
+        db.commit()
+
+    def _claim(self, db: Session, batch_id: str) -> bool:
+        claimed = (
+            db.query(GenerationBatch)
+            .filter(
+                GenerationBatch.batch_id == batch_id,
+                GenerationBatch.status == BATCH_STATUS_QUEUED,
+            )
+            .update(
+                {
+                    GenerationBatch.status: BATCH_STATUS_RUNNING,
+                    GenerationBatch.owner_id: self.owner_id,
+                    GenerationBatch.heartbeat_at: datetime.utcnow(),
+                    GenerationBatch.started_at: datetime.utcnow(),
+                    GenerationBatch.finished_at: None,
+                    GenerationBatch.error_message: None,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if claimed == 1:
+            with self._lock:
+                self._running.add(batch_id)
+        return claimed == 1
+
+    def _run(self, batch_id: str) -> None:
+        db = SessionLocal()
+        try:
+            if not self._claim(db, batch_id):
+                return
+            batch = db.query(GenerationBatch).filter(GenerationBatch.batch_id == batch_id).first()
+            user = db.query(AuthCode).filter(AuthCode.code == batch.auth_code).first()
+            items = [item for item in batch.items if item.status == ITEM_STATUS_PENDING]
+            if user is None or not items:
+                self._finish(db, batch, "授权码不存在" if user is None else None)
+                return
+
+            costs = {item.id: self._cost_resolver(db, item.request_payload) for item in items}
+            try:
+                reservation = reserve_credits(db, user, sum(costs.values()), ttl_seconds=self.reservation_ttl)
+            except HTTPException as exc:
+                self._finish(db, batch, str(exc.detail))
+                return
+
+            for item in items:
+                item.status = ITEM_STATUS_RUNNING
+                item.credit_reservation_id = reservation.id if reservation else None
+            db.commit()
+
+            try:
+                # 执行期间持续延长预留的过期时间，避免被过期清理退款
+                with reservation_keeper.hold(reservation, self.reservation_ttl):
+                    used = self._run_items(db, batch, items, costs)
+            except Exception as exc:
+                # 已完成的条目照常计费，其余条目可续跑
+                log.error(f"批次 {batch_id} 执行中断，已结算已完成条目: {exc}")
+                db.rollback()
+                self._settle_interrupted(db, batch)
+                return
+
+            if not commit_credits(db, reservation, credits_used=used):
+                log.error(f"批次 {batch_id} 积分结算失败：预留已退回且余额不足，已完成条目未扣费")
+            self._finish(db, batch)
+        finally:
+            db.close()
+            with self._lock:
+                self._running.discard(batch_id)
+
+    def _run_items(self, db: Session, batch: GenerationBatch, items: List[GenerationBatchItem], costs: dict) -> int:
+        """在 upstream_executor 中有界并发执行条目（同时最多 item_concurrency 个），返回成功条目的积分合计"""
+        used = 0
+        completed: List[Tuple[GenerationBatchItem, dict, Optional[GenerationRecord]]] = []
+        pending_items = list(items)
+        running = {}
+        while pending_items or running:
+            while pending_items and len(running) < self.item_concurrency:
+                item = pending_items.pop(0)
+                running[upstream_executor.submit(self._run_item, batch.auth_code, item.request_payload)] = item
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = running.pop(future)
+                result, record = future.result()
+                if record is not None:
+                    used += costs[item.id]
+                completed.append((item, result, record))
+                if len(completed) >= self.flush_size:
+                    self._flush(db, batch, completed, costs)
+                    completed = []
+        self._flush(db, batch, completed, costs)
+        return used
+
+    def _run_item(self, auth_code: str, payload: dict) -> Tuple[dict, Optional[GenerationRecord]]:
+        db = SessionLocal()
+        try:
+            user = db.query(AuthCode).filter(AuthCode.code == auth_code).first()
+            return self._item_handler(db, user, payload)
+        except Exception as exc:
+            return {"success": False, "message": f"生成失败: {exc}"}, None
+        finally:
+            db.close()
+
+    def _flush(self, db: Session, batch: GenerationBatch, completed, costs) -> None:
+        """批量写入生成记录并更新条目状态"""
+        if not completed:
+            return
+        records = [record for _, _, record in completed if record is not None]
+        db.add_all(records)
+        record_generation_summaries(db, records)
+        for item, result, record in completed:
+            item.result_payload = result
+            if record is not None:
+                item.status = ITEM_STATUS_DONE
+                item.error_message = None
+                item.credits_used = costs[item.id]
+                item.generation_record_id = record.id
+                batch.completed_items += 1
+                batch.credits_used += costs[item.id]
+            else:
+                item.status = ITEM_STATUS_FAILED
+                item.error_message = result.get("message")
+                batch.failed_items += 1
+        db.commit()
+
+    def _finish(self, db: Session, batch: GenerationBatch, error_message: Optional[str] = None) -> None:
+        statuses = [item.status for item in batch.items]
+        if error_message:
+            batch.status = BATCH_STATUS_FAILED
+        elif all(status == ITEM_STATUS_DONE for status in statuses):
+            batch.status = BATCH_STATUS_DONE
+        else:
+            batch.status = BATCH_STATUS_PARTIAL
+        batch.failed_items = statuses.count(ITEM_STATUS_FAILED)
+        batch.error_message = error_message
+        batch.finished_at = datetime.utcnow()
+        db.commit()
+
+    def resume(self, db: Session, batch: GenerationBatch) -> Optional[int]:
+        """
+        将已结束的批次原子地切换回 queued，并把失败/未执行的条目重置为 pending，返回待执行条目数；
+        批次正在执行或已被并发的续跑请求抢先时返回 None
+        """
+        claimed = (
+            db.query(GenerationBatch)
+            .filter(
+                GenerationBatch.id == batch.id,
+                GenerationBatch.status.in_(BATCH_FINISHED_STATUSES),
+            )
+            .update(
+                {
+                    GenerationBatch.status: BATCH_STATUS_QUEUED,
+                    GenerationBatch.failed_items: 0,
+                },
+                synchronize_session=False,
+            )
+        )
+        if claimed != 1:
+            db.rollback()
+            return None
+        pending = 0
+        for item in batch.items:
+            if item.status in (ITEM_STATUS_FAILED, ITEM_STATUS_PENDING):
+                item.status = ITEM_STATUS_PENDING
+                item.error_message = None
+                pending += 1
+        db.commit()
+        return pending
+
+
+generation_batch_runner = GenerationBatchRunner(
+    max_runners=settings.GENERATION_BATCH_RUNNERS,
+    item_concurrency=settings.GENERATION_BATCH_CONCURRENCY,
+    flush_size=settings.GENERATION_BATCH_FLUSH_SIZE,
+    reservation_ttl=settings.GENERATION_BATCH_RESERVATION_TTL_SECONDS,
+    stale_seconds=settings.GENERATION_BATCH_STALE_SECONDS,
+)
@@ -0,0 +1,218 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import GenerationJob
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_DONE = "done"
+JOB_STATUS_FAILED = "failed"
+
+# 处理函数返回 (结果载荷, 生成记录ID)
+JobHandler = Callable[[Session, GenerationJob], Tuple[dict, Optional[int]]]
+
+
+class GenerationJobQueue:
+    """
+    生成任务队列：任务状态持久化在 generation_jobs 表，由有界线程池执行。
+    执行中的任务定期刷新 updated_at 作为心跳，超过 stale_seconds 没有心跳的 running 任务
+    （所在进程已退出）由巡检线程标记为失败。
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, stale_seconds: int):
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(1, max_pending)
+        self.stale_seconds = max(60, stale_seconds)
+        self.heartbeat_seconds = self.stale_seconds / 5
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._handler: Optional[JobHandler] = None
+        self._pending = 0
+        self._running: Set[str] = set()
+        self._lock = threading.Lock()
+        self._monitor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def register_handler(self, handler: JobHandler) -> None:
+        self._handler = handler
+
+    def start(self) -> None:
+        """启动线程池与心跳巡检线程，并接管上次进程遗留的任务"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="generation-job",
+                )
+            if self._monitor is None or not self._monitor.is_alive():
+                self._stop.clear()
+                self._monitor = threading.Thread(target=self._monitor_loop, name="generation-job-monitor", daemon=True)
+                self._monitor.start()
+        self.recover_jobs()
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._stop.set()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    @property
+    def pending_count(self) -> int:
+        return self._pending
+
+    def has_capacity(self) -> bool:
+        return self._pending < self.max_pending
+
+    def enqueue(self, job_id: str) -> bool:
+        """提交任务到线程池，队列已满时返回 False"""
+        with self._lock:
+            if self._executor is None or self._pending >= self.max_pending:
+                return False
+            self._pending += 1
+            executor = self._executor
+        try:
+            executor.submit(self._run, job_id)
+        except RuntimeError:
+            with self._lock:
+                self._pending -= 1
+            return False
+        return True
+
+    def recover_jobs(self) -> None:
+        """重新排队 queued 任务，并将失去心跳的 running 任务标记为失败"""
+        db = SessionLocal()
+        try:
+            self._fail_stale_jobs(db)
+
+            queued_ids = [
+                row[0]
+                for row in (
+                    db.query(GenerationJob.job_id)
+                    .filter(GenerationJob.status == JOB_STATUS_QUEUED)
+                    .order_by(GenerationJob.id)
+                    .limit(self.max_pending)
+                    .all()
+                )
+            ]
+        finally:
+            db.close()
+
+        for job_id in queued_ids:
+            if not self.enqueue(job_id):
+                break
+
+    def _monitor_loop(self) -> None:
+        while not self._stop.wait(self.heartbeat_seconds):
+            db = SessionLocal()
+            try:
+                self._heartbeat(db)
+                self._fail_stale_jobs(db)
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+
+    def _heartbeat(self, db: Session) -> None:
+        """刷新本进程执行中任务的心跳"""
+        with self._lock:
+            running = list(self._running)
+        if not running:
+            return
+        (
+            db.query(GenerationJob)
+            .filter(
+                GenerationJob.job_id.in_(running),
+                GenerationJob.status == JOB_STATUS_RUNNING,
+            )
+            .update({GenerationJob.updated_at: datetime.utcnow()}, synchronize_session=False)
+        )
+        db.commit()
+
+    def _fail_stale_jobs(self, db: Session) -> int:
+        """超过 stale_seconds 没有心跳的 running 任务视为所在进程已退出，标记为失败"""
+        stale_before = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        with self._lock:
+            running = list(self._running)
+        query = db.query(GenerationJob).filter(
+            GenerationJob.status == JOB_STATUS_RUNNING,
+            GenerationJob.updated_at < stale_before,
+        )
+        if running:
+            query = query.filter(GenerationJob.job_id.notin_(running))
+        failed = query.update(
+            {
+                GenerationJob.status: JOB_STATUS_FAILED,
+                GenerationJob.error_message: "任务执行中断，请重新提交",
+                GenerationJob.finished_at: datetime.utcnow(),
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+        return failed
+
+    def _claim(self, db: Session, job_id: str) -> bool:
+        """将任务从 queued 原子地切换为 running，避免多个进程重复执行"""
+        claimed = (
+            db.query(GenerationJob)
+            .filter(
+                GenerationJob.job_id == job_id,
+                GenerationJob.status == JOB_STATUS_QUEUED,
+            )
+            .update(
+                {
+                    GenerationJob.status: JOB_STATUS_RUNNING,
+                    GenerationJob.started_at: datetime.utcnow(),
+                    GenerationJob.updated_at: datetime.utcnow(),
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if claimed == 1:
+            with self._lock:
+                self._running.add(job_id)
+        return claimed == 1
+
+    def _run(self, job_id: str) -> None:
+        db = SessionLocal()
+        try:
+            if not self._claim(db, job_id):
+                return
+            job = db.query(GenerationJob).filter(GenerationJob.job_id == job_id).first()
+            if job is None:
+                return
+
+            record_id = None
+            try:
+                if self._handler is None:
+                    raise RuntimeError("未注册任务处理函数")
+                result, record_id = self._handler(db, job)
+            except Exception as exc:
+                db.rollback()
+                result = {"success": False, "message": f"生成失败: {exc}"}
+
+            succeeded = bool(result.get("success"))
+            job.status = JOB_STATUS_DONE if succeeded else JOB_STATUS_FAILED
+            job.result_payload = result
+            job.error_message = None if succeeded else result.get("message")
+            job.generation_record_id = record_id
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+            with self._lock:
+                self._pending -= 1
+                self._running.discard(job_id)
+
+
+generation_job_queue = GenerationJobQueue(
+    max_workers=settings.GENERATION_JOB_WORKERS,
+    max_pending=settings.GENERATION_JOB_MAX_PENDING,
+    stale_seconds=settings.GENERATION_JOB_STALE_SECONDS,
+)
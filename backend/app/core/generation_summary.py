@@ -0,0 +1,139 @@
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Date, case, func, insert, type_coerce
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import GenerationDailySummary, GenerationRecord
+
+SUMMARY_COUNTERS = ("record_count", "output_count", "credits_used", "image_count", "video_count")
+
+
+def _day_column():
+    # 与生成记录的 created_at 取同一个数据库日期，SQLite 下 date() 返回字符串，按 Date 解析
+    return type_coerce(func.date(GenerationRecord.created_at), Date)
+
+
+def _aggregate_columns():
+    return (
+        func.count(GenerationRecord.id),
+        func.coalesce(func.sum(GenerationRecord.output_count), 0),
+        func.coalesce(func.sum(GenerationRecord.credits_used), 0),
+        func.coalesce(func.sum(case((GenerationRecord.media_type == "video", 0), else_=1)), 0),
+        func.coalesce(func.sum(case((GenerationRecord.media_type == "video", 1), else_=0)), 0),
+    )
+
+
+def record_generation_summaries(db: Session, records: Iterable[GenerationRecord]) -> None:
+    """
+    把新插入的生成记录累加到 (授权码, 日期) 汇总表，需在写入记录的同一事务中调用（由调用方提交），
+    记录与汇总要么一起提交、要么一起回滚
+    """
+    records = [record for record in records if record is not None]
+    if not records:
+        return
+    db.flush()
+    day = _day_column()
+    rows = (
+        db.query(GenerationRecord.auth_code, day, *_aggregate_columns())
+        .filter(GenerationRecord.id.in_([record.id for record in records]))
+        .group_by(GenerationRecord.auth_code, day)
+        .all()
+    )
+    for auth_code, record_day, *counters in rows:
+        if record_day is None:
+            continue
+        _increment(db, auth_code, record_day, dict(zip(SUMMARY_COUNTERS, counters)))
+
+
+def _increment(db: Session, auth_code: str, day: date, deltas: Dict[str, int]) -> None:
+    """原子累加计数；当天第一条记录时插入汇总行，并发插入冲突时退回累加"""
+    if _update_counters(db, auth_code, day, deltas):
+        return
+    try:
+        with db.begin_nested():
+            db.add(GenerationDailySummary(auth_code=auth_code, day=day, **deltas))
+    except IntegrityError:
+        _update_counters(db, auth_code, day, deltas)
+
+
+def _update_counters(db: Session, auth_code: str, day: date, deltas: Dict[str, int]) -> bool:
+    values = {
+        getattr(GenerationDailySummary, name): getattr(GenerationDailySummary, name) + int(value or 0)
+        for name, value in deltas.items()
+    }
+    values[GenerationDailySummary.updated_at] = datetime.utcnow()
+    updated = (
+        db.query(GenerationDailySummary)
+        .filter(GenerationDailySummary.auth_code == auth_code, GenerationDailySummary.day == day)
+        .update(values, synchronize_session=False)
+    )
+    return updated > 0
+
+
+def rebuild_generation_summaries(db: Session, auth_code: Optional[str] = None) -> int:
+    """从生成记录全量重建汇总（可限定授权码），返回重建的汇总行数"""
+    summaries = db.query(GenerationDailySummary)
+    if auth_code:
+        summaries = summaries.filter(GenerationDailySummary.auth_code == auth_code)
+    summaries.delete(synchronize_session=False)
+
+    day = _day_column()
+    source = db.query(GenerationRecord.auth_code, day, *_aggregate_columns())
+    if auth_code:
+        source = source.filter(GenerationRecord.auth_code == auth_code)
+    source = source.filter(GenerationRecord.created_at.isnot(None)).group_by(GenerationRecord.auth_code, day)
+    result = db.execute(
+        insert(GenerationDailySummary).from_select(
+            ["auth_code", "day", *SUMMARY_COUNTERS],
+            source.statement,
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def backfill_generation_summaries(db: Session) -> int:
+    """汇总表为空而已有生成记录时（首次上线）回填一次，多进程同时回填时以先提交的为准"""
+    if db.query(GenerationDailySummary.id).first() is not None:
+        return 0
+    if db.query(GenerationRecord.id).first() is None:
+        return 0
+    try:
+        return rebuild_generation_summaries(db)
+    except IntegrityError:
+        db.rollback()
+        return 0
+
+
+def list_available_dates(db: Session, auth_code: str) -> List[str]:
+    """有生成记录的日期，倒序"""
+    rows = (
+        db.query(GenerationDailySummary.day)
+        .filter(GenerationDailySummary.auth_code == auth_code, GenerationDailySummary.record_count > 0)
+        .order_by(GenerationDailySummary.day.desc())
+        .all()
+    )
+    return [row[0].isoformat() for row in rows]
+
+
+def list_daily_stats(
+    db: Session,
+    auth_code: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> List[dict]:
+    """按日期正序返回每日统计"""
+    query = db.query(GenerationDailySummary).filter(GenerationDailySummary.auth_code == auth_code)
+    if start_date:
+        query = query.filter(GenerationDailySummary.day >= start_date)
+    if end_date:
+        query = query.filter(GenerationDailySummary.day <= end_date)
+    return [
+        {
+            "date": summary.day.isoformat(),
+            **{name: getattr(summary, name) for name in SUMMARY_COUNTERS},
+        }
+        for summary in query.order_by(GenerationDailySummary.day).all()
+    ]
@@ -0,0 +1,317 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.executors import NamedExecutor, storage_executor
+from app.database import SessionLocal
+from app.models import IdempotencyRecord
+
+IDEMPOTENCY_STATUS_IN_PROGRESS = "in_progress"
+IDEMPOTENCY_STATUS_COMPLETED = "completed"
+
+MAX_IDEMPOTENCY_KEY_LENGTH = 128
+
+_DB_POLL_INTERVAL_SECONDS = 1.0
+
+Scope = Tuple[str, str, str]
+
+
+def hash_request(payload: dict) -> str:
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    幂等执行：同一 (授权码, 接口, Idempotency-Key) 的请求只执行一次。
+    - 已完成的成功结果在 TTL 内直接返回；
+    - 本进程内的并发重复请求在事件循环上等待首个请求的结果；
+    - 其他进程正在执行时，在事件循环上等待并轮询数据库直到其完成。
+    数据库读写都使用自有会话并在 storage_executor 中执行，不阻塞事件循环，
+    也不跨线程使用请求作用域的会话。
+    执行中的记录持有 lease_seconds 的租约，执行期间由续约线程定期延长；
+    只有执行方进程退出、租约过期后，记录才会被视为遗留记录而删除。
+    失败结果不保存，使用同一个 Key 重试时会重新执行。
+    """
+
+    def __init__(self, ttl_seconds: int, wait_seconds: int, lease_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        self.lease_seconds = max(3, lease_seconds)
+        self._inflight: Dict[Scope, Future] = {}
+        self._leases: Set[Scope] = set()
+        self._renewer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    async def run(
+        self,
+        auth_code: str,
+        endpoint: str,
+        key: Optional[str],
+        payload: dict,
+        func: Callable[[], dict],
+        executor: NamedExecutor,
+    ) -> dict:
+        """
+        执行 func 并返回其结果字典；key 为空时直接执行。
+        重复请求在事件循环上等待，只有首个请求的 func 提交到 executor，等待方不占用执行线程。
+        func 在 executor 线程中执行，需要数据库时应自行创建会话。
+        """
+        if not key:
+            return await executor.run(func)
+        key = key.strip()
+        if not key or len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Idempotency-Key 无效")
+
+        scope = (auth_code, endpoint, key)
+        request_hash = hash_request(payload)
+
+        with self._lock:
+            leader = self._inflight.get(scope)
+            if leader is None:
+                future: Future = Future()
+                self._inflight[scope] = future
+        if leader is not None:
+            try:
+                # shield：等待超时不能取消首个请求共享的 Future
+                result, leader_hash = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(leader)),
+                    timeout=self.wait_seconds,
+                )
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="相同请求正在处理中，请稍后再试")
+            self._ensure_same_request(leader_hash, request_hash)
+            return result
+
+        try:
+            completed = await self._acquire_or_wait(scope, request_hash)
+        except BaseException as exc:
+            if isinstance(exc, asyncio.CancelledError):
+                exc = HTTPException(status_code=status.HTTP_409_CONFLICT, detail="相同请求正在处理中，请稍后再试")
+            self._resolve(scope, future, exc=exc)
+            raise
+        if completed is not None:
+            self._resolve(scope, future, result=(completed, request_hash))
+            return completed
+
+        # 执行与结果落库一起在 executor 中完成，首个请求被取消时结果仍会写入并通知等待方
+        work = executor.submit(self._execute, scope, func)
+        work.add_done_callback(lambda done: self._resolve_work(scope, future, done, request_hash))
+        result, _ = await asyncio.shield(asyncio.wrap_future(future))
+        return result
+
+    def _resolve(self, scope: Scope, future: Future, result=None, exc: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self._inflight.pop(scope, None)
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+    def _resolve_work(self, scope: Scope, future: Future, work: Future, request_hash: str) -> None:
+        if work.cancelled():
+            exc = HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="服务正在停止，请稍后重试")
+            self._resolve(scope, future, exc=exc)
+        elif work.exception() is not None:
+            self._resolve(scope, future, exc=work.exception())
+        else:
+            self._resolve(scope, future, result=(work.result(), request_hash))
+
+    async def _acquire_or_wait(self, scope: Scope, request_hash: str) -> Optional[dict]:
+        """
+        登记执行记录并返回 None；已有成功结果时直接返回该结果。
+        其他进程正在执行时在事件循环上等待并轮询数据库，直到其完成或超时。
+        """
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            acquired, completed = await storage_executor.run(self._try_acquire, scope, request_hash)
+            if acquired or completed is not None:
+                return completed
+            # 其他进程正在执行
+            if time.monotonic() > deadline:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="相同请求正在处理中，请稍后再试")
+            await asyncio.sleep(_DB_POLL_INTERVAL_SECONDS)
+
+    def _try_acquire(self, scope: Scope, request_hash: str) -> Tuple[bool, Optional[dict]]:
+        """返回 (是否登记成功, 已完成的结果)；两者皆空表示其他进程正在执行"""
+        db = SessionLocal()
+        try:
+            record = self._find(db, scope)
+            if record is not None:
+                self._ensure_same_request(record.request_hash, request_hash)
+                if record.status == IDEMPOTENCY_STATUS_COMPLETED:
+                    return False, record.response_payload
+                return False, None
+            return self._acquire(db, scope, request_hash), None
+        finally:
+            db.close()
+
+    def _execute(self, scope: Scope, func: Callable[[], dict]) -> dict:
+        self._hold_lease(scope)
+        try:
+            result = func()
+        except BaseException:
+            self._release_lease(scope)
+            self._finish(scope, None)
+            raise
+        self._release_lease(scope)
+        self._finish(scope, result)
+        return result
+
+    def _finish(self, scope: Scope, result: Optional[dict]) -> None:
+        """成功结果落库，其余情况删除执行记录，允许使用同一个 Key 重试"""
+        db = SessionLocal()
+        try:
+            if result is not None and result.get("success"):
+                self._complete(db, scope, result)
+            else:
+                self._discard(db, scope)
+        finally:
+            db.close()
+
+    def _find(self, db: Session, scope: Scope) -> Optional[IdempotencyRecord]:
+        auth_code, endpoint, key = scope
+        record = (
+            db.query(IdempotencyRecord)
+            .filter(
+                IdempotencyRecord.auth_code == auth_code,
+                IdempotencyRecord.endpoint == endpoint,
+                IdempotencyRecord.idempotency_key == key,
+            )
+            .first()
+        )
+        if record is not None and record.expires_at < datetime.utcnow():
+            db.delete(record)
+            db.commit()
+            return None
+        return record
+
+    def _acquire(self, db: Session, scope: Scope, request_hash: str) -> bool:
+        auth_code, endpoint, key = scope
+        db.add(
+            IdempotencyRecord(
+                auth_code=auth_code,
+                endpoint=endpoint,
+                idempotency_key=key,
+                request_hash=request_hash,
+                status=IDEMPOTENCY_STATUS_IN_PROGRESS,
+                # 执行期间持续续约，租约过期说明执行方已退出
+                expires_at=datetime.utcnow() + timedelta(seconds=self.lease_seconds),
+            )
+        )
+        try:
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+
+    def _hold_lease(self, scope: Scope) -> None:
+        with self._lock:
+            self._leases.add(scope)
+            if self._renewer is None or not self._renewer.is_alive():
+                self._renewer = threading.Thread(target=self._renew_loop, name="idempotency-lease", daemon=True)
+                self._renewer.start()
+
+    def _release_lease(self, scope: Scope) -> None:
+        with self._lock:
+            self._leases.discard(scope)
+
+    def _renew_loop(self) -> None:
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self._lock:
+                scopes = list(self._leases)
+            if not scopes:
+                continue
+            db = SessionLocal()
+            try:
+                self._renew(db, scopes)
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+
+    def _renew(self, db: Session, scopes) -> None:
+        """延长本进程执行中记录的租约"""
+        expires_at = datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+        for auth_code, endpoint, key in scopes:
+            (
+                db.query(IdempotencyRecord)
+                .filter(
+                    IdempotencyRecord.auth_code == auth_code,
+                    IdempotencyRecord.endpoint == endpoint,
+                    IdempotencyRecord.idempotency_key == key,
+                    IdempotencyRecord.status == IDEMPOTENCY_STATUS_IN_PROGRESS,
+                )
+                .update({IdempotencyRecord.expires_at: expires_at}, synchronize_session=False)
+            )
+        db.commit()
+
+    def _complete(self, db: Session, scope: Scope, result: dict) -> None:
+        auth_code, endpoint, key = scope
+        (
+            db.query(IdempotencyRecord)
+            .filter(
+                IdempotencyRecord.auth_code == auth_code,
+                IdempotencyRecord.endpoint == endpoint,
+                IdempotencyRecord.idempotency_key == key,
+            )
+            .update(
+                {
+                    IdempotencyRecord.status: IDEMPOTENCY_STATUS_COMPLETED,
+                    IdempotencyRecord.response_payload: result,
+                    IdempotencyRecord.expires_at: datetime.utcnow() + timedelta(seconds=self.ttl_seconds),
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+
+    def _discard(self, db: Session, scope: Scope) -> None:
+        auth_code, endpoint, key = scope
+        (
+            db.query(IdempotencyRecord)
+            .filter(
+                IdempotencyRecord.auth_code == auth_code,
+                IdempotencyRecord.endpoint == endpoint,
+                IdempotencyRecord.idempotency_key == key,
+                IdempotencyRecord.status == IDEMPOTENCY_STATUS_IN_PROGRESS,
+            )
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+
+    @staticmethod
+    def _ensure_same_request(stored_hash: str, request_hash: str) -> None:
+        if stored_hash != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key 已用于不同的请求",
+            )
+
+    def purge_expired(self, db: Session) -> int:
+        deleted = (
+            db.query(IdempotencyRecord)
+            .filter(IdempotencyRecord.expires_at < datetime.utcnow())
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return deleted
+
+
+idempotency_store = IdempotencyStore(
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+    wait_seconds=settings.IDEMPOTENCY_WAIT_SECONDS,
+    lease_seconds=settings.IDEMPOTENCY_LEASE_SECONDS,
+)
@@ -1,7 +1,6 @@
 import os
 import uuid
 from typing import List, Optional, Dict, Any
-from openai import OpenAI
 from PIL import Image
 from io import BytesIO
 import base64
@@ -9,6 +8,13 @@ import aiofiles
 from fastapi import UploadFile, HTTPException
 import tempfile
 from app.core.config import settings
+from app.core.executors import cpu_image_executor, storage_executor, upstream_executor
+from app.tool.ClientPoolTool import client_pool
+
+
+def write_file(path: str, content: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(content)
 
 
 class AIImageProcessor:
@@ -22,7 +28,7 @@ class AIImageProcessor:
             "GEMINI_IMAGE_MODEL",
             settings.DEFAULT_IMAGE_MODEL_NAME,
         )
-        self.upload_dir = "./uploads"
+        self.upload_dir = settings.UPLOAD_TEMP_DIR
         self.output_dir = "./outputs"
         
         # 确保目录存在
@@ -49,6 +55,14 @@ class AIImageProcessor:
         
         return file_path
     
+    @staticmethod
+    def save_output_image(data_b64: str, output_path: str) -> int:
+        """解码base64图片并保存为JPEG，返回原始图片字节数"""
+        image_data = base64.b64decode(data_b64)
+        image = Image.open(BytesIO(image_data))
+        image.save(output_path, "JPEG")
+        return len(image_data)
+    
     async def process_multiple_images(
         self, 
         image_files: List[UploadFile], 
@@ -73,11 +87,8 @@ class AIImageProcessor:
                 if not os.path.exists(image_path):
                     raise FileNotFoundError(f"图片文件 {image_path} 不存在")
             
-            # 初始化OpenAI客户端
-            client = OpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url,
-            )
+            # 复用共享的OpenAI客户端
+            client = client_pool.get_ai_client(self.api_key, self.base_url)
             
             # 构建content数组，包含文本和多个图片
             content = [
@@ -89,14 +100,15 @@ class AIImageProcessor:
             
             # 为每个图片添加image_url对象
             for image_path in image_paths:
-                base64_image = self.encode_image(image_path)
+                base64_image = await storage_executor.run(self.encode_image, image_path)
                 content.append({
                     "type": "image_url",
                     "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
                 })
             
             # 调用AI图像编辑API
-            response = client.chat.completions.create(
+            response = await upstream_executor.run(
+                client.chat.completions.create,
                 model=selected_model,
                 messages=[
                     {
@@ -131,42 +143,35 @@ class AIImageProcessor:
                     
                     # 处理图片内容
                     elif "inline_data" in part and part["inline_data"] is not None:
-                        image_data = base64.b64decode(part["inline_data"]["data"])
                         mime_type = part["inline_data"].get("mime_type", "image/png")
                         
                         # 保存生成的图片
                         output_filename = f"{generation_id}_{uuid.uuid4().hex}.jpg"
                         output_path = os.path.join(self.output_dir, output_filename)
-                        
-                        image = Image.open(BytesIO(image_data))
-                        image.save(output_path, "JPEG")
+                        size = await cpu_image_executor.run(
+                            self.save_output_image, part["inline_data"]["data"], output_path
+                        )
                         
                         result["output_images"].append({
                             "filename": output_filename,
                             "path": output_path,
                             "mime_type": mime_type,
-                            "size": len(image_data)
+                            "size": size
                         })
             else:
                 raise HTTPException(status_code=500, detail="AI服务未返回有效的多模态响应")
             
-            # 清理临时上传文件
-            for image_path in image_paths:
-                try:
-                    os.remove(image_path)
-                except:
-                    pass  # 忽略删除错误
-            
             return result
             
         except Exception as e:
-            # 清理临时文件
+            raise HTTPException(status_code=500, detail=f"图像处理失败: {str(e)}")
+        finally:
+            # 清理临时上传文件（包括请求被取消的情况）
             for image_path in image_paths:
                 try:
                     os.remove(image_path)
                 except:
-                    pass
-            raise HTTPException(status_code=500, detail=f"图像处理失败: {str(e)}")
+                    pass  # 忽略删除错误
     
     def get_output_image_path(self, filename: str) -> str:
         """获取输出图片的完整路径"""
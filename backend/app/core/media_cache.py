@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.executors import cpu_image_executor, storage_executor
+from app.tool.ImagePrepTool import resize_image
+from app.tool.StorageTool import storage
+
+MEDIA_FORMATS = {"webp": "WEBP", "jpeg": "JPEG", "jpg": "JPEG", "png": "PNG"}
+
+# (内容, Content-Type, ETag)
+MediaVariant = Tuple[bytes, str, str]
+
+
+class MediaResizeCache:
+    """
+    按需缩放的图片变体缓存：变体按 (Key, 宽, 高, 格式, 质量) 存放在磁盘，以内容 SHA-256 作为强 ETag；
+    超过容量时按访问时间（文件修改时间）淘汰最久未用的变体。同一变体的并发请求只渲染一次。
+    宽高先按 allowed_sizes 向上取整，限制可生成的变体数量。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, quality: int, allowed_sizes: List[int]):
+        self.cache_dir = cache_dir
+        self.allowed_sizes = sorted({size for size in allowed_sizes if size > 0})
+        self.max_bytes = max(0, max_bytes)
+        self.quality = quality
+        self._total_bytes: Optional[int] = None
+        self._inflight: Dict[str, "asyncio.Future[MediaVariant]"] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def max_edge(self) -> int:
+        return self.allowed_sizes[-1] if self.allowed_sizes else 0
+
+    def snap_size(self, size: Optional[int]) -> Optional[int]:
+        """把请求的边长向上取整到允许的尺寸；超过最大尺寸时抛出 ValueError"""
+        if size is None:
+            return None
+        for allowed in self.allowed_sizes:
+            if size <= allowed:
+                return allowed
+        raise ValueError(f"宽高不能超过 {self.max_edge}")
+
+    def variant_id(self, key: str, width: Optional[int], height: Optional[int], fmt: str) -> str:
+        raw = f"{key}|{width or ''}|{height or ''}|{fmt}|{self.quality}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str, width: Optional[int], height: Optional[int], fmt: str) -> MediaVariant:
+        """返回变体内容；未缓存时读取原图并在图片线程池中缩放"""
+        variant = self.variant_id(key, width, height, fmt)
+        cached = await storage_executor.run(self._read, variant)
+        if cached is not None:
+            return cached
+
+        render = self._inflight.get(variant)
+        if render is None:
+            # 渲染在独立任务中执行：发起请求被取消（客户端断开）时渲染继续，等待方仍拿到结果
+            render = asyncio.ensure_future(self._render(variant, key, width, height, fmt))
+            self._inflight[variant] = render
+            render.add_done_callback(lambda done: self._on_rendered(variant, done))
+        return await asyncio.shield(render)
+
+    async def _render(self, variant: str, key: str, width: Optional[int], height: Optional[int], fmt: str) -> MediaVariant:
+        source = await storage_executor.run(storage.get, key)
+        data, content_type = await cpu_image_executor.run(
+            resize_image, source, width, height, MEDIA_FORMATS[fmt], self.quality
+        )
+        etag = hashlib.sha256(data).hexdigest()[:32]
+        await storage_executor.run(self._write, variant, key, data, content_type, etag)
+        return data, content_type, etag
+
+    def _on_rendered(self, variant: str, render: "asyncio.Future[MediaVariant]") -> None:
+        if self._inflight.get(variant) is render:
+            del self._inflight[variant]
+        if not render.cancelled():
+            # 没有等待方时避免 "exception was never retrieved" 警告
+            render.exception()
+
+    def _paths(self, variant: str) -> Tuple[str, str]:
+        directory = os.path.join(self.cache_dir, variant[:2])
+        return os.path.join(directory, f"{variant}.bin"), os.path.join(directory, f"{variant}.json")
+
+    def _read(self, variant: str) -> Optional[MediaVariant]:
+        data_path, meta_path = self._paths(variant)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(data_path, "rb") as f:
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get("size") != len(data):
+            return None
+        try:
+            os.utime(data_path, None)  # 以修改时间作为LRU的访问时间
+        except OSError:
+            pass
+        return data, meta.get("content_type"), meta.get("etag")
+
+    def _write(self, variant: str, key: str, data: bytes, content_type: str, etag: str) -> None:
+        if len(data) > self.max_bytes:
+            return
+        data_path, meta_path = self._paths(variant)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        tmp_path = f"{data_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, data_path)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "etag": etag, "size": len(data), "content_type": content_type}, f)
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total()
+            else:
+                self._total_bytes += len(data)
+            over_limit = self._total_bytes > self.max_bytes
+        if over_limit:
+            self._evict()
+
+    def _scan(self):
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(".bin"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _scan_total(self) -> int:
+        return sum(size for _, size, _ in self._scan())
+
+    def _evict(self) -> None:
+        """淘汰最久未访问的变体，直到总大小降到容量的 90%"""
+        files = sorted(self._scan())
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        for _, size, path in files:
+            if total <= target:
+                break
+            for victim in (path, path[:-4] + ".json"):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+            total -= size
+        with self._lock:
+            self._total_bytes = total
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 比较（弱比较，兼容 W/ 前缀与 *）"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+media_resize_cache = MediaResizeCache(
+    cache_dir=settings.MEDIA_CACHE_DIR,
+    max_bytes=settings.MEDIA_CACHE_MAX_MB * 1024 * 1024,
+    quality=settings.MEDIA_RESIZE_QUALITY,
+    allowed_sizes=settings.MEDIA_RESIZE_SIZES,
+)
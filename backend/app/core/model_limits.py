@@ -0,0 +1,66 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import ModelDefinition
+from app.tool.LogTool import LogTool
+from app.tool.ModelLimitTool import model_limiter
+
+log = LogTool(path="app/core/model_limits/")
+
+
+def load_model_limits(db: Session) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+    """读取模型定义表中配置了 max_in_flight / rpm 的模型：{模型名: (max_in_flight, rpm)}"""
+    rows = (
+        db.query(ModelDefinition.name, ModelDefinition.max_in_flight, ModelDefinition.rpm)
+        .filter(or_(ModelDefinition.max_in_flight.isnot(None), ModelDefinition.rpm.isnot(None)))
+        .all()
+    )
+    return {name: (max_in_flight, rpm) for name, max_in_flight, rpm in rows}
+
+
+class ModelLimitRefresher:
+    """
+    定期把模型定义表中的限额同步到 model_limiter：
+    运营在表中调整某个模型的 max_in_flight / rpm 后无需改代码或重启即可生效，未配置的模型仍使用 ai_models_config。
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = max(1.0, interval_seconds)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def refresh_once(self) -> bool:
+        db = SessionLocal()
+        try:
+            model_limiter.set_overrides(load_model_limits(db))
+            return True
+        except Exception as exc:
+            # 已有库未执行迁移脚本时保留当前限额，不影响服务启动
+            log.error(f"读取模型限额失败: {exc}")
+            return False
+        finally:
+            db.close()
+
+    def start(self) -> None:
+        """立即同步一次，之后每 interval_seconds 同步一次"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.refresh_once()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="model-limit-refresh", daemon=True)
+        self._thread.start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            self.refresh_once()
+
+
+model_limit_refresher = ModelLimitRefresher(interval_seconds=settings.MODEL_LIMIT_REFRESH_SECONDS)
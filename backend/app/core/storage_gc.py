@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.tool.StorageTool import DeferredUploader, storage
+
+# 写了一半的临时文件（*.tmp）超过该时长即视为遗留文件
+STALE_TMP_SECONDS = 3600
+
+
+class GcTarget:
+    def __init__(self, name: str, max_age_seconds: float):
+        self.name = name
+        self.max_age_seconds = max_age_seconds
+        self.runs = 0
+        self.deleted_files = 0
+        self.reclaimed_bytes = 0
+        self.last_deleted_files = 0
+        self.last_reclaimed_bytes = 0
+        self.last_error: Optional[str] = None
+
+    def record(self, deleted: int, reclaimed: int, error: Optional[str] = None) -> None:
+        self.runs += 1
+        self.deleted_files += deleted
+        self.reclaimed_bytes += reclaimed
+        self.last_deleted_files = deleted
+        self.last_reclaimed_bytes = reclaimed
+        self.last_error = error
+
+    def stats(self) -> dict:
+        return {
+            "max_age_hours": round(self.max_age_seconds / 3600, 2),
+            "runs": self.runs,
+            "deleted_files": self.deleted_files,
+            "reclaimed_bytes": self.reclaimed_bytes,
+            "last_deleted_files": self.last_deleted_files,
+            "last_reclaimed_bytes": self.last_reclaimed_bytes,
+            "last_error": self.last_error,
+        }
+
+
+class LocalDirTarget(GcTarget):
+    def __init__(self, name: str, path: str, max_age_seconds: float, keep: Optional[Callable[[str], bool]] = None):
+        super().__init__(name, max_age_seconds)
+        self.path = path
+        self.keep = keep
+
+
+class StoragePrefixTarget(GcTarget):
+    def __init__(self, name: str, prefix: str, max_age_seconds: float):
+        super().__init__(name, max_age_seconds)
+        self.prefix = prefix
+
+
+class StorageGarbageCollector:
+    """
+    定时清理临时文件，避免磁盘与存储无限增长：
+    - 本地目录（上传暂存、已完成上传的输出缓存等）：删除超过保留时长的文件与空目录；
+    - 存储后端的临时前缀（如 temp/）：按修改时间筛选后批量删除。
+    每个清理目标累计删除数量与回收字节数，供 /health 查看。
+    """
+
+    def __init__(self, interval_seconds: float, batch_size: int):
+        self.interval_seconds = max(1.0, interval_seconds)
+        self.batch_size = max(1, batch_size)
+        self.targets: List[GcTarget] = []
+        self.last_run_at: Optional[float] = None
+        self.last_duration_ms = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+
+    def add_local_dir(self, name: str, path: str, max_age_seconds: float, keep: Optional[Callable[[str], bool]] = None) -> None:
+        self.targets.append(LocalDirTarget(name, path, max_age_seconds, keep))
+
+    def add_storage_prefix(self, name: str, prefix: str, max_age_seconds: float) -> None:
+        self.targets.append(StoragePrefixTarget(name, prefix, max_age_seconds))
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="storage-gc", daemon=True)
+        self._thread.start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        # 启动后先等待一个周期，避免与启动流程争抢 IO
+        while not self._stop.wait(self.interval_seconds):
+            self.run_once()
+
+    def run_once(self) -> Dict[str, dict]:
+        """执行一轮清理，返回各目标本轮删除数量与回收字节数"""
+        with self._run_lock:
+            started = time.monotonic()
+            now = time.time()
+            for target in self.targets:
+                try:
+                    if isinstance(target, LocalDirTarget):
+                        deleted, reclaimed = self._sweep_local(target, now)
+                    else:
+                        deleted, reclaimed = self._sweep_storage(target, now)
+                    target.record(deleted, reclaimed)
+                except Exception as exc:
+                    target.record(0, 0, str(exc)[:500])
+            self.last_run_at = now
+            self.last_duration_ms = int((time.monotonic() - started) * 1000)
+            return {
+                target.name: {
+                    "deleted_files": target.last_deleted_files,
+                    "reclaimed_bytes": target.last_reclaimed_bytes,
+                }
+                for target in self.targets
+            }
+
+    def _sweep_local(self, target: LocalDirTarget, now: float):
+        deleted = reclaimed = 0
+        if not os.path.isdir(target.path):
+            return deleted, reclaimed
+        for root, _, names in os.walk(target.path, topdown=False):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                max_age = min(target.max_age_seconds, STALE_TMP_SECONDS) if name.endswith(".tmp") else target.max_age_seconds
+                if now - stat.st_mtime < max_age or (target.keep and target.keep(path)):
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                deleted += 1
+                reclaimed += stat.st_size
+            if root != target.path:
+                try:
+                    os.rmdir(root)  # 仅删除已清空的子目录
+                except OSError:
+                    pass
+        return deleted, reclaimed
+
+    def _sweep_storage(self, target: StoragePrefixTarget, now: float):
+        deleted = reclaimed = 0
+        batch, batch_bytes = [], 0
+        for key, size, modified in storage.list_objects(target.prefix):
+            if now - modified < target.max_age_seconds:
+                continue
+            batch.append(key)
+            batch_bytes += size
+            if len(batch) >= self.batch_size:
+                removed = storage.delete_many(batch)
+                deleted += removed
+                reclaimed += batch_bytes if removed == len(batch) else batch_bytes * removed // len(batch)
+                batch, batch_bytes = [], 0
+        if batch:
+            removed = storage.delete_many(batch)
+            deleted += removed
+            reclaimed += batch_bytes if removed == len(batch) else batch_bytes * removed // len(batch)
+        return deleted, reclaimed
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval_seconds,
+            "last_run_at": self.last_run_at,
+            "last_duration_ms": self.last_duration_ms,
+            "targets": {target.name: target.stats() for target in self.targets},
+        }
+
+
+def is_pending_upload(path: str) -> bool:
+    """输出缓存中尚未上传完成的文件（及其标记）不能删除"""
+    if path.endswith(DeferredUploader.pending_suffix):
+        return True
+    return os.path.exists(f"{path}{DeferredUploader.pending_suffix}")
+
+
+def hours(value: float) -> float:
+    return value * 3600
+
+
+storage_gc = StorageGarbageCollector(
+    interval_seconds=settings.GC_INTERVAL_MINUTES * 60,
+    batch_size=settings.GC_DELETE_BATCH_SIZE,
+)
+# 只清理暂存上传目录；UPLOAD_DIR 对外提供访问且历史记录引用其中的文件，不能清理
+storage_gc.add_local_dir("upload-temp", settings.UPLOAD_TEMP_DIR, hours(settings.GC_UPLOAD_TEMP_MAX_AGE_HOURS))
+if settings.OUTPUT_DEFERRED_UPLOAD:
+    storage_gc.add_local_dir(
+        "output-cache",
+        settings.OUTPUT_CACHE_DIR,
+        hours(settings.GC_OUTPUT_CACHE_MAX_AGE_HOURS),
+        keep=is_pending_upload,
+    )
+for temp_prefix in settings.GC_STORAGE_TEMP_PREFIXES:
+    storage_gc.add_storage_prefix(f"storage:{temp_prefix}", temp_prefix, hours(settings.GC_STORAGE_TEMP_MAX_AGE_HOURS))
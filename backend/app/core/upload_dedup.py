@@ -0,0 +1,86 @@
+import hashlib
+from datetime import datetime
+from typing import BinaryIO, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import StoredObject
+
+HASH_READ_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """上传文件超过大小上限"""
+
+
+def hash_fileobj(fileobj: BinaryIO, max_bytes: int, chunk_size: int = HASH_READ_CHUNK_SIZE) -> Tuple[str, int]:
+    """按块计算文件的 SHA-256 与大小，超过 max_bytes 时中止；结束后回到文件开头"""
+    digest = hashlib.sha256()
+    total = 0
+    fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadTooLargeError()
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), total
+
+
+def find_stored_object(db: Session, auth_code: str, sha256: str) -> Optional[StoredObject]:
+    """查找该授权码已上传过的相同内容对象，命中时记录使用次数；不同授权码之间不共享"""
+    stored = (
+        db.query(StoredObject)
+        .filter(StoredObject.auth_code == auth_code, StoredObject.sha256 == sha256)
+        .first()
+    )
+    if stored is None:
+        return None
+    (
+        db.query(StoredObject)
+        .filter(StoredObject.id == stored.id)
+        .update(
+            {
+                StoredObject.hit_count: StoredObject.hit_count + 1,
+                StoredObject.last_used_at: datetime.utcnow(),
+            },
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return stored
+
+
+def remember_stored_object(
+    db: Session,
+    auth_code: str,
+    sha256: str,
+    storage_key: str,
+    size_bytes: int,
+    content_type: Optional[str] = None,
+) -> str:
+    """登记新上传的对象，返回该内容对应的存储 Key（同一授权码并发上传相同内容时以先登记的为准）"""
+    db.add(
+        StoredObject(
+            auth_code=auth_code,
+            sha256=sha256,
+            storage_key=storage_key,
+            size_bytes=size_bytes,
+            content_type=content_type,
+        )
+    )
+    try:
+        db.commit()
+        return storage_key
+    except IntegrityError:
+        db.rollback()
+        existing = (
+            db.query(StoredObject)
+            .filter(StoredObject.auth_code == auth_code, StoredObject.sha256 == sha256)
+            .first()
+        )
+        return existing.storage_key if existing else storage_key
@@ -2,24 +2,27 @@ from sqlalchemy.orm import Session
 from sqlalchemy import desc
 from typing import List, Optional, Dict, Any
 
+from app.core.generation_summary import record_generation_summaries
 from app.models import GenerationRecord, AuthCode
 from app.schemas import GenerationRecordCreate, AuthCodeCreate
 
 
 class CRUDGeneration:
     def create(self, db: Session, *, obj_in: GenerationRecordCreate) -> GenerationRecord:
-        """创建一条生成记录"""
+        """创建一条生成记录，并在同一事务中累加每日汇总"""
+        auth_code = db.query(AuthCode.code).filter(AuthCode.id == obj_in.auth_code_id).scalar()
+        if auth_code is None:
+            # auth_code 为 NOT NULL，且汇总按授权码累加，找不到授权码时不写入
+            raise ValueError(f"授权码不存在: {obj_in.auth_code_id}")
         db_obj = GenerationRecord(
-            generation_id=obj_in.generation_id,
-            auth_code_id=obj_in.auth_code_id,
-            prompt=obj_in.prompt,
-            input_images_count=obj_in.input_images_count,
-            output_images_count=obj_in.output_images_count,
+            auth_code=auth_code,
+            prompt_text=obj_in.prompt,
+            output_count=obj_in.output_images_count,
             credits_used=obj_in.credits_used,
-            processing_time=obj_in.processing_time,
-            status=obj_in.status
+            processing_time=int(round(obj_in.processing_time or 0)),
         )
         db.add(db_obj)
+        record_generation_summaries(db, [db_obj])
         db.commit()
         db.refresh(db_obj)
         return db_obj
@@ -12,7 +12,7 @@ import json
 # Delayed imports to avoid early database connection
 # from app.database import engine, get_db
 # from app.models import Base
-from app.api import auth, images, cases, users, assistants
+from app.api import auth, images, cases, users, assistants, media
 from app.routers import generations
 from app.core.config import settings
 
@@ -51,9 +51,99 @@ async def startup_event():
     
     # Create directories
     os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
     os.makedirs(settings.OUTPUT_DIR, exist_ok=True)
     os.makedirs("static", exist_ok=True)
 
+    # Select the media storage backend and warm up shared upstream clients
+    from app.tool.ClientPoolTool import client_pool
+    from app.tool.StorageTool import storage, STORAGE_BACKEND_COS
+    storage.configure(settings.STORAGE_BACKEND)
+    if storage.name == STORAGE_BACKEND_COS:
+        client_pool.warm_up(settings.TENCENT_CLOUD_APP_ID, settings.COS_REGION)
+    if settings.OUTPUT_DEFERRED_UPLOAD:
+        storage.configure_deferred()
+
+    # Configure reference image fetch cache
+    from app.tool.ImageFetchTool import image_fetcher
+    image_fetcher.configure(
+        cache_dir=settings.IMAGE_FETCH_DISK_CACHE_DIR or None,
+        memory_max_mb=settings.IMAGE_FETCH_MEMORY_CACHE_MB,
+        disk_max_mb=settings.IMAGE_FETCH_DISK_CACHE_MB,
+        timeout=settings.IMAGE_FETCH_TIMEOUT,
+        max_workers=settings.IMAGE_FETCH_MAX_WORKERS,
+    )
+
+    # Configure per-model upstream limits
+    from app.tool.ModelLimitTool import model_limiter
+    model_limiter.configure(
+        default_max_in_flight=settings.MODEL_LIMIT_DEFAULT_MAX_IN_FLIGHT,
+        default_rpm=settings.MODEL_LIMIT_DEFAULT_RPM,
+        wait_seconds=settings.MODEL_LIMIT_WAIT_SECONDS,
+    )
+
+    # Refund credit reservations left behind by a previous process, purge expired idempotency keys
+    # and backfill the daily generation summaries on first deployment
+    from app.database import SessionLocal
+    from app.core.credits_manager import release_expired_reservations
+    from app.core.idempotency import idempotency_store
+    from app.core.generation_summary import backfill_generation_summaries
+    db = SessionLocal()
+    try:
+        release_expired_reservations(db)
+        idempotency_store.purge_expired(db)
+        backfill_generation_summaries(db)
+    finally:
+        db.close()
+
+    # Load per-model limits from model_definitions and keep them in sync
+    from app.core.model_limits import model_limit_refresher
+    model_limit_refresher.start()
+
+    # Start generation job workers
+    from app.core.generation_jobs import generation_job_queue
+    generation_job_queue.start()
+
+    # Start batch generation runners
+    from app.core.generation_batches import generation_batch_runner
+    generation_batch_runner.start()
+
+    # Start thumbnail/preview derivative workers
+    if settings.DERIVATIVES_ENABLED:
+        from app.core.derivatives import derivative_pipeline
+        derivative_pipeline.start()
+
+    # Start periodic cleanup of temporary uploads and cached files
+    if settings.GC_ENABLED:
+        from app.core.storage_gc import storage_gc
+        storage_gc.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Application shutdown event"""
+    from app.core.generation_jobs import generation_job_queue
+    from app.core.generation_batches import generation_batch_runner
+    from app.tool.ClientPoolTool import client_pool
+    from app.tool.VideoPollTool import video_poller
+    from app.core.executors import shutdown_executors
+    from app.core.derivatives import derivative_pipeline
+    from app.tool.StorageTool import storage
+    from app.tool.ImageFetchTool import image_fetcher
+    from app.core.storage_gc import storage_gc
+    from app.core.model_limits import model_limit_refresher
+    model_limit_refresher.shutdown()
+    generation_job_queue.shutdown()
+    generation_batch_runner.shutdown()
+    derivative_pipeline.shutdown()
+    storage_gc.shutdown()
+    video_poller.shutdown()
+    storage.shutdown()
+    image_fetcher.shutdown()
+    shutdown_executors()
+    await client_pool.aclose_all()
+    client_pool.close_all()
+
 # Create directories (fallback)
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 os.makedirs(settings.OUTPUT_DIR, exist_ok=True)
@@ -63,6 +153,12 @@ os.makedirs("static", exist_ok=True)
 app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
 app.mount("/outputs", StaticFiles(directory=settings.OUTPUT_DIR), name="outputs")
 app.mount("/static", StaticFiles(directory="static"), name="static")
+if settings.STORAGE_BACKEND == "local":
+    os.makedirs(settings.STORAGE_LOCAL_DIR, exist_ok=True)
+    app.mount("/storage", StaticFiles(directory=settings.STORAGE_LOCAL_DIR), name="storage")
+if settings.OUTPUT_DEFERRED_UPLOAD:
+    os.makedirs(settings.OUTPUT_CACHE_DIR, exist_ok=True)
+    app.mount("/output-cache", StaticFiles(directory=settings.OUTPUT_CACHE_DIR), name="output-cache")
 
 # Include API routers
 app.include_router(auth.router, prefix="/api/auth", tags=["认证"])
@@ -71,6 +167,7 @@ app.include_router(cases.router, prefix="/api/cases", tags=["案例管理"])
 app.include_router(users.router, prefix="/api/users", tags=["用户管理"])
 app.include_router(assistants.router, prefix="/api/assistants", tags=["助手广场"])
 app.include_router(generations.router, prefix="/api/v1", tags=["图像生成"])
+app.include_router(media.router, prefix="/api/media", tags=["媒体"])
 
 @app.get("/")
 async def root():
@@ -82,7 +179,16 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow()}
+    from app.core.executors import executor_stats
+    from app.tool.StorageTool import storage
+    from app.core.storage_gc import storage_gc
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow(),
+        "executors": executor_stats(),
+        "deferred_uploads": storage.deferred_stats(),
+        "storage_gc": storage_gc.stats(),
+    }
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, UniqueConstraint, JSON
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, ForeignKey, Boolean, UniqueConstraint, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -143,6 +143,9 @@ class ModelDefinition(Base):
     credit_cost = Column(Integer, nullable=False, default=1)
     discount_credit_cost = Column(Integer, nullable=True)
     is_free_to_use = Column(Boolean, nullable=False, default=False)
+    # 上游调用限额，NULL 时使用 ai_models_config 中的配置或全局默认值，0 表示不限制
+    max_in_flight = Column(Integer, nullable=True)
+    rpm = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -298,6 +301,10 @@ class AssistantCommentLike(Base):
 
 class GenerationRecord(Base):
     __tablename__ = "generation_records"
+    __table_args__ = (
+        # 历史记录按授权码筛选、按 (created_at, id) 倒序翻页
+        Index("ix_generation_records_auth_code_created_at_id", "auth_code", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     auth_code = Column(String(100), ForeignKey("auth_codes.code"), nullable=False)
@@ -311,7 +318,185 @@ class GenerationRecord(Base):
     output_videos = Column(Text, nullable=True)  # JSON array of output video paths
     credits_used = Column(Integer, nullable=False)
     processing_time = Column(Integer, nullable=True)  # seconds
+    # 历史记录按 (created_at, id) 游标翻页，不允许为空
+    created_at = Column(DateTime, nullable=False, default=func.now())
+
+
+class GenerationDailySummary(Base):
+    """按 (授权码, 日期) 汇总的生成统计，写入生成记录时在同一事务中累加"""
+    __tablename__ = "generation_daily_summaries"
+    __table_args__ = (
+        UniqueConstraint("auth_code", "day", name="uq_generation_daily_summaries_auth_code_day"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    auth_code = Column(String(100), ForeignKey("auth_codes.code"), nullable=False)
+    day = Column(Date, nullable=False)
+    record_count = Column(Integer, nullable=False, default=0)
+    output_count = Column(Integer, nullable=False, default=0)
+    credits_used = Column(Integer, nullable=False, default=0)
+    image_count = Column(Integer, nullable=False, default=0)  # 图片类生成记录数
+    video_count = Column(Integer, nullable=False, default=0)  # 视频类生成记录数
     created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class CreditReservation(Base):
+    __tablename__ = "credit_reservations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    reservation_id = Column(String(64), nullable=False, unique=True, index=True)
+    auth_code_id = Column(
+        Integer,
+        ForeignKey("auth_codes.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    team_id = Column(
+        Integer,
+        ForeignKey("creator_teams.id", ondelete="SET NULL"),
+        nullable=True,
+    )
+    team_credits = Column(Integer, nullable=False, default=0)  # 从团队余额预扣的积分
+    personal_credits = Column(Integer, nullable=False, default=0)  # 从个人余额预扣的积分
+    status = Column(String(20), nullable=False, default="reserved", index=True)  # reserved/committed/released
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(64), nullable=False, unique=True, index=True)
+    auth_code = Column(String(100), ForeignKey("auth_codes.code"), nullable=False, index=True)
+    media_type = Column(String(20), nullable=False, default="image")
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued/running/done/failed
+    request_payload = Column(JSON, nullable=False)  # 提交时的 GenerateRequest
+    result_payload = Column(JSON, nullable=True)  # 完成后的 GenerateResponse
+    error_message = Column(Text, nullable=True)
+    generation_record_id = Column(
+        Integer,
+        ForeignKey("generation_records.id", ondelete="SET NULL"),
+        nullable=True,
+    )
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class GenerationBatch(Base):
+    __tablename__ = "generation_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(String(64), nullable=False, unique=True, index=True)
+    auth_code = Column(String(100), ForeignKey("auth_codes.code"), nullable=False, index=True)
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued/running/done/partial/failed
+    total_items = Column(Integer, nullable=False, default=0)
+    completed_items = Column(Integer, nullable=False, default=0)
+    failed_items = Column(Integer, nullable=False, default=0)
+    credits_used = Column(Integer, nullable=False, default=0)
+    error_message = Column(Text, nullable=True)
+    owner_id = Column(String(100), nullable=True)  # 执行该批次的进程
+    heartbeat_at = Column(DateTime, nullable=True)  # 执行进程的最近心跳
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    items = relationship(
+        "GenerationBatchItem",
+        back_populates="batch",
+        cascade="all, delete-orphan",
+        order_by="GenerationBatchItem.item_index",
+    )
+
+
+class GenerationBatchItem(Base):
+    __tablename__ = "generation_batch_items"
+    __table_args__ = (
+        UniqueConstraint("batch_id", "item_index", name="uq_generation_batch_item_index"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(
+        Integer,
+        ForeignKey("generation_batches.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    item_index = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending/running/done/failed
+    request_payload = Column(JSON, nullable=False)  # 单项的 GenerateRequest
+    result_payload = Column(JSON, nullable=True)  # 单项的 GenerateResponse
+    error_message = Column(Text, nullable=True)
+    credits_used = Column(Integer, nullable=False, default=0)
+    credit_reservation_id = Column(
+        Integer,
+        ForeignKey("credit_reservations.id", ondelete="SET NULL"),
+        nullable=True,
+    )  # 完成该项时所属的批次积分预留
+    generation_record_id = Column(
+        Integer,
+        ForeignKey("generation_records.id", ondelete="SET NULL"),
+        nullable=True,
+    )
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    batch = relationship("GenerationBatch", back_populates="items")
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_records"
+    __table_args__ = (
+        UniqueConstraint("auth_code", "endpoint", "idempotency_key", name="uq_idempotency_scope"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    auth_code = Column(String(100), nullable=False, index=True)
+    endpoint = Column(String(100), nullable=False)
+    idempotency_key = Column(String(128), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # 请求体摘要，防止同一个Key用于不同请求
+    status = Column(String(20), nullable=False, default="in_progress")  # in_progress/completed
+    response_payload = Column(JSON, nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class StoredObject(Base):
+    """按 (授权码, 内容 SHA-256) 去重的已上传对象：同一授权码再次上传相同内容时直接复用其已有的存储 Key"""
+    __tablename__ = "stored_objects"
+    __table_args__ = (
+        UniqueConstraint("auth_code", "sha256", name="uq_stored_objects_auth_code_sha256"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    auth_code = Column(String(100), ForeignKey("auth_codes.code"), nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    storage_key = Column(String(500), nullable=False)
+    size_bytes = Column(Integer, nullable=False, default=0)
+    content_type = Column(String(100), nullable=True)
+    hit_count = Column(Integer, nullable=False, default=0)  # 命中去重的次数
+    last_used_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now())
+
+
+class MediaDerivative(Base):
+    """原图的派生图（WebP 缩略图/预览图），存储 Key 与原图位于同一目录"""
+    __tablename__ = "media_derivatives"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_key = Column(String(500), nullable=False, unique=True, index=True)
+    status = Column(String(20), nullable=False, default="pending")  # pending/ready/failed
+    thumbnail_key = Column(String(500), nullable=True)
+    preview_key = Column(String(500), nullable=True)
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
 class TemplateCase(Base):
     __tablename__ = "template_cases"
@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from fastapi.responses import FileResponse
 from typing import List, Optional, Any
-from sqlalchemy import desc, func
+from sqlalchemy import desc, tuple_
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.crud import crud_generation, crude_auth_code as crud_auth_code
 from app.schemas import GenerationRecordCreate, GenerationRecordResponse
-from app.core.image_processor import image_processor
+from app.core.image_processor import image_processor, write_file
+from app.core.derivatives import find_derivatives
+from app.core.generation_summary import SUMMARY_COUNTERS, list_available_dates, list_daily_stats
+from app.core.executors import cpu_image_executor, storage_executor, upstream_executor
 from app.core.credits_manager import (
     get_total_available_credits,
     get_team_credits,
@@ -14,19 +17,32 @@ from app.core.credits_manager import (
     resolve_model_credit_cost,
 )
 from app.core.config import settings
+from app.tool.ClientPoolTool import client_pool
 from app.models import AuthCode, GenerationRecord
-from openai import OpenAI
 import uuid
 import os
 import base64
-from io import BytesIO
-from PIL import Image
 from datetime import datetime, date, timedelta
 import json
 
 router = APIRouter(tags=["图像生成"])
 
 
+def encode_history_cursor(record: GenerationRecord) -> str:
+    """历史记录翻页游标：对最后一条记录的 (created_at, id) 编码，客户端视为不透明字符串"""
+    payload = json.dumps({"c": record.created_at.isoformat(), "i": record.id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_history_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["c"]), int(payload["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="cursor 无效")
+
+
 @router.post("/ai-edit", response_model=GenerationRecordResponse)
 async def ai_edit_images(
     auth_code: str = Form(..., description="授权码"),
@@ -62,12 +78,12 @@ async def ai_edit_images(
     # 生成唯一的生成ID
     generation_id = str(uuid.uuid4())
     
+    image_paths = []
     try:
         # 保存上传的图片文件
-        upload_dir = "./uploads"
+        upload_dir = settings.UPLOAD_TEMP_DIR
         os.makedirs(upload_dir, exist_ok=True)
         
-        image_paths = []
         for upload_file in images:
             if not upload_file.content_type.startswith('image/'):
                 raise HTTPException(status_code=400, detail=f"文件 {upload_file.filename} 不是有效的图片格式")
@@ -79,15 +95,14 @@ async def ai_edit_images(
             
             # 保存文件
             contents = await upload_file.read()
-            with open(file_path, 'wb') as f:
-                f.write(contents)
+            await storage_executor.run(write_file, file_path, contents)
                 
             image_paths.append(file_path)
         
-        # 初始OpenAI客户端
-        client = OpenAI(
-            api_key=os.getenv("GEMINI_API_KEY", ""),
-            base_url=os.getenv("GEMINI_BASE_URL", "https://aihubmix.com/v1"),
+        # 复用共享的OpenAI客户端
+        client = client_pool.get_ai_client(
+            os.getenv("GEMINI_API_KEY", ""),
+            os.getenv("GEMINI_BASE_URL", "https://aihubmix.com/v1"),
         )
         
         # 开始处理时间
@@ -103,15 +118,15 @@ async def ai_edit_images(
         
         # 为每个图片添加image_url对象
         for image_path in image_paths:
-            with open(image_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-                content.append({
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
-                })
+            base64_image = await storage_executor.run(image_processor.encode_image, image_path)
+            content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"},
+            })
         
         # 调用AI图像编辑API
-        response = client.chat.completions.create(
+        response = await upstream_executor.run(
+            client.chat.completions.create,
             model=target_model_name,
             messages=[
                 {
@@ -145,21 +160,20 @@ async def ai_edit_images(
                 
                 # 处理图片内容
                 elif "inline_data" in part and part["inline_data"] is not None:
-                    image_data = base64.b64decode(part["inline_data"]["data"])
                     mime_type = part["inline_data"].get("mime_type", "image/png")
                     
                     # 保存生成的图片
                     output_filename = f"{generation_id}_{uuid.uuid4().hex}.jpg"
                     output_path = os.path.join(output_dir, output_filename)
-                    
-                    image = Image.open(BytesIO(image_data))
-                    image.save(output_path, "JPEG")
+                    size = await cpu_image_executor.run(
+                        image_processor.save_output_image, part["inline_data"]["data"], output_path
+                    )
                     
                     output_images.append({
                         "filename": output_filename,
                         "path": output_path,
                         "mime_type": mime_type,
-                        "size": len(image_data)
+                        "size": size
                     })
         else:
             raise HTTPException(status_code=500, detail="AI服务未返回有效的多模态响应")
@@ -206,23 +220,17 @@ async def ai_edit_images(
             ]
         }
         
-        # 清理临时上传文件
-        for image_path in image_paths:
-            try:
-                os.remove(image_path)
-            except Exception:
-                pass  # 忽略删除错误
-        
         return response_data
         
     except Exception as e:
-        # 清理临时文件
-        for image_path in image_paths if 'image_paths' in locals() else []:
+        raise HTTPException(status_code=500, detail=f"图像编辑失败: {str(e)}")
+    finally:
+        # 清理临时上传文件（包括请求被取消的情况）
+        for image_path in image_paths:
             try:
                 os.remove(image_path)
             except Exception:
-                pass
-        raise HTTPException(status_code=500, detail=f"图像编辑失败: {str(e)}")
+                pass  # 忽略删除错误
 
 
 @router.post("/collage", response_model=GenerationRecordResponse)
@@ -337,19 +345,8 @@ async def download_generated_image(filename: str):
     )
 
 
-@router.get("/history/{auth_code}")
-def get_generation_history(
-    auth_code: str,
-    limit: int = 30,
-    offset: int = 0,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    db: Session = Depends(get_db)
-):
-    """获取用户的生成历史记录"""
-
-    capped_limit = max(1, min(limit, 100))
-    safe_offset = max(0, offset)
+def parse_history_range(start_date: Optional[str], end_date: Optional[str]):
+    """解析 YYYY-MM-DD 格式的日期区间"""
 
     def parse_date(value: Optional[str]) -> Optional[date]:
         if not value:
@@ -364,6 +361,58 @@ def get_generation_history(
 
     if start_date_obj and end_date_obj and start_date_obj > end_date_obj:
         raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
+    return start_date_obj, end_date_obj
+
+
+@router.get("/history/{auth_code}/daily-stats")
+def get_generation_daily_stats(
+    auth_code: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """按天统计生成次数、输出数量、消耗积分与图片/视频占比，数据来自每日汇总表"""
+    start_date_obj, end_date_obj = parse_history_range(start_date, end_date)
+
+    auth_record = db.query(AuthCode).filter(AuthCode.code == auth_code).first()
+    if not auth_record:
+        raise HTTPException(status_code=401, detail="无效的授权码")
+
+    days = list_daily_stats(db, auth_code, start_date_obj, end_date_obj)
+    return {
+        "days": days,
+        "totals": {
+            name: sum(day[name] for day in days)
+            for name in SUMMARY_COUNTERS
+        },
+        "range": {
+            "start": start_date_obj.isoformat() if start_date_obj else None,
+            "end": end_date_obj.isoformat() if end_date_obj else None,
+        },
+    }
+
+
+@router.get("/history/{auth_code}")
+def get_generation_history(
+    auth_code: str,
+    limit: int = 30,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    获取用户的生成历史记录，按 (created_at, id) 倒序。
+    传入上一页返回的 next_cursor 时按游标翻页（忽略 offset），深翻页不再随页数变慢；
+    include_total=false 时不统计总数。
+    """
+
+    capped_limit = max(1, min(limit, 100))
+    safe_offset = max(0, offset)
+
+    start_date_obj, end_date_obj = parse_history_range(start_date, end_date)
 
     auth_record = db.query(AuthCode).filter(AuthCode.code == auth_code).first()
     if not auth_record:
@@ -379,26 +428,26 @@ def get_generation_history(
         end_dt = datetime.combine(end_date_obj + timedelta(days=1), datetime.min.time())
         base_query = base_query.filter(GenerationRecord.created_at < end_dt)
 
-    total_count = base_query.count()
+    total_count = base_query.count() if include_total else None
 
-    records = (
-        base_query
-        .order_by(desc(GenerationRecord.created_at))
-        .offset(safe_offset)
-        .limit(capped_limit)
-        .all()
-    )
+    page_query = base_query
+    if cursor:
+        cursor_created_at, cursor_id = decode_history_cursor(cursor)
+        page_query = page_query.filter(
+            tuple_(GenerationRecord.created_at, GenerationRecord.id) < tuple_(cursor_created_at, cursor_id)
+        )
+        safe_offset = 0
+    page_query = page_query.order_by(desc(GenerationRecord.created_at), desc(GenerationRecord.id))
+    if safe_offset:
+        page_query = page_query.offset(safe_offset)
 
-    available_dates_rows = (
-        db.query(func.date(GenerationRecord.created_at))
-        .filter(GenerationRecord.auth_code == auth_code)
-        .distinct()
-        .all()
-    )
-    available_dates = sorted(
-        {row[0].isoformat() for row in available_dates_rows if row[0]},
-        reverse=True,
-    )
+    # 多取一条判断是否还有下一页
+    records = page_query.limit(capped_limit + 1).all()
+    has_more = len(records) > capped_limit
+    records = records[:capped_limit]
+
+    # 直接读取每日汇总表，不再扫描全部生成记录
+    available_dates = list_available_dates(db, auth_code)
 
     def parse_list_field(raw_value: Optional[Any]) -> List[str]:
         if raw_value is None:
@@ -427,6 +476,12 @@ def get_generation_history(
             pass
         return None
 
+    output_images_by_id = {record.id: parse_list_field(record.output_images) for record in records}
+    derivatives = find_derivatives(
+        db,
+        [key for keys in output_images_by_id.values() for key in keys],
+    )
+
     records_payload = [
         {
             "id": record.id,
@@ -436,7 +491,12 @@ def get_generation_history(
             "input_images": parse_list_field(record.input_images),
             "prompt_text": record.prompt_text,
             "output_count": record.output_count,
-            "output_images": parse_list_field(record.output_images),
+            "output_images": output_images_by_id[record.id],
+            "output_derivatives": {
+                key: derivatives[key]
+                for key in output_images_by_id[record.id]
+                if key in derivatives
+            },
             "output_videos": parse_list_field(record.output_videos),
             "credits_used": record.credits_used,
             "processing_time": record.processing_time,
@@ -447,7 +507,6 @@ def get_generation_history(
     ]
 
     next_offset = safe_offset + len(records)
-    has_more = next_offset < total_count
 
     return {
         "records": records_payload,
@@ -456,7 +515,8 @@ def get_generation_history(
         "limit": capped_limit,
         "offset": safe_offset,
         "has_more": has_more,
-        "next_offset": next_offset if has_more else None,
+        "next_offset": next_offset if has_more and not cursor else None,
+        "next_cursor": encode_history_cursor(records[-1]) if has_more else None,
         "range": {
             "start": start_date_obj.isoformat() if start_date_obj else None,
             "end": end_date_obj.isoformat() if end_date_obj else None,
@@ -1,8 +1,8 @@
+import asyncio
 import mimetypes
-import tempfile
-import sys
-import time
 import traceback
+from concurrent.futures import Future
+import uuid
 
 from openai import OpenAI
 from google import genai
@@ -14,14 +14,23 @@ import base64
 from PIL import Image
 from PIL import ImageOps
 from urllib.parse import urlparse
-import requests
 from PIL import Image
 
 from app.SuccessObj import SuccessObj
-from app.tool.TenCentCloudTool import TenCentCloudTool
+from app.tool.ClientPoolTool import client_pool
+from app.tool.ImageFetchTool import image_fetcher
+from app.tool.ImagePrepTool import DEFAULT_MAX_INPUT_EDGE, prepare_image_bytes, sniff_image_mime
 from app.tool.DateTool import DateTool
 from app.tool.LogTool import LogTool
 from app.tool.ProjectResourceTool import ProjectResourceTool
+from app.tool.StorageTool import storage
+from app.tool.TenCentCloudTool import iter_base64_decoded
+from app.tool.VideoPollTool import video_poller
+from app.tool.ModelLimitTool import model_limiter
+from app.tool.ApiKeyPoolTool import api_key_pool
+from app.core.config import settings
+from app.core.executors import cpu_image_executor, image_gen_executor, storage_executor
+from contextlib import asynccontextmanager, contextmanager
 
 ai_models_config={
     "chat":{
@@ -33,16 +42,19 @@ ai_models_config={
     "gemini":{
         "gemini-2.5-flash-image":{
             "model_platform":"genai",
-            "if_image_radio":True
+            "if_image_radio":True,
+            "max_input_edge":1536
         },
         "gemini-2.5-flash-image-preview":{
             "model_platform":"genai",
-            "if_image_radio":True
+            "if_image_radio":True,
+            "max_input_edge":1536
         },
         "gemini-3-pro-image-preview":{
             "model_platform":"genai",
             "if_image_radio":True,
-            "if_image_size":True
+            "if_image_size":True,
+            "max_input_edge":2048
         }
     },
     "imagen":{
@@ -72,12 +84,23 @@ ai_models_config={
         },
         "veo-3.1-generate-preview":{
             "model_platform":"genai",
-            "gen_type": ["single_image","fl_image","multiple_image"]
+            "gen_type": ["single_image","fl_image","multiple_image"],
+            "max_input_edge":1920
         }
     }
 }
 
 
+MIME_EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/webp': '.webp',
+}
+
+# 视频流式下载/解码与分块上传的块大小
+VIDEO_STREAM_CHUNK_SIZE = 4 * 1024 * 1024
+
+
 def is_file_object(value):
     """判断是否为包含 name/type/body 的 File 对象（支持 dict 或对象）"""
     if isinstance(value, dict):
@@ -146,16 +169,33 @@ def choose_best_size_for_image(image: Image.Image, size_list):
             best_wh = (w, h)
     return best_size_str, best_wh
 
-def fetch_image_as_types_image(url: str) -> types.Image:
-    # 下载图片为 bytes，并尽量确定 mime_type
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    ct = r.headers.get("content-type")
+def get_max_input_edge(model):
+    """读取模型配置的参考图最长边，未配置时使用默认值"""
+    for group in ai_models_config.values():
+        if model in group:
+            return group[model].get("max_input_edge", DEFAULT_MAX_INPUT_EDGE)
+    return DEFAULT_MAX_INPUT_EDGE
+
+def get_model_limits(model):
+    """读取模型配置的并发上限与每分钟请求数（max_in_flight / rpm），未配置时返回 None；模型定义表中的限额由 model_limiter 优先使用"""
+    for group in ai_models_config.values():
+        if model in group:
+            return group[model].get("max_in_flight"), group[model].get("rpm")
+    return None, None
+
+def fetch_image_as_types_image(url, max_edge=None) -> types.Image:
+    # 下载图片为 bytes（走共享连接池与缓存），并尽量确定 mime_type；已下载的 {name,type,body} 直接使用
+    if isinstance(url, dict) and is_file_object(url):
+        image_bytes, ct, url = url['body'], url['type'], url['name']
+    else:
+        image_bytes, ct = image_fetcher.fetch(url)
+    if max_edge:
+        image_bytes, ct, _ = prepare_image_bytes(image_bytes, max_edge)
     if not ct or not ct.startswith("image/"):
         # 退化策略：通过扩展名猜测
         guess = mimetypes.guess_type(url)[0]
         ct = guess if guess and guess.startswith("image/") else "image/png"
-    return types.Image(image_bytes=r.content, mime_type=ct)
+    return types.Image(image_bytes=image_bytes, mime_type=ct)
 
 
 class AiHubMixTool:
@@ -170,16 +210,25 @@ class AiHubMixTool:
         self.base_url = None
         self.gemini_base_url = None
         self.api_key = None
+        # 同一 key_name 下配置的多个 Key，每次上游调用从池中选择
+        self.key_pool = None
+        self.client_type = None
+        self.client_base_url = None
+        self.client_api_key = None
         self.projectResourceTool = None
-        self.tenCentCloudClient = None
+        # 生成结果/临时文件的存储后端（默认 Settings.STORAGE_BACKEND）
+        self.storage = storage
         self.session = None
         self.dateTool = DateTool()
-
+        # 最近一次请求中参考图预处理节省的字节数
+        self.input_bytes_saved = 0
+        # 限流排队时的租户标识（团队/授权码），同一租户的请求与其他租户轮转放行
+        self.tenant = None
 
     def init(self, key_name):
         log = self.log
         log.debug('初始化AiHubMixTool')
-        self.session = self.session if self.session else requests.Session()
+        self.session = self.session if self.session else client_pool.get_session('AiHubMix')
         if not self.projectResourceTool:
             log.debug('没有发现projectResourceTool缓存实例，进行缓存初始化实例')
             self.projectResourceTool = ProjectResourceTool(log=log)
@@ -188,40 +237,88 @@ class AiHubMixTool:
         # apollo配置参数
         param = "conf/apikey.json"
         jsonData = self.projectResourceTool.get(param)
-        log.info(jsonData)
-        self.api_key = jsonData["AiHubMix"]["keys"][key_name]["value"]
+        key_config = jsonData["AiHubMix"]["keys"][key_name]
+        self.api_key = key_config["value"]
+        self.key_pool = api_key_pool.get(key_name, key_config)
         self.base_url = jsonData["AiHubMix"]["base_url"]
         self.gemini_base_url = jsonData["AiHubMix"]["gemini_base_url"]
         return self
 
     def init_client(self, api_key=None, base_url=None, type="openai"):
         self.log.debug('进入OpenAITool.init_client')
-        self.tenCentCloudClient = TenCentCloudTool().init("1325210923").buildClient("ap-guangzhou")
         if type == 'openai':
             self.log.debug('openAI调用')
-            client = OpenAI(
+            client = client_pool.get_ai_client(
                 api_key=api_key if api_key else self.api_key,
                 base_url=base_url if base_url else self.base_url,
-                default_headers={
-                    "APP-Code": "LTMI0901"
-                }
+                type='openai'
             )
         elif type == 'genai':
             self.log.debug('genai调用')
-            client = genai.Client(
+            client = client_pool.get_ai_client(
                 api_key=api_key if api_key else self.api_key,
-                http_options={"base_url": base_url if base_url else self.gemini_base_url,"headers":{"APP-Code": "LTMI0901"}},
+                base_url=base_url if base_url else self.gemini_base_url,
+                type='genai'
             )
         else:
             return None
         self.client = client
+        self.client_type = type
+        self.client_api_key = api_key if api_key else self.api_key
+        self.client_base_url = base_url if base_url else (self.base_url if type == 'openai' else self.gemini_base_url)
+        if api_key:
+            # 显式指定 Key 时不走 Key 池
+            self.key_pool = None
         return self
 
-    def _resolve_image_urls(self, image_urls):
+    def client_for_key(self, api_key=None):
+        """获取指定 Key 的共享客户端（视频任务需用提交时的 Key 查询结果）"""
+        if not api_key or api_key == self.api_key or self.client_type is None:
+            return self.client
+        return client_pool.get_ai_client(api_key=api_key, base_url=self.client_base_url, type=self.client_type)
+
+    def async_client_for_key(self, api_key=None):
+        """获取指定 Key 的共享异步客户端，默认使用 init_client 时的 Key"""
+        return client_pool.get_async_ai_client(
+            api_key=api_key or self.client_api_key or self.api_key,
+            base_url=self.client_base_url,
+            type=self.client_type,
+        )
+
+    def for_tenant(self, tenant):
+        self.tenant = tenant
+        return self
+
+    @contextmanager
+    def upstream_call(self, model):
+        """
+        一次上游调用：按模型限制并发与每分钟请求数，并从 Key 池选择 Key。
+        :return: (client, api_key)
+        """
+        max_in_flight, rpm = get_model_limits(model)
+        with model_limiter.slot(model, self.tenant, max_in_flight=max_in_flight, rpm=rpm):
+            if self.key_pool is None or self.client_type is None:
+                yield self.client, self.api_key
+                return
+            with api_key_pool.lease(self.key_pool) as member:
+                yield self.client_for_key(member.value), member.value
+
+    @asynccontextmanager
+    async def aupstream_call(self, model):
+        """upstream_call 的异步版本，返回异步客户端；排队等待时让出事件循环"""
+        max_in_flight, rpm = get_model_limits(model)
+        async with model_limiter.aslot(model, self.tenant, max_in_flight=max_in_flight, rpm=rpm):
+            if self.key_pool is None or self.client_type is None:
+                yield self.async_client_for_key(), self.client_api_key or self.api_key
+                return
+            with api_key_pool.lease(self.key_pool) as member:
+                yield self.async_client_for_key(member.value), member.value
+
+    def _resolve_image_urls(self, image_urls, model=None):
         """
         将传入的 image_urls（可为字符串或列表）统一转换为可用的字符串列表：
         - 远程 URL（http/https/data）原样返回；
-        - 本地路径读取为 base64 并转为 data:image/jpeg;base64,{...}。
+        - 本地路径经预处理（缩放/去元数据/重新编码）后转为 data:{真实mime};base64,{...}。
         出错项记录日志并跳过。
         """
         if not image_urls:
@@ -234,177 +331,329 @@ class AiHubMixTool:
                 if isinstance(item, str) and (item.startswith("http://") or item.startswith("https://") or item.startswith("data:")):
                     resolved.append(item)
                 else:
-                    with open(item, "rb") as f:
-                        base64_image = base64.b64encode(f.read()).decode("utf-8")
-                    resolved.append(f"data:image/jpeg;base64,{base64_image}")
+                    image_bytes, mime_type = self.prepare_reference_image(item, model)
+                    base64_image = base64.b64encode(image_bytes).decode("utf-8")
+                    resolved.append(f"data:{mime_type};base64,{base64_image}")
             except Exception as e:
                 self.log.error(f"处理图片失败: {item}, {e}")
         return resolved
 
+    def _prefetch_references(self, images):
+        """
+        并发下载参考图 URL，替换为 {name, type, body} 对象，后续预处理只做解码/缩放。
+        下载失败的项保持原样。
+        """
+        images = list(images or [])
+        urls = [image for image in images if is_url(image)]
+        if not urls:
+            return images
+        fetched = dict(zip(urls, image_fetcher.fetch_many(urls)))
+        prefetched = []
+        for image in images:
+            result = fetched.get(image) if is_url(image) else None
+            if result is None or isinstance(result, Exception):
+                prefetched.append(image)
+                continue
+            image_bytes, content_type = result
+            name = os.path.basename(urlparse(image).path) or 'image.png'
+            prefetched.append({
+                'name': name,
+                'type': content_type or mimetypes.guess_type(name)[0] or 'image/png',
+                'body': image_bytes,
+            })
+        return prefetched
+
+    def _build_chat_request(self, model, search_type=None, system_user_role_prompt=None, user_prompt='', images=None):
+        """
+        构造 chat 请求（参考图转换、OCR 文件上传等阻塞操作在此完成）。
+        :return: ('responses' | 'completions', 请求参数)；search_type 无效时返回 (None, 错误信息)
+        """
+        if 'OCR' in model and images:
+            images = self.process_files(images)
+
+        if 'gpt' in model and 'search' not in model and search_type == 'isModelSearch':
+            self.log.debug("-------触发特殊条件判断-------")
+            self.log.debug("该为gpt系列非search模型内置搜索")
+            input = [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "input_text", "text": user_prompt}
+                    ]
+                }
+            ]
+            if system_user_role_prompt:
+                self.log.debug("发现系统用户设定")
+                input.insert(0, {"role":"system","content":[{"type":"input_text","text":system_user_role_prompt}]})
+            for message in input:
+                if message["role"] == "user" and images:
+                    for item in self._resolve_image_urls(images, model):
+                        message["content"].append({"type": "input_image", "image_url": item})
+            return 'responses', {
+                "model": model,
+                "tools": [{ "type": "web_search_preview" }],
+                "input": input
+            }
+
+        self.log.debug("-------正常逻辑-------")
+        params = {
+            "model": model,
+            "messages": [{
+                "role": "user"
+            }],
+        }
+        if user_prompt:
+            params['messages'][0]['content'] = [{"type": "text", "text": user_prompt}]
+        if system_user_role_prompt:
+            self.log.debug("发现系统用户设定")
+            params['messages'].insert(0, {"role":"system","content":[{"type":"text","text":system_user_role_prompt}]})
+        if search_type:
+            if search_type == 'isModelSearch':
+                self.log.debug('模型搜索模式')
+                params["web_search_options"] = {}
+            else:
+                return None, '无效search_type值'
+        if images:
+            for item in self._resolve_image_urls(images, model):
+                if 'content' in params['messages']:
+                    params['messages'][0]["content"].append({
+                        "type": "image_url",
+                        "image_url": {"url": item}
+                    })
+                else:
+                    params['messages'][0]['content'] = [{"type": "image_url","image_url": {"url": item}}]
+        self.log.debug('请求参数：')
+        self.log.info(params)
+        return 'completions', params
+
+    def _parse_chat_response(self, kind, response, search_type=None):
+        """解析 chat 响应，返回 (是否成功, 数据)"""
+        if kind == 'completions':
+            return True, response.choices[0].message.content
+        self.log.debug(response.status)
+        self.log.info(response)
+        if response.status != 'completed':
+            return False, f'响应失败，失败状态为{response.status}'
+        if search_type:
+            if search_type == 'isModelSearch':
+                self.log.debug('模型搜索模式')
+                return True, response.output[-1].content[0].text
+            return False, '无效search_type值'
+        self.log.debug('基础模式')
+        return True, response.output[0].content[0].text
+
     def chat(self, model, search_type=None, system_user_role_prompt=None, user_prompt='', images=None, user_history=None, **kwargs):
         self.log.debug('进入OpenAITool.text')
         sObj = SuccessObj()
         sObj.success = False
 
         try:
-            if 'OCR' in model and images:
-                images = self.process_files(images)
-
-            if 'gpt' in model and 'search' not in model and search_type == 'isModelSearch':
-                self.log.debug("-------触发特殊条件判断-------")
-                self.log.debug("该为gpt系列非search模型内置搜索")
-                input = [
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "input_text", "text": user_prompt}
-                        ]
-                    }
-                ]
-                if system_user_role_prompt:
-                    self.log.debug("发现系统用户设定")
-                    input.insert(0, {"role":"system","content":[{"type":"input_text","text":system_user_role_prompt}]})
-                for message in input:
-                    if message["role"] == "user" and images:
-                        for item in self._resolve_image_urls(images):
-                            message["content"].append({"type": "input_image", "image_url": item})
-                response = self.client.responses.create(
-                    model=model,
-                    tools=[{ "type": "web_search_preview" }],
-                    input=input
-                )
-                self.log.debug(response.status)
-                self.log.info(response)
-                if response.status == 'completed':
-                    if search_type:
-                        if search_type == 'isModelSearch':
-                            self.log.debug('模型搜索模式')
-                            sObj.data = response.output[-1].content[0].text
-                            sObj.success = True
-                        else:
-                            sObj.data = '无效search_type值'
-                            return sObj.dic()
-                    else:
-                        self.log.debug('基础模式')
-                        sObj.success = True
-                        sObj.data = response.output[0].content[0].text
+            kind, params = self._build_chat_request(model, search_type, system_user_role_prompt, user_prompt, images)
+            if kind is None:
+                sObj.data = params
+                return sObj.dic()
+            with self.upstream_call(model) as (client, _):
+                if kind == 'responses':
+                    response = client.responses.create(**params)
                 else:
-                    sObj.data = f'响应失败，失败状态为{response.status}'
+                    response = client.chat.completions.create(**params)
+            sObj.success, sObj.data = self._parse_chat_response(kind, response, search_type)
+        except Exception as e:
+            self.log.error(f'chat调用失败：{traceback.format_exc()}')
+            sObj.data = str(e)
+        return sObj.dic()
+
+    async def achat(self, model, search_type=None, system_user_role_prompt=None, user_prompt='', images=None, user_history=None, **kwargs):
+        """chat 的异步版本：上游调用使用异步客户端，等待响应期间不占用线程"""
+        self.log.debug('进入OpenAITool.achat')
+        sObj = SuccessObj()
+        sObj.success = False
+
+        try:
+            if images:
+                # 参考图读取/转换是阻塞操作，放到线程池执行
+                kind, params = await storage_executor.run(
+                    self._build_chat_request, model, search_type, system_user_role_prompt, user_prompt, images
+                )
             else:
-                self.log.debug("-------正常逻辑-------")
-                params = {
-                    "model": model,
-                    "messages": [{
-                        "role": "user"
-                    }],
-                }
-                if user_prompt:
-                    params['messages'][0]['content'] = [{"type": "text", "text": user_prompt}]
-                if system_user_role_prompt:
-                    self.log.debug("发现系统用户设定")
-                    params['messages'].insert(0, {"role":"system","content":[{"type":"text","text":system_user_role_prompt}]})
-                if search_type:
-                    if search_type == 'isModelSearch':
-                        self.log.debug('模型搜索模式')
-                        params["web_search_options"] = {}
-                    else:
-                        sObj.success = False
-                        sObj.data = '无效search_type值'
-                        return sObj.dic()
-                if images:
-                    for item in self._resolve_image_urls(images):
-                        if 'content' in params['messages']:
-                            params['messages'][0]["content"].append({
-                                "type": "image_url",
-                                "image_url": {"url": item}
-                            })
-                        else:
-                            params['messages'][0]['content'] = [{"type": "image_url","image_url": {"url": item}}]
-                self.log.debug('请求参数：')
-                self.log.info(params)
-                response = self.client.chat.completions.create(**params)
-                sObj.success = True
-                sObj.data = response.choices[0].message.content
+                kind, params = self._build_chat_request(model, search_type, system_user_role_prompt, user_prompt)
+            if kind is None:
+                sObj.data = params
+                return sObj.dic()
+            async with self.aupstream_call(model) as (client, _):
+                if kind == 'responses':
+                    response = await client.responses.create(**params)
+                else:
+                    response = await client.chat.completions.create(**params)
+            sObj.success, sObj.data = self._parse_chat_response(kind, response, search_type)
         except Exception as e:
-            tb = traceback.format_exc()
-            # 可以把tb记录日志
-            print(tb)  # 这里是举例，你可以写到日志
+            self.log.error(f'achat调用失败：{traceback.format_exc()}')
             sObj.data = str(e)
         return sObj.dic()
 
-    def image(self, model,user_prompt, images=[], image_name=None, user_history=None, gen_ratio=None, image_size="1K" ,gen_number=1, reqParam=None, **kwargs):
+    def _upload_submitter(self, image_name=None, overlap_upload=True, on_result=None):
+        """
+        返回 submit_upload(image_bytes, mime_type, index)：
+        overlap_upload 时上传交给上传线程池并返回 Future，生成可继续进行；否则同步上传并返回 Location
+        """
+        def notify(index, location):
+            if on_result is None or not location:
+                return
+            try:
+                on_result(index, location)
+            except Exception as e:
+                self.log.error(f'图片结果回调失败：{e}')
+
+        def submit_upload(image_bytes, mime_type, index):
+            if overlap_upload:
+                # 上传交给存储线程池，实现第k张上传与第k+1张生成重叠
+                future = storage_executor.submit(self._upload_generated_image, image_bytes, mime_type, image_name)
+                if on_result is not None:
+                    future.add_done_callback(lambda f: notify(index, None if f.exception() else f.result()))
+                return future
+            location = self._upload_generated_image(image_bytes, mime_type, image_name)
+            notify(index, location)
+            return location
+
+        return submit_upload
+
+    def _run_lanes(self, func, count, workers):
+        """
+        把 count 个任务按序号分成 workers 条通道，第 0 条在当前线程执行，其余提交到共享的生成线程池，
+        返回按序号排列的结果
+        """
+        def run_lane(lane):
+            return [(index, func(index)) for index in range(lane, count, workers)]
+
+        futures = [image_gen_executor.submit(run_lane, lane) for lane in range(1, workers)]
+        results = dict(run_lane(0))
+        for future in futures:
+            results.update(future.result())
+        return [results[index] for index in range(count)]
+
+    def _collect_uploads(self, pending):
+        locations = []
+        for item in pending:
+            try:
+                location = item.result() if isinstance(item, Future) else item
+            except Exception as e:
+                self.log.error(f'生成图片上传失败：{e}')
+                location = None
+            if location:
+                locations.append(location)
+        return locations
+
+    async def _acollect_uploads(self, pending):
+        locations = []
+        for item in pending:
+            try:
+                location = await asyncio.wrap_future(item) if isinstance(item, Future) else item
+            except Exception as e:
+                self.log.error(f'生成图片上传失败：{e}')
+                location = None
+            if location:
+                locations.append(location)
+        return locations
+
+    def _build_gemini_request(self, model, user_prompt, images, gen_ratio=None, image_size="1K"):
+        """下载并预处理参考图，返回 (contents, config)"""
+        config = types.GenerateContentConfig(
+            image_config=types.ImageConfig(
+                aspect_ratio=gen_ratio,
+                image_size=image_size
+            )
+        )
+        contents = [user_prompt]
+        # 先并发下载全部参考图，再按顺序预处理
+        images = self._prefetch_references(images)
+        self.input_bytes_saved = 0
+        for image in images:
+            image_bytes, mime_type = self.prepare_reference_image(image, model)
+            contents.append(types.Part.from_bytes(data=image_bytes, mime_type=mime_type))
+        self.log.debug('最终contents：')
+        self.log.info(contents)
+        return contents, config if gen_ratio else None
+
+    def _gemini_parts(self, response, index, submit_upload):
+        """提交响应中的图片上传，返回 (文本, 待收集的上传结果)"""
+        text, pending = None, []
+        for part in response.candidates[0].content.parts:
+            if part.text is not None:
+                self.log.info(part.text)
+                text = part.text
+            elif part.inline_data is not None:
+                pending.append(submit_upload(part.inline_data.data, part.inline_data.mime_type, index))
+        return text, pending
+
+    @staticmethod
+    def _imagen_config(gen_number, gen_ratio, image_size):
+        return types.GenerateImagesConfig(
+            number_of_images=gen_number,
+            aspectRatio=gen_ratio,
+            image_size= image_size
+        )
+
+    def image(self, model,user_prompt, images=[], image_name=None, user_history=None, gen_ratio=None, image_size="1K" ,gen_number=1, reqParam=None, gen_parallelism=None, overlap_upload=True, on_result=None, **kwargs):
+        """
+        :param on_result: 每张图片上传完成后立即回调 on_result(序号, Location)，用于流式返回
+        """
         self.log.debug('进入OpenAITool.image')
         sObj = SuccessObj()
         sObj.success = False
         result_images = []
+        submit_upload = self._upload_submitter(image_name, overlap_upload, on_result)
+
         try:
             if model in ai_models_config['gemini']:
                 self.log.debug('正在执行：gemini image图片生成')
-                config = types.GenerateContentConfig(
-                    image_config=types.ImageConfig(
-                        aspect_ratio=gen_ratio,
-                        image_size=image_size
-                    )
-                )
-                contents = [user_prompt]
-                for image in images:
-                    imageO = self.load_image(image)
-                    contents.append(imageO)
-                self.log.debug('最终contents：')
-                self.log.info(contents)
-                for i in range(gen_number):
-                    response = self.client.models.generate_content(
-                        model=model,
-                        contents=contents,
-                        config=config if gen_ratio else None
-                    )
-                    for part in response.candidates[0].content.parts:
-                        if part.text is not None:
-                            self.log.info(part.text)
-                            sObj.data = part.text
-                        elif part.inline_data is not None:
-                            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-                                tmp_file.write(part.inline_data.data)
-                                tmp_path = tmp_file.name
-                            self.log.info(tmp_path)  # 现在你有了文件路径
-                            new_image_name = image_name if image_name else get_file_name_and_ext(tmp_path)[0]
-                            sObj.success = True
-                            data = self.tenCentCloudClient.upload_file(bucket="yh-server-1325210923", file=tmp_path, fileName=f'AiHubMix/image/{self.dateTool.getDateStr("%Y-%m-%d")}/{new_image_name}')
-                            if data['success']:
-                                sObj.data = data['data']['Location']
-                                result_images.append(data['data']['Location'])
-                            os.remove(tmp_path)
-                sObj.data = result_images
+                contents, config = self._build_gemini_request(model, user_prompt, images, gen_ratio, image_size)
+
+                def generate_one(index):
+                    self.log.debug(f'gemini第{index + 1}/{gen_number}张开始生成')
+                    with self.upstream_call(model) as (client, _):
+                        response = client.models.generate_content(
+                            model=model,
+                            contents=contents,
+                            config=config
+                        )
+                    return self._gemini_parts(response, index, submit_upload)
+
+                def safe_generate_one(index):
+                    try:
+                        return generate_one(index)
+                    except Exception as e:
+                        self.log.error(f'gemini第{index + 1}/{gen_number}张生成失败：{e}')
+                        return str(e), None
+
+                # 多张并发生成，结果按序号顺序汇总；部分失败时返回已成功的图片
+                workers = max(1, min(gen_number, gen_parallelism or settings.IMAGE_GEN_PARALLELISM))
+                self.log.info(f'gemini生成数量：{gen_number}，并发数：{workers}')
+                outcomes = self._run_lanes(safe_generate_one, gen_number, workers)
+                last_message = None
+                for text, pending in outcomes:
+                    if text:
+                        last_message = text
+                    result_images.extend(self._collect_uploads(pending or []))
+                if result_images:
+                    sObj.success = True
+                    sObj.data = result_images
+                else:
+                    sObj.data = last_message or result_images
             elif model in ai_models_config['imagen']:
                 self.log.debug('正在执行：imagen图片生成')
-                response = self.client.models.generate_images(
-                    model=model,
-                    prompt=user_prompt,
-                    config=types.GenerateImagesConfig(
-                        number_of_images=gen_number,
-                        aspectRatio=gen_ratio,
-                        image_size= image_size
+                with self.upstream_call(model) as (client, _):
+                    response = client.models.generate_images(
+                        model=model,
+                        prompt=user_prompt,
+                        config=self._imagen_config(gen_number, gen_ratio, image_size)
                     )
-                )
                 self.log.info(response)
                 if response.generated_images:
-                    for generated_image in response.generated_images:
-                        # 假设 generated_image 是你的对象
-                        image_bytes = generated_image.image.image_bytes
-                        mime_type = generated_image.image.mime_type  # e.g. 'image/png'
-                        # 决定文件扩展名
-                        ext = 'png' if mime_type == 'image/png' else 'jpg'  # 可根据需要扩展支持
-                        # 创建临时文件
-                        with tempfile.NamedTemporaryFile(suffix=f'.{ext}', delete=False) as tmp_file:
-                            tmp_file.write(image_bytes)
-                            tmp_path = tmp_file.name  # 保存临时文件路径
-                        self.log.info(tmp_path)  # 现在你有了文件路径
-                        new_image_name = image_name if image_name else get_file_name_and_ext(tmp_path)[0]
-                        sObj.success = True
-                        data = self.tenCentCloudClient.upload_file(bucket="yh-server-1325210923", file=tmp_path,fileName=f'AiHubMix/image/{self.dateTool.getDateStr("%Y-%m-%d")}/{new_image_name}')
-                        if data['success']:
-                            result_images.append(data['data']['Location'])
-                        os.remove(tmp_path)
+                    pending = [
+                        submit_upload(generated_image.image.image_bytes, generated_image.image.mime_type, index)
+                        for index, generated_image in enumerate(response.generated_images)
+                    ]
+                    result_images.extend(self._collect_uploads(pending))
                     sObj.data = result_images
                     sObj.success = True
                 else:
@@ -419,173 +668,386 @@ class AiHubMixTool:
                 sObj.data = result['data']
                 self.log.debug('开始执行：统一智能绘图图片生成')
         except Exception as e:
-            tb = traceback.format_exc()
-            # 可以把tb记录日志
-            print(tb)  # 这里是举例，你可以写到日志
+            self.log.error(f'image调用失败：{traceback.format_exc()}')
             sObj.data = str(e)
         return sObj.dic()
 
+    async def aimage(self, model, user_prompt, images=[], image_name=None, user_history=None, gen_ratio=None, image_size="1K", gen_number=1, reqParam=None, gen_parallelism=None, on_result=None, **kwargs):
+        """
+        image 的异步版本：上游调用使用异步客户端，多张图片以协程并发生成；
+        参考图预处理与生成图片上传仍在线程池执行。
+        """
+        self.log.debug('进入OpenAITool.aimage')
+        sObj = SuccessObj()
+        sObj.success = False
+        result_images = []
+        submit_upload = self._upload_submitter(image_name, True, on_result)
+
+        try:
+            if model in ai_models_config['gemini']:
+                self.log.debug('正在执行：gemini image图片生成（异步）')
+                # 下载在 storage-io 线程池，解码/缩放在 cpu-image 线程池
+                images = await storage_executor.run(self._prefetch_references, images)
+                contents, config = await cpu_image_executor.run(
+                    self._build_gemini_request, model, user_prompt, images, gen_ratio, image_size
+                )
+                workers = max(1, min(gen_number, gen_parallelism or settings.IMAGE_GEN_PARALLELISM))
+                semaphore = asyncio.Semaphore(workers)
+                self.log.info(f'gemini生成数量：{gen_number}，并发数：{workers}')
+
+                async def generate_one(index):
+                    async with semaphore:
+                        self.log.debug(f'gemini第{index + 1}/{gen_number}张开始生成')
+                        try:
+                            async with self.aupstream_call(model) as (client, _):
+                                response = await client.models.generate_content(
+                                    model=model,
+                                    contents=contents,
+                                    config=config
+                                )
+                            return self._gemini_parts(response, index, submit_upload)
+                        except Exception as e:
+                            self.log.error(f'gemini第{index + 1}/{gen_number}张生成失败：{e}')
+                            return str(e), None
+
+                outcomes = await asyncio.gather(*(generate_one(i) for i in range(gen_number)))
+                last_message = None
+                for text, pending in outcomes:
+                    if text:
+                        last_message = text
+                    result_images.extend(await self._acollect_uploads(pending or []))
+                if result_images:
+                    sObj.success = True
+                    sObj.data = result_images
+                else:
+                    sObj.data = last_message or result_images
+            elif model in ai_models_config['imagen']:
+                self.log.debug('正在执行：imagen图片生成（异步）')
+                async with self.aupstream_call(model) as (client, _):
+                    response = await client.models.generate_images(
+                        model=model,
+                        prompt=user_prompt,
+                        config=self._imagen_config(gen_number, gen_ratio, image_size)
+                    )
+                self.log.info(response)
+                if response.generated_images:
+                    pending = [
+                        submit_upload(generated_image.image.image_bytes, generated_image.image.mime_type, index)
+                        for index, generated_image in enumerate(response.generated_images)
+                    ]
+                    result_images.extend(await self._acollect_uploads(pending))
+                    sObj.data = result_images
+                    sObj.success = True
+                else:
+                    sObj.data = "无效图片，请检查提示词规范或尝试再次生成！"
+            else:
+                param = {
+                    "prompt": user_prompt
+                }
+                param.update(reqParam)
+                result = await self.areq(model, param)
+                sObj.success = result['success']
+                sObj.data = result['data']
+        except Exception as e:
+            self.log.error(f'aimage调用失败：{traceback.format_exc()}')
+            sObj.data = str(e)
+        return sObj.dic()
+
+    def _upload_generated_image(self, image_bytes, mime_type=None, image_name=None):
+        """直接从内存上传生成的图片，返回 Location，失败返回 None"""
+        ext = MIME_EXTENSIONS.get(mime_type or 'image/png', '.png')
+        new_image_name = image_name if image_name else f'{uuid.uuid4().hex}{ext}'
+        data = self.storage.put_bytes(
+            f'AiHubMix/image/{self.dateTool.getDateStr("%Y-%m-%d")}/{new_image_name}',
+            image_bytes,
+            content_type=mime_type or 'image/png',
+            deferred=True,
+        )
+        if data['success']:
+            return data['data']['Location']
+        self.log.error(f"生成图片上传失败：{data['data']}")
+        return None
+
     def video(self, model, user_prompt="Generate video", negative_prompt = None, size=None,images=[], gen_type=None, **kwargs):
+        """同步生成视频：提交后交由 video_poller 统一轮询，当前线程只等待结果"""
+        return self.video_async(model, user_prompt, negative_prompt=negative_prompt, size=size, images=images, gen_type=gen_type, **kwargs).result()
+
+    def video_async(self, model, user_prompt="Generate video", negative_prompt = None, size=None,images=[], gen_type=None, callback=None, **kwargs):
+        """
+        提交视频任务并立即返回 Future，结果与 video() 返回值一致。
+        :param callback: 任务结束后以结果字典回调 callback(result)
+        """
         self.log.debug('进入OpenAITool.video')
         self.log.info(f"扩展参数值：{kwargs}")
+        future = Future()
+        try:
+            with self.upstream_call(model) as (client, api_key):
+                handle = self.submit_video(model, user_prompt, negative_prompt=negative_prompt, size=size, images=images, gen_type=gen_type, client=client, **kwargs)
+            if isinstance(handle, dict) and 'id' in handle:
+                handle['api_key'] = api_key
+        except Exception as e:
+            self.log.error(f'视频任务提交失败：{traceback.format_exc()}')
+            handle = None
+            future.set_result(self._video_failure(str(e)))
+        if handle is not None:
+            if isinstance(handle, dict) and 'success' in handle:
+                future.set_result(handle)
+            else:
+                tracked = video_poller.track(
+                    handle['id'],
+                    check=lambda: self.check_video(handle),
+                    on_done=lambda payload: self.finalize_video(handle, payload),
+                )
+                tracked.add_done_callback(lambda f: self._settle_video_future(future, f))
+        if callback is not None:
+            future.add_done_callback(lambda f: callback(f.result()))
+        return future
+
+    async def avideo(self, model, user_prompt="Generate video", negative_prompt = None, size=None,images=[], gen_type=None, **kwargs):
+        """
+        video 的异步版本：提交与状态查询使用异步客户端，在当前事件循环中按退避间隔轮询，
+        等待期间不占用线程；完成后的下载/上传仍在轮询器线程池中执行。
+        """
+        self.log.debug('进入OpenAITool.avideo')
+        try:
+            async with self.aupstream_call(model) as (client, api_key):
+                handle = await self.asubmit_video(model, user_prompt, negative_prompt=negative_prompt, size=size, images=images, gen_type=gen_type, client=client, **kwargs)
+            if isinstance(handle, dict) and 'id' in handle:
+                handle['api_key'] = api_key
+        except Exception as e:
+            self.log.error(f'视频任务提交失败：{traceback.format_exc()}')
+            return self._video_failure(str(e))
+        if 'success' in handle:
+            return handle
+
+        async def check():
+            return await self.acheck_video(handle)
+
+        try:
+            return await video_poller.watch(
+                handle['id'],
+                check=check,
+                on_done=lambda payload: self.finalize_video(handle, payload),
+            )
+        except Exception as e:
+            self.log.error(f'视频任务失败：{e}')
+            return self._video_failure(str(e))
+
+    def _video_failure(self, message):
         sObj = SuccessObj()
         sObj.success = False
+        sObj.data = message
+        return sObj.dic()
+
+    def _settle_video_future(self, future, tracked):
         try:
-            if model in ai_models_config['video']:
-                if ai_models_config['video'][model]['model_platform'] == "openai":
-                    self.log.debug('执行OpenAI视频接口')
-                    if gen_type == "single_image":
-                        if size is None:
-                            self.log.debug('发现空size，计算图像size')
-                            image = self.load_image(images[0])
-                            # 2. 选最合适输出尺寸
-                            size, (w, h) = choose_best_size_for_image(image, ai_models_config['video'][model]['size_choices'])
-                            self.log.info(f"得到最佳size:{size}")
-                            image = self.load_image(images[0], resize_to=(w, h), as_bytes=True)
-                        else:
-
-                            image = self.load_image(images[0], as_bytes=True)
-                        video = self.client.videos.create(
-                            model=model,
-                            prompt=user_prompt,
-                            input_reference=image,
-                            size=size
-                        )
-                        progress = getattr(video, "progress", 0)
-                        bar_length = 30
-                        while video.status in ("in_progress", "queued"):
-                            self.log.debug('循环获取视频')
-                            # Refresh status
-                            video = self.client.videos.retrieve(video.id)
-                            self.log.info(f"视频结果状态：{video.status}")
-                            progress = getattr(video, "progress", 0)
-
-                            filled_length = int((progress / 100) * bar_length)
-                            bar = "=" * filled_length + "-" * (bar_length - filled_length)
-                            status_text = "Queued" if video.status == "queued" else "Processing"
-                            sys.stdout.write(f"{status_text}: [{bar}]{progress: .1f} % ")
-                            sys.stdout.flush()
-                            # 重点：状态如果已经不是 in_progress/queued 了，不要 sleep 了!
-                            if video.status not in ("in_progress", "queued"):
-                                self.log.debug("成功获取视频，退出循环！")
-                                time.sleep(5)
-                                break  # 直接退出循环
-                            time.sleep(60)
-                        if video.status == "failed":
-                            message = getattr(
-                                getattr(video, "error", None), "message", "Video generation failed"
-                            )
-                            self.log.error(message)
-                            sObj.data = message
-                        else:
-                            self.log.debug("Downloading video content...")
-                            content = self.client.videos.download_content(video.id, variant="video")
-                            self.log.info(content)
-                            content.write_to_file(f"{video.id}.mp4")
-                            self.log.debug(f"Wrote {video.id}.mp4")
-                            data = self.tenCentCloudClient.upload_file(bucket="yh-server-1325210923", file=f"{video.id}.mp4", fileName=f'AiHubMix/video/{self.dateTool.getDateStr("%Y-%m-%d")}/{video.id}.mp4')
-                            if data['success']:
-                                sObj.data = data['data']['Location']
-                            os.remove(f"{video.id}.mp4")
-                            sObj.success = True
-                elif ai_models_config['video'][model]['model_platform'] == "genai":
-                    self.log.debug('执行Google Genai视频接口')
-                    param = {}
-                    if images:
-                        if gen_type == 'single_image':
-                            self.log.debug("单图模式")
-                            operation = self.client.models.generate_videos(
-                                model=model,
-                                prompt=user_prompt,
-                                image=fetch_image_as_types_image(images[0]),
-                                config=types.GenerateVideosConfig(
-                                    number_of_videos=1,
-                                    aspect_ratio=kwargs['aspectRatio'] if 'aspectRatio' in kwargs and kwargs['aspectRatio'] else "16:9",
-                                    resolution = kwargs['resolution'] if 'resolution' in kwargs and kwargs['resolution'] else "720p",
-                                    duration_seconds = kwargs['durationSeconds'] if 'durationSeconds' in kwargs and kwargs['durationSeconds'] else "6",
-                                    negative_prompt = negative_prompt if negative_prompt else None,
-                                    person_generation="allow_adult"
-                                )
-                            )
-                        elif gen_type == 'fl_image':
-                            self.log.debug("首尾帧模式")
-                            operation = self.client.models.generate_videos(
-                                model="veo-3.1-generate-preview",
-                                prompt=user_prompt,
-                                image=fetch_image_as_types_image(images[0]),
-                                config=types.GenerateVideosConfig(
-                                    number_of_videos=1,
-                                    last_frame=fetch_image_as_types_image(images[1]),
-                                    aspect_ratio = kwargs['aspectRatio'] if 'aspectRatio' in kwargs and kwargs['aspectRatio'] else "16:9",
-                                    resolution = kwargs['resolution'] if 'resolution' in kwargs and kwargs['resolution'] else "720p",
-                                    duration_seconds=kwargs['durationSeconds'] if 'durationSeconds' in kwargs and kwargs['durationSeconds'] else "6",
-                                    negative_prompt = negative_prompt if negative_prompt else None,
-                                    person_generation="allow_adult"
-                                ),
-                            )
-                        else:
-                            self.log.debug("多图模式")
-                            converted_images = [fetch_image_as_types_image(img) for img in images]
-                            reference_images = [types.VideoGenerationReferenceImage(image=img,reference_type="asset")for img in converted_images]
-                            self.log.info(f"reference_images：{reference_images}")
-                            operation = self.client.models.generate_videos(
-                                model=model,
-                                prompt=user_prompt,
-                                config=types.GenerateVideosConfig(
-                                    reference_images=reference_images,
-                                    number_of_videos=1,
-                                    aspect_ratio=kwargs['aspectRatio'] if 'aspectRatio' in  kwargs and kwargs['aspectRatio'] else "16:9",
-                                    resolution = kwargs['resolution'] if 'resolution' in kwargs and kwargs['resolution'] else "720p",
-                                    duration_seconds=kwargs['durationSeconds'] if 'durationSeconds' in kwargs and kwargs['durationSeconds'] else "6",
-                                    negative_prompt = negative_prompt if negative_prompt else None,
-                                    person_generation="allow_adult"
-                                ),
-                            )
-                    else:
-                        self.log.debug('文本模式')
-                        operation = self.client.models.generate_videos(
-                            model=model,
-                            prompt=user_prompt,
-                            config=types.GenerateVideosConfig(
-                                number_of_videos=1,
-                                aspect_ratio=kwargs['aspectRatio'] if 'aspectRatio' in  kwargs and kwargs['aspectRatio'] else "16:9",
-                                resolution = kwargs['resolution'] if 'resolution' in kwargs and kwargs['resolution'] else "720p",
-                                duration_seconds=kwargs['durationSeconds'] if 'durationSeconds' in kwargs and kwargs['durationSeconds'] else "6",
-                                negative_prompt = negative_prompt if negative_prompt else None,
-                                person_generation="allow_all"
-                            ),
+            future.set_result(tracked.result())
+        except Exception as e:
+            self.log.error(f'视频任务失败：{e}')
+            future.set_result(self._video_failure(str(e)))
+
+    def _build_video_request(self, model, user_prompt="Generate video", negative_prompt = None, size=None,images=[], gen_type=None, **kwargs):
+        """
+        构造视频提交请求（参考图下载/缩放在此完成）。
+        :return: (platform, 请求参数)；参数无效时返回 (None, 失败结果字典)
+        """
+        if model not in ai_models_config['video']:
+            return None, self._video_failure('无效model')
+        platform = ai_models_config['video'][model]['model_platform']
+        if platform == "openai":
+            self.log.debug('执行OpenAI视频接口')
+            if gen_type != "single_image":
+                return None, self._video_failure('未支持的生成类型')
+            if size is None:
+                self.log.debug('发现空size，计算图像size')
+                image = self.load_image(images[0])
+                # 2. 选最合适输出尺寸
+                size, (w, h) = choose_best_size_for_image(image, ai_models_config['video'][model]['size_choices'])
+                self.log.info(f"得到最佳size:{size}")
+                image = self.load_image(images[0], resize_to=(w, h), as_bytes=True)
+            else:
+
+                image = self.load_image(images[0], as_bytes=True)
+            return platform, dict(
+                model=model,
+                prompt=user_prompt,
+                input_reference=image,
+                size=size
+            )
+        elif platform == "genai":
+            self.log.debug('执行Google Genai视频接口')
+            if images:
+                if gen_type == 'single_image':
+                    self.log.debug("单图模式")
+                    params = dict(
+                        model=model,
+                        prompt=user_prompt,
+                        image=fetch_image_as_types_image(images[0], get_max_input_edge(model)),
+                        config=types.GenerateVideosConfig(
+                            number_of_videos=1,
+                            aspect_ratio=kwargs['aspectRatio'] if 'aspectRatio' in kwargs and kwargs['aspectRatio'] else "16:9",
+                            resolution = kwargs['resolution'] if 'resolution' in kwargs and kwargs['resolution'] else "720p",
+                            duration_seconds = kwargs['durationSeconds'] if 'durationSeconds' in kwargs and kwargs['durationSeconds'] else "6",
+                            negative_prompt = negative_prompt if negative_prompt else None,
+                            person_generation="allow_adult"
                         )
-                    param['operationName'] = operation.name
-                    video_id = last_value = operation.name.split('/')[-1]
-                    result = self.req(model,param)
-                    # 耗时 2-3 分钟，视频时长 5-8s
-                    while not result['data'].get('done', False):
-                        time.sleep(60)
-                        result = self.req(model,param)
-                    if 'error' in result['data']:
-                        sObj.data = result['data']['error']
-                    elif 'videos' in result['data']['response']:
-                        b64_str = result['data']['response']['videos'][0]['bytesBase64Encoded']
-                        data = self.tenCentCloudClient.upload_file(bucket="yh-server-1325210923", file=b64_str,fileName=f'AiHubMix/video/{self.dateTool.getDateStr("%Y-%m-%d")}/{video_id}.mp4')
-                        if data['success']:
-                            sObj.data = data['data']['Location']
-                        sObj.success = True
-                    elif 'raiMediaFilteredReasons' in result['data']['response']:
-                        sObj.data = result['data']['response']['raiMediaFilteredReasons'][0]
-                    else:
-                        sObj.data = f"未知错误：{result['data']}"
+                    )
+                elif gen_type == 'fl_image':
+                    self.log.debug("首尾帧模式")
+                    images = self._prefetch_references(images[:2])
+                    params = dict(
+                        model="veo-3.1-generate-preview",
+                        prompt=user_prompt,
+                        image=fetch_image_as_types_image(images[0], get_max_input_edge(model)),
+                        config=types.GenerateVideosConfig(
+                            number_of_videos=1,
+                            last_frame=fetch_image_as_types_image(images[1], get_max_input_edge(model)),
+                            aspect_ratio = kwargs['aspectRatio'] if 'aspectRatio' in kwargs and kwargs['aspectRatio'] else "16:9",
+                            resolution = kwargs['resolution'] if 'resolution' in kwargs and kwargs['resolution'] else "720p",
+                            duration_seconds=kwargs['durationSeconds'] if 'durationSeconds' in kwargs and kwargs['durationSeconds'] else "6",
+                            negative_prompt = negative_prompt if negative_prompt else None,
+                            person_generation="allow_adult"
+                        ),
+                    )
                 else:
-                    sObj.data = '未支持的平台'
+                    self.log.debug("多图模式")
+                    images = self._prefetch_references(images)
+                    converted_images = [fetch_image_as_types_image(img, get_max_input_edge(model)) for img in images]
+                    reference_images = [types.VideoGenerationReferenceImage(image=img,reference_type="asset")for img in converted_images]
+                    self.log.info(f"reference_images：{reference_images}")
+                    params = dict(
+                        model=model,
+                        prompt=user_prompt,
+                        config=types.GenerateVideosConfig(
+                            reference_images=reference_images,
+                            number_of_videos=1,
+                            aspect_ratio=kwargs['aspectRatio'] if 'aspectRatio' in  kwargs and kwargs['aspectRatio'] else "16:9",
+                            resolution = kwargs['resolution'] if 'resolution' in kwargs and kwargs['resolution'] else "720p",
+                            duration_seconds=kwargs['durationSeconds'] if 'durationSeconds' in kwargs and kwargs['durationSeconds'] else "6",
+                            negative_prompt = negative_prompt if negative_prompt else None,
+                            person_generation="allow_adult"
+                        ),
+                    )
             else:
-                sObj.data='无效model'
-        except Exception as e:
-            tb = traceback.format_exc()
-            # 可以把tb记录日志
-            print(tb)  # 这里是举例，你可以写到日志
-            sObj.data = str(e)
+                self.log.debug('文本模式')
+                params = dict(
+                    model=model,
+                    prompt=user_prompt,
+                    config=types.GenerateVideosConfig(
+                        number_of_videos=1,
+                        aspect_ratio=kwargs['aspectRatio'] if 'aspectRatio' in  kwargs and kwargs['aspectRatio'] else "16:9",
+                        resolution = kwargs['resolution'] if 'resolution' in kwargs and kwargs['resolution'] else "720p",
+                        duration_seconds=kwargs['durationSeconds'] if 'durationSeconds' in kwargs and kwargs['durationSeconds'] else "6",
+                        negative_prompt = negative_prompt if negative_prompt else None,
+                        person_generation="allow_all"
+                    ),
+                )
+            return platform, params
+        return None, self._video_failure('未支持的平台')
+
+    @staticmethod
+    def _video_handle(model, platform, created):
+        if platform == 'openai':
+            return {'model': model, 'platform': platform, 'id': created.id}
+        # 耗时 2-3 分钟，视频时长 5-8s
+        return {'model': model, 'platform': platform, 'id': created.name.split('/')[-1], 'operationName': created.name}
+
+    def submit_video(self, model, user_prompt="Generate video", negative_prompt = None, size=None,images=[], gen_type=None, client=None, **kwargs):
+        """
+        提交视频生成任务，不等待结果。
+        :param client: 使用的上游客户端，默认为 self.client
+        :return: 任务句柄 {'model', 'platform', 'id'}；参数无效时返回失败结果字典
+        """
+        client = client or self.client
+        platform, params = self._build_video_request(model, user_prompt, negative_prompt=negative_prompt, size=size, images=images, gen_type=gen_type, **kwargs)
+        if platform is None:
+            return params
+        if platform == 'openai':
+            return self._video_handle(model, platform, client.videos.create(**params))
+        return self._video_handle(model, platform, client.models.generate_videos(**params))
+
+    async def asubmit_video(self, model, user_prompt="Generate video", negative_prompt = None, size=None,images=[], gen_type=None, client=None, **kwargs):
+        """submit_video 的异步版本，client 为异步客户端"""
+        # 下载在 storage-io 线程池，解码/缩放在 cpu-image 线程池
+        images = await storage_executor.run(self._prefetch_references, images)
+        platform, params = await cpu_image_executor.run(
+            self._build_video_request, model, user_prompt, negative_prompt=negative_prompt, size=size, images=images, gen_type=gen_type, **kwargs
+        )
+        if platform is None:
+            return params
+        client = client or self.async_client_for_key()
+        if platform == 'openai':
+            return self._video_handle(model, platform, await client.videos.create(**params))
+        return self._video_handle(model, platform, await client.models.generate_videos(**params))
+
+    def check_video(self, handle):
+        """查询一次视频任务状态，返回 (是否完成, 载荷)"""
+        if handle['platform'] == 'openai':
+            video = self.client_for_key(handle.get('api_key')).videos.retrieve(handle['id'])
+            self.log.info(f"视频结果状态：{video.status} {getattr(video, 'progress', 0)}%")
+            return video.status not in ("in_progress", "queued"), video
+        result = self.req(handle['model'], {'operationName': handle['operationName']}, api_key=handle.get('api_key'))
+        return bool(result['data'].get('done', False)), result
+
+    async def acheck_video(self, handle):
+        """check_video 的异步版本"""
+        if handle['platform'] == 'openai':
+            video = await self.async_client_for_key(handle.get('api_key')).videos.retrieve(handle['id'])
+            self.log.info(f"视频结果状态：{video.status} {getattr(video, 'progress', 0)}%")
+            return video.status not in ("in_progress", "queued"), video
+        result = await self.areq(handle['model'], {'operationName': handle['operationName']}, api_key=handle.get('api_key'))
+        return bool(result['data'].get('done', False)), result
+
+    def finalize_video(self, handle, payload):
+        """任务完成后下载视频并上传到COS，返回与 video() 相同的结果字典"""
+        sObj = SuccessObj()
+        sObj.success = False
+        if handle['platform'] == 'openai':
+            video = payload
+            if video.status == "failed":
+                message = getattr(
+                    getattr(video, "error", None), "message", "Video generation failed"
+                )
+                self.log.error(message)
+                sObj.data = message
+            else:
+                self.log.debug("Streaming video content to COS...")
+                # 边下载边分块上传，不写工作目录，内存占用约为一个分块
+                with self.client_for_key(handle.get('api_key')).with_streaming_response.videos.download_content(video.id, variant="video") as content:
+                    data = self.storage.put_stream(
+                        f'AiHubMix/video/{self.dateTool.getDateStr("%Y-%m-%d")}/{video.id}.mp4',
+                        content.iter_bytes(VIDEO_STREAM_CHUNK_SIZE),
+                        content_type="video/mp4",
+                        deferred=True,
+                    )
+                if data['success']:
+                    sObj.data = data['data']['Location']
+                sObj.success = True
+        else:
+            result = payload
+            video_id = handle['id']
+            if 'error' in result['data']:
+                sObj.data = result['data']['error']
+            elif 'videos' in result['data']['response']:
+                # 分段解码 base64 并分块上传，不生成完整的解码副本
+                b64_str = result['data']['response']['videos'][0].pop('bytesBase64Encoded')
+                data = self.storage.put_stream(
+                    f'AiHubMix/video/{self.dateTool.getDateStr("%Y-%m-%d")}/{video_id}.mp4',
+                    iter_base64_decoded(b64_str, VIDEO_STREAM_CHUNK_SIZE),
+                    content_type="video/mp4",
+                    deferred=True,
+                )
+                del b64_str
+                if data['success']:
+                    sObj.data = data['data']['Location']
+                sObj.success = True
+            elif 'raiMediaFilteredReasons' in result['data']['response']:
+                sObj.data = result['data']['response']['raiMediaFilteredReasons'][0]
+            else:
+                sObj.data = f"未知错误：{result['data']}"
         return sObj.dic()
 
-    def req(self, model, param):
+    def req(self, model, param, api_key=None):
         """
            请求轩辕API接口：先初始化LingXingAPITool.init再执行该方法
            :param name: 请求地址名称
@@ -601,9 +1063,10 @@ class AiHubMixTool:
         try:
             log.info(f'请求参数:{param}')
             if model in ai_models_config['video'] and ai_models_config['video'][model]['model_platform'] == 'genai':
-                reqData = session.get(f"https://aihubmix.com/gemini/v1beta/{param['operationName']}?key={self.api_key}").json()
+                reqData = session.get(f"https://aihubmix.com/gemini/v1beta/{param['operationName']}?key={api_key or self.api_key}").json()
                 log.debug('----请求结果----')
-                log.info(reqData)
+                # 完成时响应中包含完整视频的 base64，不写入日志
+                log.info(reqData if not reqData.get('done') else {k: v for k, v in reqData.items() if k != 'response'})
                 sObj.success = True
                 sObj.data = reqData
             else:
@@ -612,6 +1075,54 @@ class AiHubMixTool:
         except Exception as e:
             raise e
 
+    async def areq(self, model, param, api_key=None):
+        """req 的异步版本，使用共享的 httpx.AsyncClient"""
+        log = self.log
+        log.debug('开始执行：AiHubMixTool.areq（请求）')
+        session = client_pool.get_async_session('AiHubMix')
+        sObj = SuccessObj()
+        sObj.success = False
+        log.info(f'请求参数:{param}')
+        if model in ai_models_config['video'] and ai_models_config['video'][model]['model_platform'] == 'genai':
+            response = await session.get(f"https://aihubmix.com/gemini/v1beta/{param['operationName']}", params={'key': api_key or self.api_key})
+            reqData = response.json()
+            log.debug('----请求结果----')
+            # 完成时响应中包含完整视频的 base64，不写入日志
+            log.info(reqData if not reqData.get('done') else {k: v for k, v in reqData.items() if k != 'response'})
+            sObj.success = True
+            sObj.data = reqData
+        else:
+            sObj.data = f"无效{model}，暂不支持该model。"
+        return sObj.dic()
+
+    def read_image_bytes(self, image_input):
+        """读取 URL / 本地路径 / {name,type,body} 对象的原始字节"""
+        if isinstance(image_input, str):
+            if is_url(image_input):
+                return image_fetcher.fetch(image_input)[0]
+            if not os.path.exists(image_input):
+                raise ValueError(f"本地文件不存在: {image_input}")
+            with open(image_input, "rb") as f:
+                return f.read()
+        if is_file_object(image_input):
+            body = image_input.get('body') if isinstance(image_input, dict) else getattr(image_input, 'body', None)
+            if body is None:
+                raise ValueError("File对象或dict中未找到'body'")
+            return body
+        raise TypeError(f"不支持类型: {type(image_input).__name__}. 请输入URL、本地路径或{{name,type,body}}的对象。")
+
+    def prepare_reference_image(self, image_input, model=None):
+        """参考图预处理：按模型最长边缩放并重新编码，返回 (bytes, mime_type)，失败时退回原图"""
+        image_bytes = self.read_image_bytes(image_input)
+        try:
+            prepared, mime_type, stats = prepare_image_bytes(image_bytes, get_max_input_edge(model))
+        except Exception as e:
+            self.log.error(f"参考图预处理失败，使用原图: {e}")
+            return image_bytes, sniff_image_mime(image_bytes)
+        self.input_bytes_saved += stats['saved_bytes']
+        self.log.info(f"参考图预处理：{stats}")
+        return prepared, mime_type
+
     def load_image(self, image_input, as_bytes=False, filename=None, mime_type=None, resize_to=None):
         image = None
         input_type = type(image_input).__name__
@@ -621,10 +1132,8 @@ class AiHubMixTool:
             parsed_url = urlparse(image_input)
             if all([parsed_url.scheme, parsed_url.netloc]):
                 try:
-                    response = requests.get(image_input, stream=True)
-                    response.raise_for_status()
-                    image_data = io.BytesIO(response.content)
-                    image = Image.open(image_data)
+                    image_bytes, _ = image_fetcher.fetch(image_input)
+                    image = Image.open(io.BytesIO(image_bytes))
                 except Exception as e:
                     raise ValueError(f"URL图片处理失败: {e}")
                 # 用URL basename做默认filename
@@ -694,38 +1203,34 @@ class AiHubMixTool:
         return image
 
     def process_files(self, images):
+        """将文件对象/本地路径上传到存储的临时目录并返回地址，URL 原样保留；多个文件并发上传"""
         self.log.debug('转化文件')
         new_images = []
+        pending = []  # (new_images 下标, 存储Key, 内容, Content-Type)
         for image in images:
             if is_url(image):
                 new_images.append(image)
-            elif is_file_object(image):
-                # 得到原文件扩展名，如果没有后缀，默认用".tmp"
-                file_name, file_ext = get_file_name_and_ext(image)
-                with tempfile.NamedTemporaryFile(suffix=file_ext, delete=False) as tmp_file:
-                    image.seek(0)
-                    tmp_file.write(image.read())
-                    tmp_file.flush()
-                    tmp_file_path = tmp_file.name
-                    data = self.tenCentCloudClient.upload_file(bucket="yh-server-1325210923", file=tmp_file_path,fileName=f'temp/AiHubMix/{self.dateTool.getDateStr("%Y-%m-%d")}/{file_name}')
-                    if data['success']:
-                        url = data['data']['Location']
-                        new_images.append(url)
-                    os.remove(tmp_file_path)
+                continue
+            file_name, _ = get_file_name_and_ext(image)
+            if is_file_object(image):
+                image.seek(0)
+                body = image.read()
             else:
                 # 假设是本地路径
-                file_name, file_ext = get_file_name_and_ext(image)
-                with tempfile.NamedTemporaryFile(suffix=file_ext, delete=False) as tmp_file:
-                    with open(image, 'rb') as f:
-                        tmp_file.write(f.read())
-                    tmp_file.flush()
-                    tmp_file_path = tmp_file.name
-                    data = self.tenCentCloudClient.upload_file(bucket="yh-server-1325210923", file=tmp_file_path,fileName=f'temp/AiHubMix/{self.dateTool.getDateStr("%Y-%m-%d")}/{file_name}')
-                    if data['success']:
-                        url = data['data']['Location']
-                        new_images.append(url)
-                    os.remove(tmp_file_path)
-        return new_images
+                with open(image, 'rb') as f:
+                    body = f.read()
+            pending.append((
+                len(new_images),
+                f'temp/AiHubMix/{self.dateTool.getDateStr("%Y-%m-%d")}/{file_name}',
+                body,
+                mimetypes.guess_type(file_name)[0],
+            ))
+            new_images.append(None)
+        results = self.storage.put_many([(key, body, content_type) for _, key, body, content_type in pending])
+        for (index, _, _, _), data in zip(pending, results):
+            if data['success']:
+                new_images[index] = data['data']['Location']
+        return [image for image in new_images if image is not None]
 
 if __name__ == '__main__':
     print('执行')
@@ -0,0 +1,137 @@
+# @File : ApiKeyPoolTool.py
+# @remark : AiHubMix 多 Key 负载均衡：同一 key_name 下可配置多个 Key，按 权重/进行中请求数 选择，
+#           遇到限额/鉴权类错误时暂时剔除该 Key，冷却时间随连续失败次数翻倍
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from app.tool.LogTool import LogTool
+
+# 视为 Key 限额/失效的 HTTP 状态码与错误关键字
+QUOTA_STATUS_CODES = (401, 403, 429)
+QUOTA_ERROR_KEYWORDS = ('quota', 'rate limit', 'resource_exhausted', 'insufficient', 'exceeded')
+
+
+def is_quota_error(error):
+    code = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    if code in QUOTA_STATUS_CODES:
+        return True
+    message = str(error).lower()
+    return any(keyword in message for keyword in QUOTA_ERROR_KEYWORDS)
+
+
+class ApiKeyMember:
+    __slots__ = ('value', 'weight', 'in_flight', 'failures', 'ejected_until', 'last_used')
+
+    def __init__(self, value, weight=1):
+        self.value = value
+        self.weight = max(1, weight or 1)
+        self.in_flight = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.last_used = 0.0
+
+
+class ApiKeyPool:
+    """单个 key_name 的 Key 池：选择 进行中请求数/权重 最小且未被剔除的 Key"""
+    base_cooldown = 60
+    max_cooldown = 15 * 60
+
+    def __init__(self, name, members):
+        self.name = name
+        self.members = members
+        self._lock = threading.Lock()
+
+    @property
+    def values(self):
+        return [member.value for member in self.members]
+
+    def acquire(self):
+        now = time.monotonic()
+        with self._lock:
+            available = [member for member in self.members if member.ejected_until <= now]
+            if available:
+                member = min(available, key=lambda m: ((m.in_flight + 1) / m.weight, m.last_used))
+            else:
+                # 全部被剔除时使用最早恢复的 Key，避免直接拒绝请求
+                member = min(self.members, key=lambda m: m.ejected_until)
+            member.in_flight += 1
+            member.last_used = now
+            return member
+
+    def release(self, member, error=None):
+        with self._lock:
+            member.in_flight -= 1
+            if error is None:
+                member.failures = 0
+                return False
+            if not is_quota_error(error):
+                return False
+            member.failures += 1
+            cooldown = min(self.max_cooldown, self.base_cooldown * 2 ** (member.failures - 1))
+            member.ejected_until = time.monotonic() + cooldown
+            return cooldown
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    'key': f'{member.value[:6]}***' if member.value else '',
+                    'weight': member.weight,
+                    'in_flight': member.in_flight,
+                    'failures': member.failures,
+                    'ejected_seconds': max(0, int(member.ejected_until - now)),
+                }
+                for member in self.members
+            ]
+
+
+class ApiKeyPoolTool:
+
+    def __init__(self, log=LogTool(path=str(Path(__file__))[str(Path(__file__)).find('app'):len(str(Path(__file__)))].replace('.py', '') + '/')):
+        self.log = log
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get(self, key_name, key_config):
+        """
+        获取 key_name 对应的 Key 池；配置变化（如重新加载 apikey.json）时重建。
+        key_config 形如 {"value": "sk-a", "weight": 1, "values": [{"value": "sk-b", "weight": 2}]}
+        """
+        entries = [{'value': key_config.get('value'), 'weight': key_config.get('weight', 1)}]
+        for item in key_config.get('values') or []:
+            entries.append(item if isinstance(item, dict) else {'value': item})
+        entries = [entry for entry in entries if entry.get('value')] or entries[:1]
+        values = [entry['value'] for entry in entries]
+
+        pool = self._pools.get(key_name)
+        if pool is not None and pool.values == values:
+            return pool
+        with self._lock:
+            pool = self._pools.get(key_name)
+            if pool is None or pool.values != values:
+                pool = ApiKeyPool(key_name, [ApiKeyMember(entry['value'], entry.get('weight', 1)) for entry in entries])
+                self._pools[key_name] = pool
+        return pool
+
+    @contextmanager
+    def lease(self, pool):
+        """占用一个 Key；调用抛出限额类异常时剔除该 Key"""
+        member = pool.acquire()
+        try:
+            yield member
+        except Exception as e:
+            cooldown = pool.release(member, e)
+            if cooldown:
+                self.log.error(f'Key池{pool.name}的Key因限额/鉴权错误剔除{cooldown}秒：{e}')
+            raise
+        else:
+            pool.release(member)
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in list(self._pools.items())}
+
+
+api_key_pool = ApiKeyPoolTool()
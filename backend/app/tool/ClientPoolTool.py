@@ -0,0 +1,166 @@
+# @File : ClientPoolTool.py
+# @remark : 上游客户端池：进程内按 (平台, key, base_url) 共享 OpenAI / genai 客户端（同步与异步），
+#           按 (appId, region) 共享腾讯云 COS 客户端，复用 keep-alive 连接池
+import threading
+from pathlib import Path
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from openai import AsyncOpenAI, OpenAI
+from google import genai
+
+from app.tool.LogTool import LogTool
+from app.tool.TenCentCloudTool import TenCentCloudTool
+
+APP_CODE_HEADERS = {"APP-Code": "LTMI0901"}
+
+
+class ClientPoolTool:
+    # COS 连接池大小（与生成线程池规模保持同一量级）
+    cos_pool_size = 32
+    # 共享 requests.Session 的连接池大小
+    http_pool_size = 32
+
+    def __init__(self, log=LogTool(path=str(Path(__file__))[str(Path(__file__)).find('app'):len(str(Path(__file__)))].replace('.py', '') + '/')):
+        self.log = log
+        self._lock = threading.Lock()
+        self._ai_clients = {}
+        self._async_ai_clients = {}
+        self._async_sessions = {}
+        self._cos_tools = {}
+        self._sessions = {}
+
+    def get_ai_client(self, api_key, base_url, type="openai"):
+        """获取（或创建）共享的 OpenAI / genai 客户端"""
+        cache_key = (type, api_key, base_url)
+        client = self._ai_clients.get(cache_key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._ai_clients.get(cache_key)
+            if client is None:
+                self.log.debug(f'创建共享{type}客户端：{base_url}')
+                if type == 'openai':
+                    client = OpenAI(
+                        api_key=api_key,
+                        base_url=base_url,
+                        default_headers=APP_CODE_HEADERS,
+                    )
+                elif type == 'genai':
+                    client = genai.Client(
+                        api_key=api_key,
+                        http_options={"base_url": base_url, "headers": APP_CODE_HEADERS},
+                    )
+                else:
+                    return None
+                self._ai_clients[cache_key] = client
+        return client
+
+    def get_async_ai_client(self, api_key, base_url, type="openai"):
+        """
+        获取（或创建）共享的异步客户端：openai 为 AsyncOpenAI，genai 为同一 genai.Client 的 .aio。
+        异步客户端的连接绑定在创建时的事件循环上，只应在应用主事件循环中使用。
+        """
+        if type == 'genai':
+            client = self.get_ai_client(api_key, base_url, type='genai')
+            return client.aio if client is not None else None
+        if type != 'openai':
+            return None
+        cache_key = (type, api_key, base_url)
+        client = self._async_ai_clients.get(cache_key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._async_ai_clients.get(cache_key)
+            if client is None:
+                self.log.debug(f'创建共享异步{type}客户端：{base_url}')
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    default_headers=APP_CODE_HEADERS,
+                )
+                self._async_ai_clients[cache_key] = client
+        return client
+
+    def get_async_session(self, name="default"):
+        """获取共享的 httpx.AsyncClient（带连接池）"""
+        session = self._async_sessions.get(name)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._async_sessions.get(name)
+            if session is None:
+                session = httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=self.http_pool_size * 4, max_keepalive_connections=self.http_pool_size),
+                    timeout=httpx.Timeout(60.0, connect=10.0),
+                )
+                self._async_sessions[name] = session
+        return session
+
+    def get_cos_tool(self, app_id, region):
+        """获取（或创建）共享的 TenCentCloudTool（已 buildClient）"""
+        cache_key = (str(app_id), region)
+        tool = self._cos_tools.get(cache_key)
+        if tool is not None:
+            return tool
+        with self._lock:
+            tool = self._cos_tools.get(cache_key)
+            if tool is None:
+                self.log.debug(f'创建共享COS客户端：{app_id} {region}')
+                tool = TenCentCloudTool().init(app_id).buildClient(region, pool_size=self.cos_pool_size)
+                self._cos_tools[cache_key] = tool
+        return tool
+
+    def get_session(self, name="default"):
+        """获取共享的 requests.Session（带连接池）"""
+        session = self._sessions.get(name)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get(name)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.http_pool_size, pool_maxsize=self.http_pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[name] = session
+        return session
+
+    def warm_up(self, app_id, region):
+        """启动时预建 COS 客户端，失败只记录日志"""
+        try:
+            self.get_cos_tool(app_id, region)
+        except Exception as e:
+            self.log.error(f'预建COS客户端失败：{e}')
+
+    async def aclose_all(self):
+        """关闭并清空所有异步客户端（需在创建它们的事件循环中调用）"""
+        with self._lock:
+            clients = list(self._async_ai_clients.values()) + list(self._async_sessions.values())
+            self._async_ai_clients.clear()
+            self._async_sessions.clear()
+        for client in clients:
+            try:
+                await client.aclose() if isinstance(client, httpx.AsyncClient) else await client.close()
+            except Exception as e:
+                self.log.error(f'关闭异步客户端失败：{e}')
+
+    def close_all(self):
+        """关闭并清空所有共享客户端"""
+        with self._lock:
+            ai_clients = list(self._ai_clients.values())
+            sessions = list(self._sessions.values())
+            self._ai_clients.clear()
+            self._cos_tools.clear()
+            self._sessions.clear()
+        for client in ai_clients:
+            try:
+                client.close()
+            except Exception as e:
+                self.log.error(f'关闭客户端失败：{e}')
+        for session in sessions:
+            session.close()
+
+
+client_pool = ClientPoolTool()
@@ -0,0 +1,227 @@
+# @File : ImageFetchTool.py
+# @remark : 参考图下载工具：共享连接池并发下载，内存 LRU + 可选磁盘缓存（按 URL 缓存，ETag/大小校验）
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from app.tool.LogTool import LogTool
+from app.tool.ClientPoolTool import client_pool
+
+
+class ImageFetchTool:
+
+    def __init__(self, log=LogTool(path=str(Path(__file__))[str(Path(__file__)).find('app'):len(str(Path(__file__)))].replace('.py', '') + '/')):
+        self.log = log
+        self.timeout = (5, 30)  # (连接超时, 读取超时)
+        self.max_workers = 8
+        self.memory_max_bytes = 128 * 1024 * 1024
+        self.revalidate_seconds = 300  # 缓存命中后多久内不再向源站校验
+        self.cache_dir = None
+        self.disk_max_bytes = 1024 * 1024 * 1024
+        self._memory = OrderedDict()  # url -> entry
+        self._memory_bytes = 0
+        self._resolvers = []
+        self._pool = None  # 共享下载线程池，首次并发下载时创建
+        self._lock = threading.Lock()
+
+    def configure(self, cache_dir=None, memory_max_mb=None, disk_max_mb=None, timeout=None, max_workers=None):
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.cache_dir = cache_dir
+        if memory_max_mb is not None:
+            self.memory_max_bytes = max(0, memory_max_mb) * 1024 * 1024
+        if disk_max_mb is not None:
+            self.disk_max_bytes = max(0, disk_max_mb) * 1024 * 1024
+        if timeout:
+            self.timeout = (5, timeout)
+        if max_workers and max(1, max_workers) != self.max_workers:
+            self.max_workers = max(1, max_workers)
+            self.shutdown()
+        return self
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=False)
+
+    def _ensure_pool(self):
+        pool = self._pool
+        if pool is not None:
+            return pool
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='image-fetch')
+            return self._pool
+
+    def register_resolver(self, resolver):
+        """注册地址解析钩子 resolver(url) -> bytes | None，返回内容时不再走 HTTP（如本地/内存存储的地址）"""
+        if resolver not in self._resolvers:
+            self._resolvers.append(resolver)
+        return self
+
+    def fetch(self, url):
+        """
+        下载图片，返回 (bytes, content_type)。
+        缓存未过校验期直接返回；否则带 If-None-Match 向源站校验，304 时复用缓存。
+        """
+        for resolver in self._resolvers:
+            data = resolver(url)
+            if data is not None:
+                return data, mimetypes.guess_type(url.split('?', 1)[0])[0]
+
+        entry = self._memory_get(url) or self._disk_get(url)
+        if entry and time.time() - entry['checked_at'] < self.revalidate_seconds:
+            return entry['data'], entry['content_type']
+
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        response = client_pool.get_session('ImageFetch').get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and entry:
+            self.log.debug(f'参考图未变更，使用缓存：{url}')
+            entry['checked_at'] = time.time()
+            self._memory_put(url, entry)
+            return entry['data'], entry['content_type']
+        response.raise_for_status()
+
+        data = response.content
+        entry = {
+            'data': data,
+            'etag': response.headers.get('ETag'),
+            'size': len(data),
+            'content_type': response.headers.get('Content-Type'),
+            'checked_at': time.time(),
+        }
+        declared_size = response.headers.get('Content-Length')
+        if declared_size and declared_size.isdigit() and int(declared_size) != entry['size']:
+            raise ValueError(f'图片下载不完整：{url}')
+        self._memory_put(url, entry)
+        self._disk_put(url, entry)
+        return data, entry['content_type']
+
+    def fetch_many(self, urls):
+        """在共享线程池中并发下载多张图片，按输入顺序返回 (bytes, content_type) 或异常对象"""
+        if not urls:
+            return []
+
+        def safe_fetch(url):
+            try:
+                return self.fetch(url)
+            except Exception as e:
+                self.log.error(f'参考图下载失败：{url}, {e}')
+                return e
+
+        unique_urls = list(dict.fromkeys(urls))
+        if len(unique_urls) == 1:
+            results = {unique_urls[0]: safe_fetch(unique_urls[0])}
+        else:
+            results = dict(zip(unique_urls, self._ensure_pool().map(safe_fetch, unique_urls)))
+        return [results[url] for url in urls]
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    # ---------- 内存缓存 ----------
+    def _memory_get(self, url):
+        with self._lock:
+            entry = self._memory.get(url)
+            if entry is not None:
+                self._memory.move_to_end(url)
+            return entry
+
+    def _memory_put(self, url, entry):
+        if entry['size'] > self.memory_max_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(url, None)
+            if previous is not None:
+                self._memory_bytes -= previous['size']
+            self._memory[url] = entry
+            self._memory_bytes += entry['size']
+            while self._memory_bytes > self.memory_max_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted['size']
+
+    # ---------- 磁盘缓存 ----------
+    def _disk_paths(self, url):
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.bin'), os.path.join(self.cache_dir, f'{digest}.json')
+
+    def _disk_get(self, url):
+        if not self.cache_dir:
+            return None
+        data_path, meta_path = self._disk_paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(data_path, 'rb') as f:
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != url or meta.get('size') != len(data):
+            return None
+        try:
+            os.utime(data_path, None)  # 以修改时间作为磁盘LRU的访问时间
+        except OSError:
+            pass
+        entry = {
+            'data': data,
+            'etag': meta.get('etag'),
+            'size': len(data),
+            'content_type': meta.get('content_type'),
+            # 磁盘命中总是先向源站校验一次
+            'checked_at': 0,
+        }
+        self._memory_put(url, entry)
+        return entry
+
+    def _disk_put(self, url, entry):
+        if not self.cache_dir or entry['size'] > self.disk_max_bytes:
+            return
+        data_path, meta_path = self._disk_paths(url)
+        try:
+            tmp_path = f'{data_path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(entry['data'])
+            os.replace(tmp_path, data_path)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'url': url, 'etag': entry['etag'], 'size': entry['size'], 'content_type': entry['content_type']}, f)
+            self._disk_evict()
+        except OSError as e:
+            self.log.error(f'写入参考图磁盘缓存失败：{e}')
+
+    def _disk_evict(self):
+        files = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.bin'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.disk_max_bytes:
+                break
+            for target in (path, path[:-4] + '.json'):
+                try:
+                    os.remove(target)
+                except OSError:
+                    pass
+            total -= size
+
+
+image_fetcher = ImageFetchTool()
@@ -0,0 +1,137 @@
+# @File : ImagePrepTool.py
+# @remark : 参考图预处理：识别真实格式、按最长边缩放、去除元数据并重新编码为紧凑格式
+import io
+
+from PIL import Image
+from PIL import ImageOps
+
+# 未在 ai_models_config 中配置 max_input_edge 时使用的默认最长边
+DEFAULT_MAX_INPUT_EDGE = 2048
+JPEG_QUALITY = 90
+
+# Image.info 中属于元数据的字段（EXIF/GPS、ICC、XMP、注释等）
+METADATA_INFO_KEYS = ('exif', 'icc_profile', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop')
+
+FORMAT_MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'GIF': 'image/gif',
+}
+
+
+def sniff_image_mime(data, default='image/png'):
+    """根据文件内容（而非扩展名）识别图片的 mime_type"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return FORMAT_MIME_TYPES.get(image.format, default)
+    except Exception:
+        return default
+
+
+def has_alpha(image):
+    if image.mode in ('RGBA', 'LA'):
+        return True
+    return image.mode == 'P' and 'transparency' in image.info
+
+
+def has_metadata(image):
+    """原图是否携带 EXIF/ICC/XMP/文本块等元数据"""
+    if any(image.info.get(key) for key in METADATA_INFO_KEYS):
+        return True
+    if len(image.getexif()):
+        return True
+    return bool(getattr(image, 'text', None))
+
+
+def prepare_image_bytes(data, max_edge=DEFAULT_MAX_INPUT_EDGE):
+    """
+    预处理参考图：
+    - 按 EXIF 方向摆正后缩放到最长边不超过 max_edge；
+    - 丢弃 EXIF/ICC 等元数据，不透明图编码为 JPEG，带透明通道编码为 PNG；
+    - 未发生缩放、原图不含元数据且重新编码反而更大时保留原图。
+    :return: (bytes, mime_type, stats)，stats 记录原始/输出字节数与节省字节数
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        source_format = source.format
+        original_size = source.size
+        keep_original_allowed = not has_metadata(source)
+        image = ImageOps.exif_transpose(source)
+        resized = max(image.size) > max_edge
+        if resized:
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        out = io.BytesIO()
+        if has_alpha(image):
+            image.convert('RGBA').save(out, format='PNG', optimize=True)
+            mime_type = 'image/png'
+        else:
+            image.convert('RGB').save(out, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+            mime_type = 'image/jpeg'
+        output = out.getvalue()
+        output_size = image.size
+
+    if (
+        keep_original_allowed
+        and not resized
+        and len(output) >= len(data)
+        and source_format in FORMAT_MIME_TYPES
+    ):
+        output = data
+        mime_type = FORMAT_MIME_TYPES[source_format]
+        output_size = original_size
+
+    stats = {
+        'source_format': source_format,
+        'original_size': original_size,
+        'output_size': output_size,
+        'original_bytes': len(data),
+        'output_bytes': len(output),
+        'saved_bytes': len(data) - len(output),
+    }
+    return output, mime_type, stats
+
+
+def render_webp_derivatives(data, sizes, quality=80):
+    """
+    生成 WebP 派生图（缩略图/预览图），只解码一次原图，按尺寸从大到小依次缩放。
+    模块级函数，可直接提交到进程池执行。
+    :param sizes: {名称: 最长边}，如 {'preview': 1024, 'thumbnail': 256}
+    :return: {名称: (bytes, (宽, 高))}
+    """
+    results = {}
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA') if has_alpha(image) else image.convert('RGB')
+        for name, max_edge in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+            if max(image.size) > max_edge:
+                image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            out = io.BytesIO()
+            image.save(out, format='WEBP', quality=quality, method=4)
+            results[name] = (out.getvalue(), image.size)
+    return results
+
+
+def resize_image(data, width=None, height=None, fmt='WEBP', quality=80):
+    """
+    等比缩放到不超过 width x height 的范围内（不放大），并编码为指定格式。
+    只给出宽或高时按单边限制；都为空时只转换格式。
+    :param fmt: WEBP / JPEG / PNG
+    :return: (bytes, mime_type)
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        keep_alpha = fmt != 'JPEG' and has_alpha(image)
+        image = image.convert('RGBA') if keep_alpha else image.convert('RGB')
+        bound_width = width or image.width
+        bound_height = height or image.height
+        if image.width > bound_width or image.height > bound_height:
+            image.thumbnail((bound_width, bound_height), Image.LANCZOS)
+        out = io.BytesIO()
+        if fmt == 'JPEG':
+            image.save(out, format='JPEG', quality=quality, optimize=True)
+        elif fmt == 'PNG':
+            image.save(out, format='PNG', optimize=True)
+        else:
+            image.save(out, format='WEBP', quality=quality, method=4)
+    return out.getvalue(), FORMAT_MIME_TYPES[fmt]
@@ -0,0 +1,260 @@
+# @File : ModelLimitTool.py
+# @remark : 上游模型调用准入控制：按模型名限制并发数与每分钟请求数（令牌桶），
+#           排队请求按租户（团队/授权码）轮转分配，避免单个团队占满某个模型
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+
+from app.tool.LogTool import LogTool
+
+
+class ModelLimitTimeout(RuntimeError):
+    """排队等待超时"""
+
+
+class _Waiter:
+    __slots__ = ('tenant', 'event', 'granted', 'future')
+
+    def __init__(self, tenant, future=None):
+        self.tenant = tenant
+        self.event = threading.Event()
+        self.granted = False
+        # 异步等待方的 asyncio.Future，放行时在其事件循环中唤醒
+        self.future = future
+
+    def wake(self):
+        self.granted = True
+        self.event.set()
+        future = self.future
+        if future is not None:
+            future.get_loop().call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ModelLimiter:
+    """单个模型的限流器：max_in_flight 并发上限 + rpm 令牌桶 + 按租户轮转的公平队列"""
+
+    def __init__(self, name, max_in_flight, rpm):
+        self.name = name
+        self.max_in_flight = max(0, max_in_flight or 0)  # 0 表示不限制并发数
+        self.rpm = max(0, rpm or 0)  # 0 表示不限制每分钟请求数
+        # 令牌桶容量：允许的突发量，配置了并发上限时最多为一个并发上限
+        self.capacity = max(1, min(self.max_in_flight or self.rpm, self.rpm)) if self.rpm else 0
+        self.tokens = float(self.capacity)
+        self.in_flight = 0
+        self._refilled_at = time.monotonic()
+        self._queues = OrderedDict()  # tenant -> deque[_Waiter]
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self):
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def acquire(self, tenant=None, timeout=None):
+        waiter = _Waiter(tenant)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._queues.setdefault(tenant, deque()).append(waiter)
+            retry_after = self._dispatch()
+        while not waiter.event.is_set():
+            wait_for = retry_after
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._lock:
+                        if not waiter.granted:
+                            self._discard(waiter)
+                            raise ModelLimitTimeout(f'模型 {self.name} 当前排队请求过多，请稍后再试')
+                    break
+                wait_for = remaining if wait_for is None else min(wait_for, remaining)
+            waiter.event.wait(wait_for)
+            with self._lock:
+                retry_after = self._dispatch()
+
+    async def acquire_async(self, tenant=None, timeout=None):
+        """acquire 的协程版本：排队期间不占用线程"""
+        waiter = _Waiter(tenant, asyncio.get_running_loop().create_future())
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._queues.setdefault(tenant, deque()).append(waiter)
+            retry_after = self._dispatch()
+        try:
+            while not waiter.granted:
+                wait_for = retry_after
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        with self._lock:
+                            if not waiter.granted:
+                                self._discard(waiter)
+                                raise ModelLimitTimeout(f'模型 {self.name} 当前排队请求过多，请稍后再试')
+                        break
+                    wait_for = remaining if wait_for is None else min(wait_for, remaining)
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), wait_for)
+                except asyncio.TimeoutError:
+                    pass
+                with self._lock:
+                    retry_after = self._dispatch()
+        except asyncio.CancelledError:
+            # 被取消时归还已获得的名额或退出队列
+            with self._lock:
+                if waiter.granted:
+                    self.in_flight -= 1
+                    self._dispatch()
+                else:
+                    self._discard(waiter)
+            raise
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._dispatch()
+
+    def _refill(self):
+        if not self.rpm:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._refilled_at) * self.rpm / 60.0)
+        self._refilled_at = now
+
+    def _dispatch(self):
+        """按租户轮转放行排队请求；令牌不足时返回下一个令牌的等待秒数"""
+        self._refill()
+        while self._queues and (not self.max_in_flight or self.in_flight < self.max_in_flight):
+            if self.rpm and self.tokens < 1:
+                return (1 - self.tokens) * 60.0 / self.rpm
+            tenant, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            # 当前租户放行一个后移到队尾，轮到下一个租户
+            del self._queues[tenant]
+            if queue:
+                self._queues[tenant] = queue
+            if self.rpm:
+                self.tokens -= 1
+            self.in_flight += 1
+            waiter.wake()
+        return None
+
+    def _discard(self, waiter):
+        queue = self._queues.get(waiter.tenant)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        if not queue:
+            del self._queues[waiter.tenant]
+
+
+class ModelLimitTool:
+    # 未在 ai_models_config 中配置时的默认值，0 表示不限制
+    default_max_in_flight = 0
+    default_rpm = 0
+    wait_seconds = 120
+
+    def __init__(self, log=LogTool(path=str(Path(__file__))[str(Path(__file__)).find('app'):len(str(Path(__file__)))].replace('.py', '') + '/')):
+        self.log = log
+        self._limiters = {}
+        self._overrides = {}  # 模型定义表中配置的限额：model -> (max_in_flight, rpm)
+        self._lock = threading.Lock()
+
+    def configure(self, default_max_in_flight=None, default_rpm=None, wait_seconds=None):
+        if default_max_in_flight is not None:
+            self.default_max_in_flight = default_max_in_flight
+        if default_rpm is not None:
+            self.default_rpm = default_rpm
+        if wait_seconds:
+            self.wait_seconds = wait_seconds
+        with self._lock:
+            self._limiters.clear()
+        return self
+
+    def set_overrides(self, limits):
+        """
+        设置模型定义表中的限额 {model: (max_in_flight, rpm)}，非 None 的值优先于调用方传入的 ai_models_config 配置。
+        限额有变化的模型丢弃旧限流器，后续请求使用新限额；已在旧限流器中的请求照常释放。
+        """
+        limits = {model: tuple(values) for model, values in limits.items()}
+        with self._lock:
+            changed = {
+                model for model in set(self._overrides) | set(limits)
+                if self._overrides.get(model) != limits.get(model)
+            }
+            self._overrides = limits
+            for model in changed:
+                self._limiters.pop(model, None)
+        if changed:
+            self.log.info(f'模型限额已更新：{sorted(changed)}')
+        return self
+
+    def get(self, model, max_in_flight=None, rpm=None):
+        limiter = self._limiters.get(model)
+        if limiter is not None:
+            return limiter
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                override_in_flight, override_rpm = self._overrides.get(model, (None, None))
+                if override_in_flight is not None:
+                    max_in_flight = override_in_flight
+                if override_rpm is not None:
+                    rpm = override_rpm
+                limiter = ModelLimiter(
+                    model,
+                    self.default_max_in_flight if max_in_flight is None else max_in_flight,
+                    self.default_rpm if rpm is None else rpm,
+                )
+                self._limiters[model] = limiter
+        return limiter
+
+    @contextmanager
+    def slot(self, model, tenant=None, max_in_flight=None, rpm=None):
+        """占用一个上游调用名额，排队超过 wait_seconds 抛出 ModelLimitTimeout"""
+        limiter = self.get(model, max_in_flight, rpm)
+        started = time.monotonic()
+        limiter.acquire(tenant, timeout=self.wait_seconds)
+        waited = time.monotonic() - started
+        if waited > 1:
+            self.log.debug(f'模型 {model} 排队 {waited:.1f}s（租户 {tenant}）')
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    @asynccontextmanager
+    async def aslot(self, model, tenant=None, max_in_flight=None, rpm=None):
+        """slot 的异步版本，排队时让出事件循环"""
+        limiter = self.get(model, max_in_flight, rpm)
+        started = time.monotonic()
+        await limiter.acquire_async(tenant, timeout=self.wait_seconds)
+        waited = time.monotonic() - started
+        if waited > 1:
+            self.log.debug(f'模型 {model} 排队 {waited:.1f}s（租户 {tenant}）')
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    def stats(self):
+        return {
+            name: {
+                'in_flight': limiter.in_flight,
+                'waiting': limiter.waiting,
+                'max_in_flight': limiter.max_in_flight,
+                'rpm': limiter.rpm,
+            }
+            for name, limiter in list(self._limiters.items())
+        }
+
+
+model_limiter = ModelLimitTool()
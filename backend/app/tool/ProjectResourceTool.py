@@ -2,31 +2,49 @@
 # @DateTime : 2021/8/3/0003 12:04
 # @File : ProjectResourceTool.py
 # @remark : 项目资源工具类（用于获取不同渠道的资源配置信息）
+import copy
+import threading
+
 from app.tool.LogTool import LogTool
 from pathlib import Path
 from app.tool.JsonTool import JsonTool
 
 class ProjectResourceTool(object):
+    # 进程级配置缓存，避免每次请求重复读取本地json
+    _cache = {}
+    _cache_lock = threading.Lock()
+
     def __init__(self, log=LogTool(path=str(Path(__file__))[str(Path(__file__)).find('app'):len(str(Path(__file__)))].replace('.py', '') + '/')):
         self.apolloTool = None
         self.log = log
         self.reqData = None
         self.req_name = None
 
-    def get(self, param, **kwargs):
+    def get(self, param, use_cache=True, **kwargs):
         """
         :param param:
             如果type是Local，填json所在路径即可；
             如果type是apollo，填写apollo地址需要的参数，具体参考apollo开放平台
             例："appId": "", "clusterName": "", "namespaceName": ""
+        :param use_cache: 是否使用进程级缓存，配置文件变更后可传False强制重新读取
         :param kwargs: 扩展参数，type为apollo时可传递req_name参数，用于区分调用哪个地址，默认是获取发布的namespace配置信息
         :return:
         """
         log = self.log
         log.debug('开始读取项目资源信息')
+        if use_cache and param in ProjectResourceTool._cache:
+            log.debug('使用缓存的本地资源')
+            return copy.deepcopy(ProjectResourceTool._cache[param])
         log.debug('读取本地资源')
         jsonData = JsonTool().loadFont(param)
-        return jsonData
+        with ProjectResourceTool._cache_lock:
+            ProjectResourceTool._cache[param] = jsonData
+        return copy.deepcopy(jsonData)
+
+    @classmethod
+    def clear_cache(cls):
+        with cls._cache_lock:
+            cls._cache.clear()
 
 
 if __name__ == '__main__':
@@ -3,6 +3,7 @@
 # @File : TenCentCloudTool.py
 # @remark :腾讯云工具类
 import hashlib, hmac, json, os, time,sys
+import itertools
 from datetime import datetime
 import orjson
 import base64
@@ -55,6 +56,30 @@ def is_file_object(value):
         # 如果是对象（如自定义类或 UploadFile），检查属性是否存在
         return all(hasattr(value, attr) for attr in ("name", "type", "body"))
 
+
+def iter_parts(chunks, part_size):
+    """将任意大小的字节块重新切分为 part_size 大小的分块（最后一块可能更小）"""
+    buffer = bytearray()
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def iter_base64_decoded(b64_str, chunk_size=4 * 1024 * 1024):
+    """分段解码 base64 字符串，避免一次性生成完整的解码副本"""
+    if ',' in b64_str[:128] and 'base64' in b64_str[:128]:
+        b64_str = b64_str[b64_str.index(',') + 1:]
+    step = max(4, chunk_size - chunk_size % 4)
+    for offset in range(0, len(b64_str), step):
+        yield base64.b64decode(b64_str[offset:offset + step])
+
+
 class TenCentCloudTool:
     jsonTool = JsonTool()
 
@@ -176,7 +201,7 @@ class TenCentCloudTool:
         except TencentCloudSDKException as err:
             raise err
 
-    def buildClient(self, region, secret_id=None, secret_key=None, token=None, domain=None):
+    def buildClient(self, region, secret_id=None, secret_key=None, token=None, domain=None, pool_size=None):
         # -*- coding=utf-8
         # appid 已在配置中移除,请在参数 Bucket 中带上 appid。Bucket 由 BucketName-APPID 组成
         # 1. 设置用户配置, 包括 secretId，secretKey 以及 Region
@@ -184,7 +209,8 @@ class TenCentCloudTool:
         secret_id = secret_id if secret_id else self.SecretId   # 替换为用户的 secretId(登录访问管理控制台获取)
         secret_key = secret_key if secret_key else self.SecretKey  # 替换为用户的 secretKey(登录访问管理控制台获取)
         scheme = 'https'  # 指定使用 http/https 协议来访问 COS，默认为 https，可不填
-        config = CosConfig(Region=region, Secret_id=secret_id, Secret_key=secret_key, Token=token)
+        pool_kwargs = {'PoolConnections': pool_size, 'PoolMaxSize': pool_size} if pool_size else {}
+        config = CosConfig(Region=region, Secret_id=secret_id, Secret_key=secret_key, Token=token, **pool_kwargs)
         # 2. 获取客户端对象
         client = CosS3Client(config)
         self.region = region
@@ -316,6 +342,110 @@ class TenCentCloudTool:
             log.debug(f'失败了{e.get_status_code()}')
             return {"success": False, "data": f"上传文件失败：{e.get_status_code()}"}
 
+    def upload_bytes(self, bucket, body, fileName, content_type=None, part_threshold=8 * 1024 * 1024, part_size=4 * 1024 * 1024):
+        """
+            内存字节上传（不落盘）：
+            bucket: 桶位
+            body: bytes / bytearray / memoryview
+            fileName: 腾讯云 对象key
+            content_type: 对象的 Content-Type
+            part_threshold: 超过该大小时使用分块上传，否则直接 put_object
+            part_size: 分块上传时每块大小（COS 要求除最后一块外不小于1MB）
+        """
+        log = self.log
+        log.debug('正在访问TenCentCloudTool.upload_bytes（内存上传）')
+        client = self.client
+        key = f'/AIImageProcessor/{fileName}'
+        extra = {'ContentType': content_type} if content_type else {}
+        view = memoryview(body)
+        try:
+            if len(view) <= part_threshold:
+                response = client.put_object(
+                    Bucket=bucket,
+                    Body=bytes(view),
+                    Key=key,
+                    **extra
+                )
+            else:
+                log.debug(f'文件大小{len(view)}超过阈值，使用分块上传')
+                response = self._multipart_upload(
+                    bucket,
+                    key,
+                    (view[offset:offset + part_size] for offset in range(0, len(view), part_size)),
+                    **extra
+                )
+            log.debug(response)
+            response = dict(response or {})
+            if 'Location' not in response:
+                response['Location'] = f"https://{bucket}.cos.{self.region}.myqcloud.com/AIImageProcessor/{fileName}"
+            return {"success": True, "data": response}
+        except CosServiceError as e:
+            log.debug(f'失败了{e.get_status_code()}')
+            return {"success": False, "data": f"上传文件失败：{e.get_status_code()}"}
+
+    def upload_stream(self, bucket, chunks, fileName, content_type=None, part_size=4 * 1024 * 1024):
+        """
+            流式上传（不落盘、内存占用约为一个分块）：
+            bucket: 桶位
+            chunks: 可迭代的字节块（大小任意），如下载流 iter_bytes() 或分段解码结果
+            fileName: 腾讯云 对象key
+            content_type: 对象的 Content-Type
+            part_size: 分块大小；总大小不足一个分块时直接 put_object
+        """
+        log = self.log
+        log.debug('正在访问TenCentCloudTool.upload_stream（流式上传）')
+        key = f'/AIImageProcessor/{fileName}'
+        extra = {'ContentType': content_type} if content_type else {}
+        parts = iter_parts(chunks, part_size)
+        try:
+            first = next(parts, b'')
+            second = next(parts, None)
+            if second is None:
+                response = self.client.put_object(
+                    Bucket=bucket,
+                    Body=first,
+                    Key=key,
+                    **extra
+                )
+            else:
+                response = self._multipart_upload(bucket, key, itertools.chain((first, second), parts), **extra)
+            log.debug(response)
+            response = dict(response or {})
+            if 'Location' not in response:
+                response['Location'] = f"https://{bucket}.cos.{self.region}.myqcloud.com/AIImageProcessor/{fileName}"
+            return {"success": True, "data": response}
+        except CosServiceError as e:
+            log.debug(f'失败了{e.get_status_code()}')
+            return {"success": False, "data": f"上传文件失败：{e.get_status_code()}"}
+
+    def _multipart_upload(self, bucket, key, chunks, **extra):
+        """按块上传，chunks 为可迭代的字节块；失败时中止分块上传"""
+        client = self.client
+        upload_id = client.create_multipart_upload(Bucket=bucket, Key=key, **extra)['UploadId']
+        try:
+            parts = []
+            for part_number, chunk in enumerate(chunks, start=1):
+                part = client.upload_part(
+                    Bucket=bucket,
+                    Key=key,
+                    Body=bytes(chunk),
+                    PartNumber=part_number,
+                    UploadId=upload_id
+                )
+                parts.append({'PartNumber': part_number, 'ETag': part['ETag']})
+            return client.complete_multipart_upload(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={'Part': parts}
+            )
+        except Exception:
+            try:
+                client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+            except Exception as e:
+                self.log.error(f'中止分块上传失败：{e}')
+            raise
+
     def delete_obj(self, bucket, key):
         """
             bucket: 桶位
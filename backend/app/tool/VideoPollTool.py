@@ -0,0 +1,146 @@
+# @File : VideoPollTool.py
+# @remark : 视频任务轮询器：单个后台事件循环统一跟踪所有进行中的视频任务，
+#           按退避间隔（先短后长）查询状态，完成后通过回调收尾，不再为每个任务占用一个线程
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from app.tool.LogTool import LogTool
+
+
+class VideoPollTool:
+    # 首次查询前的等待秒数
+    initial_delay = 5
+    # 查询间隔上限
+    max_delay = 60
+    # 每次未完成后间隔放大的倍数
+    backoff_factor = 1.5
+    # 单个任务的最长跟踪时间
+    timeout = 30 * 60
+    # 连续查询失败多少次后放弃
+    max_check_errors = 5
+
+    def __init__(self, max_workers=8, log=LogTool(path=str(Path(__file__))[str(Path(__file__)).find('app'):len(str(Path(__file__)))].replace('.py', '') + '/')):
+        self.log = log
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        # 状态查询与收尾（下载/上传）都是阻塞调用，放到小线程池执行，事件循环只负责计时
+        self._executor = None
+        self._operations = {}  # name -> {'started_at', 'checks', 'next_delay'}
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._executor = self._executor or ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='video-poll')
+                self._thread = threading.Thread(target=loop.run_forever, name='video-poller', daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def _ensure_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='video-poll')
+            return self._executor
+
+    def track(self, name, check, on_done, initial_delay=None, max_delay=None, timeout=None):
+        """
+        跟踪一个视频任务。
+        :param name: 任务标识（用于日志和 in_flight）
+        :param check: 阻塞函数，返回 (是否完成, 载荷)
+        :param on_done: 完成后调用 on_done(载荷)，其返回值作为 Future 的结果
+        :return: concurrent.futures.Future
+        """
+        future = Future()
+        loop = self._ensure_loop()
+        asyncio.run_coroutine_threadsafe(
+            self._poll(name, check, on_done, future, initial_delay, max_delay, timeout),
+            loop,
+        )
+        return future
+
+    async def watch(self, name, check, on_done, initial_delay=None, max_delay=None, timeout=None):
+        """
+        在调用方的事件循环中跟踪视频任务并返回 on_done 的结果。
+        check / on_done 可以是协程函数（直接 await），也可以是阻塞函数（放到线程池执行）。
+        """
+        return await self._watch(name, check, on_done, initial_delay, max_delay, timeout)
+
+    async def _poll(self, name, check, on_done, future, initial_delay, max_delay, timeout):
+        try:
+            future.set_result(await self._watch(name, check, on_done, initial_delay, max_delay, timeout))
+        except Exception as e:
+            future.set_exception(e)
+
+    async def _watch(self, name, check, on_done, initial_delay, max_delay, timeout):
+        delay = self.initial_delay if initial_delay is None else initial_delay
+        max_delay = max_delay or self.max_delay
+        deadline = time.monotonic() + (timeout or self.timeout)
+        check_errors = 0
+        with self._lock:
+            self._operations[name] = {'started_at': time.time(), 'checks': 0, 'next_delay': None}
+        try:
+            while True:
+                self._update(name, next_delay=delay)
+                await asyncio.sleep(delay)
+                try:
+                    done, payload = await self._call(check)
+                    check_errors = 0
+                except Exception as e:
+                    check_errors += 1
+                    self.log.error(f'视频任务状态查询失败（{check_errors}/{self.max_check_errors}）：{name}, {e}')
+                    if check_errors >= self.max_check_errors:
+                        raise
+                    done, payload = False, None
+                self._update(name, checked=True)
+                if done:
+                    break
+                if time.monotonic() + delay > deadline:
+                    raise TimeoutError(f'视频任务超时未完成：{name}')
+                delay = min(max_delay, delay * self.backoff_factor)
+            self.log.debug(f'视频任务完成，开始收尾：{name}')
+            return await self._call(on_done, payload)
+        finally:
+            with self._lock:
+                self._operations.pop(name, None)
+
+    async def _call(self, func, *args):
+        if asyncio.iscoroutinefunction(func):
+            return await func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._ensure_executor(), func, *args)
+
+    def _update(self, name, next_delay=None, checked=False):
+        with self._lock:
+            operation = self._operations.get(name)
+            if operation is None:
+                return
+            if next_delay is not None:
+                operation['next_delay'] = next_delay
+            if checked:
+                operation['checks'] += 1
+
+    @property
+    def in_flight_count(self):
+        return len(self._operations)
+
+    def in_flight(self):
+        """当前跟踪中的任务快照"""
+        with self._lock:
+            return {name: dict(info) for name, info in self._operations.items()}
+
+    def shutdown(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+            executor, self._executor = self._executor, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+video_poller = VideoPollTool()
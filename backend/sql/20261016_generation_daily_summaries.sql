@@ -0,0 +1,35 @@
+-- 按 (授权码, 日期) 汇总的生成统计，写入生成记录时在同一事务中累加
+-- 新库由 Base.metadata.create_all 自动创建；汇总表为空时应用启动会自动回填。
+-- 本脚本用于已有库手动建表并从生成记录重建汇总（会清空已有汇总，建议在低峰期执行）。
+CREATE TABLE IF NOT EXISTS generation_daily_summaries (
+    id SERIAL PRIMARY KEY,
+    auth_code VARCHAR(100) NOT NULL REFERENCES auth_codes(code),
+    day DATE NOT NULL,
+    record_count INTEGER NOT NULL DEFAULT 0,
+    output_count INTEGER NOT NULL DEFAULT 0,
+    credits_used INTEGER NOT NULL DEFAULT 0,
+    image_count INTEGER NOT NULL DEFAULT 0,
+    video_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT now(),
+    updated_at TIMESTAMP DEFAULT now(),
+    CONSTRAINT uq_generation_daily_summaries_auth_code_day UNIQUE (auth_code, day)
+);
+CREATE INDEX IF NOT EXISTS ix_generation_daily_summaries_id ON generation_daily_summaries (id);
+
+BEGIN;
+LOCK TABLE generation_daily_summaries IN EXCLUSIVE MODE;
+DELETE FROM generation_daily_summaries;
+INSERT INTO generation_daily_summaries
+    (auth_code, day, record_count, output_count, credits_used, image_count, video_count)
+SELECT
+    auth_code,
+    date(created_at),
+    count(*),
+    coalesce(sum(output_count), 0),
+    coalesce(sum(credits_used), 0),
+    count(*) FILTER (WHERE media_type IS DISTINCT FROM 'video'),
+    count(*) FILTER (WHERE media_type = 'video')
+FROM generation_records
+WHERE created_at IS NOT NULL
+GROUP BY auth_code, date(created_at);
+COMMIT;
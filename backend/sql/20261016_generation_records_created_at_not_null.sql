@@ -0,0 +1,19 @@
+-- 历史记录按 (created_at, id) 游标翻页：created_at 为空的记录会被游标条件漏掉，改为 NOT NULL。
+-- 缺失的 created_at 取 id 更小的最近一条记录的时间（id 单调递增，近似写入时间），都没有时取 1970-01-01。
+-- 新库由 Base.metadata.create_all 自动创建为 NOT NULL；已有库执行本脚本。
+BEGIN;
+UPDATE generation_records AS g
+SET created_at = COALESCE(
+    (
+        SELECT p.created_at
+        FROM generation_records AS p
+        WHERE p.id < g.id AND p.created_at IS NOT NULL
+        ORDER BY p.id DESC
+        LIMIT 1
+    ),
+    TIMESTAMP '1970-01-01 00:00:00'
+)
+WHERE g.created_at IS NULL;
+ALTER TABLE generation_records ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE generation_records ALTER COLUMN created_at SET DEFAULT now();
+COMMIT;
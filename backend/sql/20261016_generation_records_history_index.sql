@@ -0,0 +1,5 @@
+-- 生成历史分页用的复合索引：按授权码筛选、按 (created_at, id) 倒序翻页
+-- 新库由 Base.metadata.create_all 自动创建；已有库执行本脚本。
+-- CONCURRENTLY 不锁写入，但不能在事务中执行（psql 中直接运行即可）。
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_generation_records_auth_code_created_at_id
+    ON generation_records (auth_code, created_at, id);
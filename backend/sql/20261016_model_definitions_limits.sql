@@ -0,0 +1,5 @@
+-- 模型定义表增加上游调用限额：max_in_flight（并发上限）/ rpm（每分钟请求数）
+-- NULL 时沿用 ai_models_config 中的配置或全局默认值，0 表示不限制；修改后约 MODEL_LIMIT_REFRESH_SECONDS 秒内生效。
+-- 新库由 Base.metadata.create_all 自动创建；已有库执行本脚本。
+ALTER TABLE model_definitions ADD COLUMN IF NOT EXISTS max_in_flight INTEGER;
+ALTER TABLE model_definitions ADD COLUMN IF NOT EXISTS rpm INTEGER;
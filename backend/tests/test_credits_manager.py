@@ -0,0 +1,120 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.credits_manager import (
+    RESERVATION_STATUS_COMMITTED,
+    RESERVATION_STATUS_RELEASED,
+    ReservationKeeper,
+    commit_credits,
+    release_credits,
+    release_expired_reservations,
+    reserve_credits,
+)
+from app.models import AuthCode, CreatorTeam, CreditReservation, GenerationRecord
+
+
+@pytest.fixture
+def user(db):
+    team = CreatorTeam(name="team", credits=5)
+    user = AuthCode(code="code-1", credits=10, team=team)
+    db.add(user)
+    db.commit()
+    return user
+
+
+def balances(db, user):
+    db.expire_all()
+    return user.team.credits, user.credits
+
+
+def test_reserve_takes_team_credits_first(db, user):
+    reservation = reserve_credits(db, user, 8)
+
+    assert balances(db, user) == (0, 7)
+    assert (reservation.team_credits, reservation.personal_credits) == (5, 3)
+
+
+def test_commit_refunds_unused_personal_credits_first(db, user):
+    reservation = reserve_credits(db, user, 8)
+
+    assert commit_credits(db, reservation, credits_used=4)
+
+    assert balances(db, user) == (1, 10)
+    db.refresh(reservation)
+    assert reservation.status == RESERVATION_STATUS_COMMITTED
+    assert (reservation.team_credits, reservation.personal_credits) == (4, 0)
+
+
+def test_release_refunds_everything_once(db, user):
+    reservation = reserve_credits(db, user, 8)
+
+    assert release_credits(db, reservation)
+    assert not release_credits(db, reservation)
+
+    assert balances(db, user) == (5, 10)
+    assert db.query(CreditReservation).one().status == RESERVATION_STATUS_RELEASED
+
+
+def test_commit_after_expiry_charges_again(db, user):
+    reservation = reserve_credits(db, user, 8, ttl_seconds=-1)
+    assert release_expired_reservations(db) == 1
+    assert balances(db, user) == (5, 10)
+
+    assert commit_credits(db, reservation, credits_used=6)
+
+    assert balances(db, user) == (0, 9)
+    db.refresh(reservation)
+    assert reservation.status == RESERVATION_STATUS_COMMITTED
+    assert (reservation.team_credits, reservation.personal_credits) == (5, 1)
+
+
+def test_commit_after_expiry_without_balance_rolls_back(db, user):
+    reservation = reserve_credits(db, user, 8, ttl_seconds=-1)
+    release_expired_reservations(db)
+    user.credits = 0
+    user.team.credits = 0
+    db.commit()
+    db.add(GenerationRecord(auth_code=user.code, prompt_text="p", output_count=1, credits_used=8))
+
+    assert not commit_credits(db, reservation)
+
+    assert balances(db, user) == (0, 0)
+    assert db.query(GenerationRecord).count() == 0
+    db.refresh(reservation)
+    assert reservation.status == RESERVATION_STATUS_RELEASED
+
+
+def test_keeper_extends_running_reservations(db, user):
+    reservation = reserve_credits(db, user, 8, ttl_seconds=60)
+    expires_at = reservation.expires_at
+
+    ReservationKeeper.renew(db, {reservation.id: 3600})
+
+    db.refresh(reservation)
+    assert reservation.expires_at > expires_at + timedelta(minutes=30)
+    assert release_expired_reservations(db) == 0
+
+
+def test_committed_reservation_cannot_be_released(db, user):
+    reservation = reserve_credits(db, user, 8)
+    commit_credits(db, reservation)
+
+    assert not release_credits(db, reservation)
+    assert balances(db, user) == (0, 7)
+
+
+def test_insufficient_credits_leave_balances_untouched(db, user):
+    with pytest.raises(HTTPException) as exc_info:
+        reserve_credits(db, user, 16)
+
+    assert exc_info.value.status_code == 402
+    assert balances(db, user) == (5, 10)
+    assert db.query(CreditReservation).count() == 0
+
+
+def test_zero_cost_reserves_nothing(db, user):
+    assert reserve_credits(db, user, 0) is None
+    assert commit_credits(db, None)
+    assert balances(db, user) == (5, 10)
@@ -0,0 +1,100 @@
+import json
+import time
+
+import pytest
+
+from app.tool.StorageTool import DeferredUploader, LocalStorage, MemoryStorage
+
+
+class RecordingLog:
+    def __init__(self):
+        self.errors = []
+
+    def error(self, message):
+        self.errors.append(message)
+
+    def debug(self, message):
+        pass
+
+
+class FlakyStorage(MemoryStorage):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    def put_stream(self, key, chunks, content_type=None):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            return {'success': False, 'data': 'upstream unavailable'}
+        return super().put_stream(key, chunks, content_type)
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LocalStorage(str(tmp_path / "cache"), "http://testserver/static/cache")
+
+
+def make_uploader(cache, primary, **options):
+    options.setdefault("retry_base_seconds", 0.1)
+    return DeferredUploader(cache, primary, log=RecordingLog(), **options)
+
+
+def test_put_returns_cached_copy_and_uploads_in_background(cache):
+    primary = MemoryStorage()
+    uploader = make_uploader(cache, primary)
+
+    result = uploader.put_bytes("outputs/a.png", b"image", "image/png")
+
+    assert result["data"]["Location"].startswith("http://testserver/static/cache/")
+    wait_until(lambda: not uploader.is_pending("outputs/a.png"))
+    assert primary.get("outputs/a.png") == b"image"
+    assert uploader.stats()["uploaded"] == 1
+
+
+def test_recover_requeues_uploads_left_by_previous_process(cache):
+    # 上次进程写入缓存后退出，上传未完成
+    cache.put_bytes("outputs/left.png", b"left")
+    with open(cache._path("outputs/left.png") + DeferredUploader.pending_suffix, "w", encoding="utf-8") as f:
+        json.dump({"content_type": "image/png"}, f)
+    primary = MemoryStorage()
+    uploader = make_uploader(cache, primary)
+
+    assert uploader.is_pending("outputs/left.png")
+    assert uploader.recover() == 1
+
+    wait_until(lambda: not uploader.is_pending("outputs/left.png"))
+    assert primary.get("outputs/left.png") == b"left"
+    assert uploader.recover() == 0
+
+
+def test_failed_uploads_are_retried(cache):
+    primary = FlakyStorage(failures=1)
+    uploader = make_uploader(cache, primary, retries=3)
+
+    uploader.put_bytes("outputs/retry.png", b"retry")
+
+    wait_until(lambda: not uploader.is_pending("outputs/retry.png"))
+    assert primary.attempts == 2
+    assert uploader.stats()["retried"] == 1
+
+
+def test_exhausted_retries_keep_marker_for_next_start(cache):
+    primary = FlakyStorage(failures=10)
+    uploader = make_uploader(cache, primary, retries=2)
+
+    uploader.put_bytes("outputs/broken.png", b"broken")
+
+    wait_until(lambda: uploader.stats()["failed"] == 1)
+    assert uploader.is_pending("outputs/broken.png")
+    assert uploader.read_cached("outputs/broken.png") == b"broken"
+    assert uploader.log.errors
+    uploader.shutdown()
@@ -0,0 +1,154 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core import generation_batches
+from app.core.credits_manager import RESERVATION_STATUS_COMMITTED, reserve_credits
+from app.core.generation_batches import (
+    BATCH_STATUS_PARTIAL,
+    BATCH_STATUS_QUEUED,
+    BATCH_STATUS_RUNNING,
+    ITEM_STATUS_DONE,
+    ITEM_STATUS_FAILED,
+    ITEM_STATUS_PENDING,
+    ITEM_STATUS_RUNNING,
+    GenerationBatchRunner,
+)
+from app.models import AuthCode, GenerationBatch, GenerationBatchItem
+
+
+@pytest.fixture
+def runner(session_factory, monkeypatch):
+    monkeypatch.setattr(generation_batches, "SessionLocal", session_factory)
+    return GenerationBatchRunner(
+        max_runners=1,
+        item_concurrency=1,
+        flush_size=1,
+        reservation_ttl=600,
+        stale_seconds=60,
+    )
+
+
+def add_running_batch(db, batch_id, heartbeat_at, owner_id="other-worker"):
+    user = db.query(AuthCode).filter(AuthCode.code == "code-1").first()
+    if user is None:
+        user = AuthCode(code="code-1", credits=100)
+        db.add(user)
+        db.commit()
+    reservation = reserve_credits(db, user, 4)
+    batch = GenerationBatch(
+        batch_id=batch_id,
+        auth_code="code-1",
+        status=BATCH_STATUS_RUNNING,
+        total_items=2,
+        owner_id=owner_id,
+        heartbeat_at=heartbeat_at,
+    )
+    batch.items = [
+        GenerationBatchItem(item_index=0, request_payload={}, status=ITEM_STATUS_DONE,
+                            credits_used=2, credit_reservation_id=reservation.id),
+        GenerationBatchItem(item_index=1, request_payload={}, status=ITEM_STATUS_RUNNING,
+                            credit_reservation_id=reservation.id),
+    ]
+    db.add(batch)
+    db.commit()
+    return batch, reservation
+
+
+def test_live_batches_are_not_settled(db, runner):
+    batch, reservation = add_running_batch(db, "live", datetime.utcnow())
+
+    assert runner._settle_stale_batches(db) == 0
+
+    db.refresh(batch)
+    assert batch.status == BATCH_STATUS_RUNNING
+    assert [item.status for item in batch.items] == [ITEM_STATUS_DONE, ITEM_STATUS_RUNNING]
+
+
+def test_stale_batches_are_settled_once(db, runner):
+    batch, reservation = add_running_batch(db, "stale", datetime.utcnow() - timedelta(minutes=5))
+
+    assert runner._settle_stale_batches(db) == 1
+    assert runner._settle_stale_batches(db) == 0
+
+    db.expire_all()
+    assert batch.status == BATCH_STATUS_PARTIAL
+    assert batch.owner_id == runner.owner_id
+    assert [item.status for item in batch.items] == [ITEM_STATUS_DONE, ITEM_STATUS_PENDING]
+    assert reservation.status == RESERVATION_STATUS_COMMITTED
+    # 只结算已完成条目的积分，其余退回
+    assert db.query(AuthCode).filter(AuthCode.code == "code-1").one().credits == 98
+
+
+def test_batches_running_in_this_process_are_not_settled(db, runner):
+    add_running_batch(db, "mine", datetime.utcnow() - timedelta(minutes=5), owner_id=runner.owner_id)
+    runner._running.add("mine")
+
+    assert runner._settle_stale_batches(db) == 0
+
+
+def test_heartbeat_refreshes_own_batches(db, runner):
+    stale_at = datetime.utcnow() - timedelta(minutes=5)
+    batch, _ = add_running_batch(db, "mine", stale_at, owner_id=runner.owner_id)
+    runner._running.add("mine")
+
+    runner._heartbeat(db)
+
+    db.refresh(batch)
+    assert batch.heartbeat_at > stale_at
+
+
+def add_queued_batch(db, batch_id, size):
+    db.add(AuthCode(code="code-1", credits=100))
+    batch = GenerationBatch(batch_id=batch_id, auth_code="code-1", status=BATCH_STATUS_QUEUED, total_items=size)
+    batch.items = [GenerationBatchItem(item_index=index, request_payload={}) for index in range(size)]
+    db.add(batch)
+    db.commit()
+    return batch
+
+
+def test_items_run_with_bounded_concurrency(db, runner):
+    runner.item_concurrency = 2
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0, "calls": 0}
+
+    def handler(session, user, payload):
+        with lock:
+            state["active"] += 1
+            state["calls"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.05)
+        with lock:
+            state["active"] -= 1
+        return {"success": False, "message": "upstream error"}, None
+
+    runner.register_handlers(handler, lambda session, payload: 1)
+    batch = add_queued_batch(db, "bounded", 5)
+
+    runner._run("bounded")
+
+    db.expire_all()
+    assert state["calls"] == 5
+    assert state["peak"] == 2
+    assert [item.status for item in batch.items] == [ITEM_STATUS_FAILED] * 5
+    assert db.query(AuthCode).filter(AuthCode.code == "code-1").one().credits == 100
+
+
+def test_interrupted_run_is_settled_without_raising(db, runner, monkeypatch):
+    runner.register_handlers(lambda session, user, payload: ({"success": False}, None), lambda session, payload: 1)
+    batch = add_queued_batch(db, "interrupted", 2)
+
+    def broken_flush(*args):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(runner, "_flush", broken_flush)
+
+    runner._run("interrupted")
+
+    db.expire_all()
+    assert batch.status == BATCH_STATUS_PARTIAL
+    assert [item.status for item in batch.items] == [ITEM_STATUS_PENDING] * 2
+    assert "interrupted" not in runner._running
+    assert db.query(AuthCode).filter(AuthCode.code == "code-1").one().credits == 100
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.models import AuthCode, GenerationRecord
+from app.routers.generations import get_generation_history
+
+
+@pytest.fixture
+def records(db):
+    db.add(AuthCode(code="code-1", credits=0))
+    db.add(AuthCode(code="code-2", credits=0))
+    base = datetime(2026, 10, 1, 12, 0, 0)
+    # 多条记录共用同一 created_at，翻页需按 id 区分
+    offsets = [0, 0, 1, 1, 1, 2, 24 * 60]
+    for minutes in offsets:
+        db.add(GenerationRecord(
+            auth_code="code-1",
+            prompt_text="p",
+            output_count=1,
+            credits_used=1,
+            created_at=base + timedelta(minutes=minutes),
+        ))
+    db.add(GenerationRecord(auth_code="code-2", prompt_text="p", output_count=1, credits_used=1, created_at=base))
+    db.commit()
+    rows = db.query(GenerationRecord).filter(GenerationRecord.auth_code == "code-1").all()
+    return sorted(rows, key=lambda row: (row.created_at, row.id), reverse=True)
+
+
+def history(db, **params):
+    params.setdefault("limit", 30)
+    params.setdefault("offset", 0)
+    params.setdefault("cursor", None)
+    params.setdefault("include_total", True)
+    params.setdefault("start_date", None)
+    params.setdefault("end_date", None)
+    return get_generation_history("code-1", db=db, **params)
+
+
+def test_cursor_pages_cover_all_records_in_order(db, records):
+    seen = []
+    cursor = None
+    while True:
+        page = history(db, limit=3, cursor=cursor)
+        seen.extend(record["id"] for record in page["records"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            assert not page["has_more"]
+            break
+        assert page["has_more"]
+
+    assert seen == [record.id for record in records]
+
+
+def test_cursor_ignores_offset(db, records):
+    first = history(db, limit=2)
+    second = history(db, limit=2, offset=5, cursor=first["next_cursor"])
+
+    assert [record["id"] for record in second["records"]] == [record.id for record in records[2:4]]
+    assert second["offset"] == 0
+    assert second["next_offset"] is None
+
+
+def test_offset_paging_still_works(db, records):
+    page = history(db, limit=4, offset=4, include_total=False)
+
+    assert [record["id"] for record in page["records"]] == [record.id for record in records[4:]]
+    assert page["total"] is None
+    assert not page["has_more"]
+    assert page["next_cursor"] is None
+
+
+def test_cursor_respects_date_range(db, records):
+    first = history(db, limit=2, start_date="2026-10-01", end_date="2026-10-01")
+    second = history(db, limit=10, cursor=first["next_cursor"], start_date="2026-10-01", end_date="2026-10-01")
+
+    ids = [record["id"] for record in first["records"] + second["records"]]
+    assert ids == [record.id for record in records if record.created_at.date().day == 1]
+    assert first["total"] == 6
+
+
+def test_invalid_cursor_is_rejected(db, records):
+    with pytest.raises(HTTPException) as exc_info:
+        history(db, cursor="not-a-cursor")
+
+    assert exc_info.value.status_code == 400
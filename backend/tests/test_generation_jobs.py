@@ -0,0 +1,138 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core import generation_jobs
+from app.core.generation_jobs import (
+    JOB_STATUS_DONE,
+    JOB_STATUS_FAILED,
+    JOB_STATUS_QUEUED,
+    JOB_STATUS_RUNNING,
+    GenerationJobQueue,
+)
+from app.models import AuthCode, GenerationJob
+
+
+@pytest.fixture
+def make_queue(session_factory, monkeypatch):
+    monkeypatch.setattr(generation_jobs, "SessionLocal", session_factory)
+    queues = []
+
+    def make(handler, max_workers=2, max_pending=10):
+        queue = GenerationJobQueue(max_workers=max_workers, max_pending=max_pending, stale_seconds=60)
+        queue.register_handler(handler)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.shutdown(wait=True)
+
+
+def add_job(db, job_id, status=JOB_STATUS_QUEUED, updated_at=None):
+    if db.query(AuthCode).filter(AuthCode.code == "code-1").first() is None:
+        db.add(AuthCode(code="code-1", credits=0))
+    db.add(GenerationJob(
+        job_id=job_id,
+        auth_code="code-1",
+        status=status,
+        request_payload={"prompt": job_id},
+        updated_at=updated_at or datetime.utcnow(),
+    ))
+    db.commit()
+
+
+def wait_idle(queue, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while queue.pending_count:
+        if time.monotonic() > deadline:
+            raise AssertionError("queue did not drain")
+        time.sleep(0.01)
+
+
+def job_status(db, job_id):
+    db.expire_all()
+    return db.query(GenerationJob).filter(GenerationJob.job_id == job_id).one()
+
+
+def test_enqueued_job_runs_and_stores_result(db, make_queue):
+    queue = make_queue(lambda session, job: ({"success": True, "prompt": job.request_payload["prompt"]}, None))
+    queue.start()
+    add_job(db, "job-1")
+
+    assert queue.enqueue("job-1")
+    wait_idle(queue)
+
+    job = job_status(db, "job-1")
+    assert job.status == JOB_STATUS_DONE
+    assert job.result_payload == {"success": True, "prompt": "job-1"}
+    assert job.started_at is not None and job.finished_at is not None
+
+
+def test_handler_errors_fail_the_job(db, make_queue):
+    def handler(session, job):
+        raise RuntimeError("boom")
+
+    queue = make_queue(handler)
+    queue.start()
+    add_job(db, "job-1")
+
+    queue.enqueue("job-1")
+    wait_idle(queue)
+
+    job = job_status(db, "job-1")
+    assert job.status == JOB_STATUS_FAILED
+    assert "boom" in job.error_message
+
+
+def test_enqueue_rejects_jobs_beyond_max_pending(db, make_queue):
+    release = threading.Event()
+
+    def handler(session, job):
+        release.wait(5)
+        return {"success": True}, None
+
+    queue = make_queue(handler, max_workers=1, max_pending=1)
+    queue.start()
+    add_job(db, "job-1")
+    add_job(db, "job-2")
+
+    assert queue.enqueue("job-1")
+    assert not queue.has_capacity()
+    assert not queue.enqueue("job-2")
+
+    release.set()
+    wait_idle(queue)
+    assert queue.has_capacity()
+
+
+def test_enqueue_fails_before_start(make_queue):
+    queue = make_queue(lambda session, job: ({"success": True}, None))
+
+    assert not queue.enqueue("job-1")
+    assert queue.pending_count == 0
+
+
+def test_job_is_claimed_only_once(db, make_queue):
+    queue = make_queue(lambda session, job: ({"success": True}, None))
+    add_job(db, "job-1")
+
+    assert queue._claim(db, "job-1")
+    assert not queue._claim(db, "job-1")
+    assert job_status(db, "job-1").status == JOB_STATUS_RUNNING
+
+
+def test_recover_requeues_queued_and_fails_stale_running_jobs(db, make_queue):
+    queue = make_queue(lambda session, job: ({"success": True}, None))
+    add_job(db, "queued")
+    add_job(db, "stale", JOB_STATUS_RUNNING, datetime.utcnow() - timedelta(minutes=5))
+    add_job(db, "live", JOB_STATUS_RUNNING, datetime.utcnow())
+
+    queue.start()
+    wait_idle(queue)
+
+    assert job_status(db, "queued").status == JOB_STATUS_DONE
+    assert job_status(db, "stale").status == JOB_STATUS_FAILED
+    assert job_status(db, "live").status == JOB_STATUS_RUNNING
@@ -0,0 +1,146 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.executors import NamedExecutor
+from app.core import idempotency
+from app.core.idempotency import IdempotencyStore
+from app.models import IdempotencyRecord
+
+
+@pytest.fixture
+def store(monkeypatch, session_factory):
+    monkeypatch.setattr(idempotency, "SessionLocal", session_factory)
+    return IdempotencyStore(ttl_seconds=60, wait_seconds=5, lease_seconds=30)
+
+
+@pytest.fixture
+def executor():
+    executor = NamedExecutor("test-idempotency", 2)
+    yield executor
+    executor.shutdown()
+
+
+class Counter:
+    def __init__(self, result=None, delay=0.0):
+        self.calls = 0
+        self.result = result or {"success": True, "data": "ok"}
+        self.delay = delay
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return dict(self.result, call=self.calls)
+
+
+def test_duplicate_requests_run_once(store, executor):
+    func = Counter(delay=0.2)
+
+    async def main():
+        return await asyncio.gather(*(
+            store.run("code", "images.generate", "key-1", {"prompt": "a"}, func, executor)
+            for _ in range(5)
+        ))
+
+    results = asyncio.run(main())
+
+    assert func.calls == 1
+    assert executor.stats()["submitted"] == 1
+    assert all(result == results[0] for result in results)
+
+
+def test_completed_result_is_replayed(store, executor, db):
+    func = Counter()
+
+    first = asyncio.run(store.run("code", "images.generate", "key-1", {"prompt": "a"}, func, executor))
+    second = asyncio.run(store.run("code", "images.generate", "key-1", {"prompt": "a"}, func, executor))
+
+    assert first == second
+    assert func.calls == 1
+    assert db.query(IdempotencyRecord).one().status == "completed"
+
+
+def test_same_key_with_different_body_is_rejected(store, executor, db):
+    func = Counter()
+    asyncio.run(store.run("code", "images.generate", "key-1", {"prompt": "a"}, func, executor))
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(store.run("code", "images.generate", "key-1", {"prompt": "b"}, func, executor))
+
+    assert exc_info.value.status_code == 422
+    assert func.calls == 1
+
+
+def test_concurrent_different_body_is_rejected(store, executor):
+    func = Counter(delay=0.2)
+
+    async def main():
+        return await asyncio.gather(
+            store.run("code", "images.generate", "key-1", {"prompt": "a"}, func, executor),
+            store.run("code", "images.generate", "key-1", {"prompt": "b"}, func, executor),
+            return_exceptions=True,
+        )
+
+    leader, follower = asyncio.run(main())
+
+    assert leader["success"]
+    assert isinstance(follower, HTTPException) and follower.status_code == 422
+    assert func.calls == 1
+
+
+def test_failed_result_is_not_stored(store, executor, db):
+    func = Counter(result={"success": False, "message": "upstream error"})
+
+    asyncio.run(store.run("code", "images.generate", "key-1", {"prompt": "a"}, func, executor))
+    asyncio.run(store.run("code", "images.generate", "key-1", {"prompt": "a"}, func, executor))
+
+    assert func.calls == 2
+    assert db.query(IdempotencyRecord).count() == 0
+
+
+def test_keys_are_scoped_per_auth_code(store, executor, db):
+    func = Counter()
+
+    asyncio.run(store.run("code-a", "images.generate", "key-1", {"prompt": "a"}, func, executor))
+    asyncio.run(store.run("code-b", "images.generate", "key-1", {"prompt": "b"}, func, executor))
+
+    assert func.calls == 2
+
+
+def test_waits_for_record_held_by_other_process(store, executor, db, monkeypatch):
+    monkeypatch.setattr(idempotency, "_DB_POLL_INTERVAL_SECONDS", 0.05)
+    func = Counter()
+    db.add(IdempotencyRecord(
+        auth_code="code",
+        endpoint="images.generate",
+        idempotency_key="key-1",
+        request_hash=idempotency.hash_request({"prompt": "a"}),
+        status="in_progress",
+        expires_at=datetime.utcnow() + timedelta(seconds=30),
+    ))
+    db.commit()
+
+    async def main():
+        task = asyncio.ensure_future(
+            store.run("code", "images.generate", "key-1", {"prompt": "a"}, func, executor)
+        )
+        await asyncio.sleep(0.2)
+        assert not task.done()
+        # 模拟其他进程执行完成
+        await executor.run(store._finish, ("code", "images.generate", "key-1"), {"success": True, "data": "other"})
+        return await task
+
+    result = asyncio.run(main())
+
+    assert result == {"success": True, "data": "other"}
+    assert func.calls == 0
+
+
+def test_invalid_key_is_rejected(store, executor):
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(store.run("code", "images.generate", "x" * 200, {}, Counter(), executor))
+
+    assert exc_info.value.status_code == 400
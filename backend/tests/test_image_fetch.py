@@ -0,0 +1,45 @@
+import threading
+
+from app.tool.ImageFetchTool import ImageFetchTool
+
+
+def make_fetcher(failing=()):
+    fetcher = ImageFetchTool()
+    seen = []
+
+    def resolver(url):
+        seen.append(threading.current_thread().name)
+        if url in failing:
+            raise ValueError(url)
+        return url.encode("utf-8")
+
+    fetcher.register_resolver(resolver)
+    return fetcher, seen
+
+
+def test_fetch_many_keeps_order_and_deduplicates():
+    fetcher, seen = make_fetcher(failing={"http://img/bad.png"})
+
+    results = fetcher.fetch_many(["http://img/a.png", "http://img/bad.png", "http://img/a.png", "http://img/b.png"])
+
+    assert results[0] == (b"http://img/a.png", "image/png")
+    assert isinstance(results[1], ValueError)
+    assert results[2] == results[0]
+    assert results[3] == (b"http://img/b.png", "image/png")
+    assert len(seen) == 3
+    fetcher.shutdown()
+
+
+def test_fetch_many_reuses_shared_pool():
+    fetcher, seen = make_fetcher()
+
+    fetcher.fetch_many(["http://img/a.png", "http://img/b.png"])
+    pool = fetcher._pool
+    fetcher.fetch_many(["http://img/c.png", "http://img/d.png"])
+
+    assert pool is not None and fetcher._pool is pool
+    assert all(name.startswith("image-fetch") for name in seen)
+
+    fetcher.configure(max_workers=fetcher.max_workers + 1)
+    assert fetcher._pool is None
+    fetcher.shutdown()
@@ -0,0 +1,108 @@
+import asyncio
+import io
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.api import media
+from app.core import media_cache
+from app.core.media_cache import MediaResizeCache
+from app.tool.StorageTool import MemoryStorage
+
+
+def make_png(width=64, height=48):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def source(monkeypatch):
+    backend = MemoryStorage()
+    backend.put_bytes("outputs/a.png", make_png(), "image/png")
+    monkeypatch.setattr(media_cache, "storage", backend)
+    return backend
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MediaResizeCache(str(tmp_path / "media"), max_bytes=1024 * 1024, quality=80, allowed_sizes=[32, 64, 128])
+
+
+def test_sizes_are_rounded_up_to_allowed_sizes(cache):
+    assert cache.snap_size(None) is None
+    assert cache.snap_size(1) == 32
+    assert cache.snap_size(33) == 64
+    assert cache.snap_size(128) == 128
+    with pytest.raises(ValueError):
+        cache.snap_size(129)
+
+
+def test_cancelled_leader_does_not_fail_waiters(cache, source, monkeypatch):
+    renders = []
+    original_get = source.get
+
+    def slow_get(key):
+        renders.append(key)
+        time.sleep(0.2)
+        return original_get(key)
+
+    monkeypatch.setattr(source, "get", slow_get)
+
+    async def main():
+        leader = asyncio.ensure_future(cache.get("outputs/a.png", 32, None, "webp"))
+        await asyncio.sleep(0.05)
+        follower = asyncio.ensure_future(cache.get("outputs/a.png", 32, None, "webp"))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        return await follower
+
+    data, content_type, etag = asyncio.run(main())
+
+    assert content_type == "image/webp"
+    assert Image.open(io.BytesIO(data)).width == 32
+    assert len(renders) == 1
+    assert cache._inflight == {}
+
+
+@pytest.fixture
+def client(cache, source, monkeypatch):
+    monkeypatch.setattr(media, "media_resize_cache", cache)
+    app = FastAPI()
+    app.include_router(media.router, prefix="/api/media")
+    return TestClient(app)
+
+
+def test_response_has_strong_etag_and_revalidates_with_304(client):
+    first = client.get("/api/media/outputs/a.png", params={"w": 20})
+
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "image/webp"
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+
+    # 20 与 30 都取整到 32，命中同一个变体
+    second = client.get("/api/media/outputs/a.png", params={"w": 30}, headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+
+    weak = client.get("/api/media/outputs/a.png", params={"w": 20}, headers={"If-None-Match": f"W/{etag}"})
+    assert weak.status_code == 304
+
+
+def test_changed_variant_does_not_match_etag(client):
+    etag = client.get("/api/media/outputs/a.png", params={"w": 20}).headers["etag"]
+
+    response = client.get("/api/media/outputs/a.png", params={"w": 64}, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_invalid_requests_are_rejected(client):
+    assert client.get("/api/media/outputs/a.png", params={"w": 1000}).status_code == 400
+    assert client.get("/api/media/outputs/missing.png").status_code == 404
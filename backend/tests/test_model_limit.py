@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core.model_limits import load_model_limits
+from app.models import ModelDefinition
+from app.tool.ModelLimitTool import ModelLimiter, ModelLimitTimeout, ModelLimitTool
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+def test_waiters_are_granted_round_robin_across_tenants():
+    limiter = ModelLimiter("model", max_in_flight=1, rpm=0)
+    limiter.acquire("holder")
+    granted = []
+    threads = []
+
+    for name, tenant in (("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b")):
+        expected = limiter.waiting + 1
+
+        def run(name=name, tenant=tenant):
+            limiter.acquire(tenant, timeout=5)
+            granted.append(name)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: limiter.waiting == expected)
+
+    for count in range(1, 5):
+        limiter.release()
+        wait_until(lambda: len(granted) == count)
+
+    for thread in threads:
+        thread.join()
+    assert granted == ["a1", "b1", "a2", "a3"]
+    assert limiter.in_flight == 1
+
+
+def test_acquire_times_out_and_leaves_the_queue():
+    limiter = ModelLimiter("model", max_in_flight=1, rpm=0)
+    limiter.acquire("a")
+
+    started = time.monotonic()
+    with pytest.raises(ModelLimitTimeout):
+        limiter.acquire("b", timeout=0.1)
+
+    assert time.monotonic() - started < 1
+    assert limiter.waiting == 0
+    limiter.release()
+    assert limiter.in_flight == 0
+
+
+def test_async_acquire_times_out_and_leaves_the_queue():
+    limiter = ModelLimiter("model", max_in_flight=1, rpm=0)
+    limiter.acquire("a")
+
+    with pytest.raises(ModelLimitTimeout):
+        asyncio.run(limiter.acquire_async("b", timeout=0.1))
+
+    assert limiter.waiting == 0
+    assert limiter.in_flight == 1
+
+
+def test_rpm_limits_burst():
+    limiter = ModelLimiter("model", max_in_flight=0, rpm=2)
+    limiter.acquire("a", timeout=0.1)
+    limiter.acquire("a", timeout=0.1)
+
+    with pytest.raises(ModelLimitTimeout):
+        limiter.acquire("a", timeout=0.1)
+
+
+def test_models_without_limits_are_not_capped():
+    tool = ModelLimitTool()
+
+    limiter = tool.get("unconfigured")
+    for _ in range(50):
+        limiter.acquire("a", timeout=0.1)
+
+    assert limiter.in_flight == 50
+
+
+def test_configured_max_in_flight_is_applied():
+    tool = ModelLimitTool()
+
+    limiter = tool.get("limited", max_in_flight=2)
+    limiter.acquire("a", timeout=0.1)
+    limiter.acquire("a", timeout=0.1)
+    with pytest.raises(ModelLimitTimeout):
+        limiter.acquire("a", timeout=0.1)
+
+
+def test_model_definition_limits_override_config():
+    tool = ModelLimitTool()
+    tool.set_overrides({"model-a": (2, None)})
+
+    limiter = tool.get("model-a", max_in_flight=5, rpm=30)
+
+    assert (limiter.max_in_flight, limiter.rpm) == (2, 30)
+    assert tool.get("model-b", max_in_flight=5).max_in_flight == 5
+
+
+def test_changed_overrides_rebuild_limiter():
+    tool = ModelLimitTool()
+    tool.set_overrides({"model-a": (2, None)})
+    first = tool.get("model-a")
+
+    tool.set_overrides({"model-a": (2, None)})
+    assert tool.get("model-a") is first
+
+    tool.set_overrides({"model-a": (4, 60)})
+    second = tool.get("model-a")
+    assert second is not first
+    assert (second.max_in_flight, second.rpm) == (4, 60)
+
+    tool.set_overrides({})
+    assert tool.get("model-a", max_in_flight=1).max_in_flight == 1
+
+
+def test_load_model_limits_reads_configured_rows(db):
+    db.add_all([
+        ModelDefinition(name="limited", max_in_flight=3, rpm=None),
+        ModelDefinition(name="rate-only", rpm=20),
+        ModelDefinition(name="unconfigured"),
+    ])
+    db.commit()
+
+    assert load_model_limits(db) == {"limited": (3, None), "rate-only": (None, 20)}
@@ -0,0 +1,81 @@
+import pytest
+
+from app.core.executors import storage_executor
+from app.tool.StorageTool import LocalStorage, MemoryStorage, StorageBackend, normalize_key
+
+
+@pytest.fixture(params=["local", "memory"])
+def backend(request, tmp_path):
+    if request.param == "local":
+        return LocalStorage(str(tmp_path / "storage"), "http://testserver/static/storage")
+    return MemoryStorage()
+
+
+def test_put_get_delete_round_trip(backend):
+    result = backend.put_bytes("outputs/a/b.png", b"image", "image/png")
+
+    assert result["success"]
+    assert result["data"]["Key"] == "outputs/a/b.png"
+    assert backend.get("outputs/a/b.png") == b"image"
+
+    assert backend.delete("outputs/a/b.png")["success"]
+    with pytest.raises(FileNotFoundError):
+        backend.get("outputs/a/b.png")
+
+
+def test_put_stream_joins_chunks(backend):
+    backend.put_stream("outputs/stream.bin", iter([b"ab", b"", b"cd"]))
+
+    assert backend.get("outputs/stream.bin") == b"abcd"
+
+
+def test_list_objects_filters_by_prefix(backend):
+    backend.put_bytes("outputs/2026/a.png", b"1")
+    backend.put_bytes("outputs/2026/b.png", b"22")
+    backend.put_bytes("uploads/c.png", b"333")
+
+    listed = sorted((key, size) for key, size, _ in backend.list_objects("outputs/"))
+
+    assert listed == [("outputs/2026/a.png", 1), ("outputs/2026/b.png", 2)]
+    assert backend.delete_many(["outputs/2026/a.png", "outputs/2026/b.png"]) == 2
+    assert [key for key, _, _ in backend.list_objects("outputs/")] == []
+
+
+def test_url_and_key_round_trip(backend):
+    url = backend.url_for("outputs/中文 名.png")
+
+    assert backend.key_for_url(url) == "outputs/中文 名.png"
+    assert backend.key_for_url("https://elsewhere.example.com/outputs/a.png") is None
+
+
+def test_put_many_keeps_input_order(backend):
+    items = [(f"outputs/{index}.png", bytes([index]), "image/png") for index in range(5)]
+
+    results = backend.put_many(items)
+
+    assert [result["data"]["Key"] for result in results] == [key for key, _, _ in items]
+    assert all(backend.get(key) == body for key, body, _ in items)
+
+
+def test_put_many_runs_inline_on_storage_worker(backend):
+    items = [(f"outputs/{index}.png", b"x", None) for index in range(3)]
+
+    results = storage_executor.call(backend.put_many, items)
+
+    assert len(results) == 3
+    assert storage_executor.in_worker() is False
+
+
+@pytest.mark.parametrize("key", ["", "/", "../etc/passwd", "a/../b", "a//b"])
+def test_invalid_keys_are_rejected(key):
+    with pytest.raises(ValueError):
+        normalize_key(key)
+
+
+def test_backend_must_implement_abstract_methods():
+    class Incomplete(StorageBackend):
+        def put_bytes(self, key, body, content_type=None):
+            return {}
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,100 @@
+import os
+import time
+
+import pytest
+
+from app.core import storage_gc
+from app.core.storage_gc import STALE_TMP_SECONDS, StorageGarbageCollector, is_pending_upload
+from app.tool.StorageTool import MemoryStorage
+
+DAY = 24 * 3600
+
+
+def write_file(path, age_seconds, size=10):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    modified = time.time() - age_seconds
+    os.utime(path, (modified, modified))
+    return path
+
+
+@pytest.fixture
+def collector():
+    return StorageGarbageCollector(interval_seconds=60, batch_size=2)
+
+
+def test_local_dir_keeps_recent_files_and_removes_old_ones(collector, tmp_path):
+    root = tmp_path / "uploads_tmp"
+    old = write_file(str(root / "a" / "old.png"), 2 * DAY, size=7)
+    recent = write_file(str(root / "recent.png"), 60)
+    collector.add_local_dir("upload-temp", str(root), DAY)
+
+    result = collector.run_once()
+
+    assert result == {"upload-temp": {"deleted_files": 1, "reclaimed_bytes": 7}}
+    assert not os.path.exists(old)
+    assert not os.path.exists(os.path.dirname(old))  # 已清空的子目录一并删除
+    assert os.path.exists(recent)
+    assert os.path.isdir(root)
+
+
+def test_stale_tmp_files_use_shorter_age(collector, tmp_path):
+    root = tmp_path / "cache"
+    stale_tmp = write_file(str(root / "half.png.tmp"), STALE_TMP_SECONDS + 60)
+    fresh_tmp = write_file(str(root / "writing.png.tmp"), 60)
+    regular = write_file(str(root / "done.png"), STALE_TMP_SECONDS + 60)
+    collector.add_local_dir("output-cache", str(root), DAY)
+
+    collector.run_once()
+
+    assert not os.path.exists(stale_tmp)
+    assert os.path.exists(fresh_tmp)
+    assert os.path.exists(regular)
+
+
+def test_pending_uploads_are_kept(collector, tmp_path):
+    root = tmp_path / "outputs"
+    pending = write_file(str(root / "pending.png"), 2 * DAY)
+    marker = write_file(pending + ".pending", 2 * DAY)
+    uploaded = write_file(str(root / "uploaded.png"), 2 * DAY)
+    collector.add_local_dir("output-cache", str(root), DAY, keep=is_pending_upload)
+
+    collector.run_once()
+
+    assert os.path.exists(pending)
+    assert os.path.exists(marker)
+    assert not os.path.exists(uploaded)
+
+
+def test_storage_prefix_deletes_old_objects_in_batches(collector, monkeypatch):
+    backend = MemoryStorage()
+    monkeypatch.setattr(storage_gc, "storage", backend)
+    for index in range(3):
+        backend.put_bytes(f"temp/old-{index}.png", b"12345")
+    backend.put_bytes("temp/new.png", b"1")
+    backend.put_bytes("outputs/old.png", b"1")
+    aged = time.time() - 2 * DAY
+    for key in ("temp/old-0.png", "temp/old-1.png", "temp/old-2.png", "outputs/old.png"):
+        body, content_type, _ = backend._objects[key]
+        backend._objects[key] = (body, content_type, aged)
+    collector.add_storage_prefix("storage:temp/", "temp/", DAY)
+
+    result = collector.run_once()
+
+    assert result["storage:temp/"] == {"deleted_files": 3, "reclaimed_bytes": 15}
+    assert sorted(key for key, _, _ in backend.list_objects("")) == ["outputs/old.png", "temp/new.png"]
+
+
+def test_target_errors_are_recorded(collector, monkeypatch):
+    def broken(prefix):
+        raise RuntimeError("listing failed")
+
+    backend = MemoryStorage()
+    backend.list_objects = broken
+    monkeypatch.setattr(storage_gc, "storage", backend)
+    collector.add_storage_prefix("storage:temp/", "temp/", DAY)
+
+    collector.run_once()
+
+    assert collector.stats()["targets"]["storage:temp/"]["last_error"] == "listing failed"
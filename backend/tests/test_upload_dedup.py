@@ -0,0 +1,56 @@
+import hashlib
+import io
+
+import pytest
+
+from app.core.upload_dedup import (
+    UploadTooLargeError,
+    find_stored_object,
+    hash_fileobj,
+    remember_stored_object,
+)
+from app.models import StoredObject
+
+
+def test_hash_fileobj_reads_in_chunks_and_rewinds():
+    data = b"x" * 10 + b"y" * 7
+    fileobj = io.BytesIO(data)
+    fileobj.seek(5)
+
+    sha256, size = hash_fileobj(fileobj, max_bytes=100, chunk_size=4)
+
+    assert sha256 == hashlib.sha256(data).hexdigest()
+    assert size == len(data)
+    assert fileobj.tell() == 0
+
+
+def test_hash_fileobj_rejects_oversized_upload():
+    with pytest.raises(UploadTooLargeError):
+        hash_fileobj(io.BytesIO(b"x" * 11), max_bytes=10, chunk_size=4)
+
+
+def test_lookup_is_scoped_per_auth_code(db):
+    remember_stored_object(db, "code-a", "abc", "uploads/a.png", 3, "image/png")
+
+    assert find_stored_object(db, "code-b", "abc") is None
+    stored = find_stored_object(db, "code-a", "abc")
+    assert stored.storage_key == "uploads/a.png"
+
+    db.expire_all()
+    assert db.query(StoredObject).one().hit_count == 1
+
+
+def test_same_content_for_different_auth_codes_is_stored_separately(db):
+    assert remember_stored_object(db, "code-a", "abc", "uploads/a.png", 3) == "uploads/a.png"
+    assert remember_stored_object(db, "code-b", "abc", "uploads/b.png", 3) == "uploads/b.png"
+
+    assert db.query(StoredObject).count() == 2
+
+
+def test_concurrent_remember_keeps_first_key(db):
+    remember_stored_object(db, "code-a", "abc", "uploads/first.png", 3)
+
+    key = remember_stored_object(db, "code-a", "abc", "uploads/second.png", 3)
+
+    assert key == "uploads/first.png"
+    assert db.query(StoredObject).count() == 1